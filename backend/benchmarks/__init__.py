@@ -0,0 +1,14 @@
+"""
+End-to-end performance benchmarks.
+
+    python manage.py bench --entries 20000 --output bench.json
+    python manage.py bench --compare bench.json --max-regression 20
+
+`bench` builds a synthetic institution (factory.build_institution) in a
+throwaway test database, runs the scenarios in benchmarks.scenarios through
+the full request stack and records latency percentiles, throughput and query
+counts for each. Results are written as JSON together with the commit they
+were measured at, so two runs can be compared and a slowdown fails the
+command. PDF downloads are served by a local fake S3 server
+(fake_storage.FakeS3Server) so no network is involved.
+"""
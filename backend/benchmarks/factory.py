@@ -0,0 +1,112 @@
+"""
+Synthetic institutions for the benchmarks.
+
+Each department gets its own faculty, rooms and subjects and a week of
+one-hour classes, Monday to Saturday, PERIODS_PER_DAY a day. Within a period
+every class uses a different room, faculty member and section, so the
+generated timetable is free of clashes and SlotOccupancy accepts all of it.
+Sunday is left empty for the scenarios to book.
+"""
+import random
+from datetime import time
+
+from meta.models import Department
+from timetable.models import Faculty, Room, Subject, TimetableEntry
+
+DAYS = range(6)
+FIRST_HOUR = 8
+PERIODS_PER_DAY = 10
+FREE_DAY = 6
+
+
+class Institution:
+    def __init__(self, departments, year):
+        self.departments = departments
+        self.year = year
+
+    @property
+    def entry_count(self):
+        return sum(len(d.entries) for d in self.departments)
+
+
+class DepartmentData:
+    def __init__(self, department, faculty, rooms, subjects, entries):
+        self.department = department
+        self.faculty = faculty
+        self.rooms = rooms
+        self.subjects = subjects
+        self.entries = entries
+
+
+def periods():
+    return [(day, FIRST_HOUR + hour) for day in DAYS for hour in range(PERIODS_PER_DAY)]
+
+
+def capacity(faculty, rooms):
+    """How many clash-free entries a department of this size can hold."""
+    return len(periods()) * min(faculty, rooms)
+
+
+def build_institution(departments=4, faculty=100, rooms=100, subjects=120, entries=20000,
+                      year=2026, seed=0, batch_size=2000):
+    """
+    Create `departments` departments sharing `entries` timetable entries
+    between them. Raises ValueError if the departments are too small to hold
+    that many entries without clashes.
+    """
+    per_department = -(-entries // departments) if departments else 0
+    if per_department > capacity(faculty, rooms):
+        raise ValueError(
+            f'{per_department} entries per department need at least '
+            f'{-(-per_department // len(periods()))} faculty and rooms each.'
+        )
+    rng = random.Random(seed)
+    built = []
+    remaining = entries
+    for n in range(departments):
+        count = min(per_department, remaining)
+        remaining -= count
+        built.append(_build_department(n, faculty, rooms, subjects, count, year, rng, batch_size))
+    return Institution(built, year)
+
+
+def _build_department(n, faculty, rooms, subjects, count, year, rng, batch_size):
+    code = f'B{n:02d}'
+    department = Department.objects.create(name=f'Benchmark {n}', code=code)
+    people = Faculty.objects.bulk_create([
+        Faculty(department=department, name=f'Faculty {i}', email=f'{code.lower()}-{i}@bench.example',
+                designation='Professor')
+        for i in range(faculty)
+    ], batch_size=batch_size)
+    halls = Room.objects.bulk_create([
+        Room(department=department, name=f'R{i}', capacity=rng.choice((30, 60, 120)),
+             type='Lab' if i % 5 == 0 else 'Lecture')
+        for i in range(rooms)
+    ], batch_size=batch_size)
+    courses = Subject.objects.bulk_create([
+        Subject(department=department, name=f'Subject {i}', code=f'{code}{i:04d}', credits=rng.randint(1, 4))
+        for i in range(subjects)
+    ], batch_size=batch_size)
+
+    slots = periods()
+    rows = []
+    for i in range(count):
+        p = i % len(slots)
+        day, hour = slots[p]
+        # k is unique within a period, so is every resource derived from it.
+        k = i // len(slots)
+        rows.append(TimetableEntry(
+            department=department,
+            day_of_week=day,
+            start_time=time(hour),
+            end_time=time(hour + 1),
+            room=halls[k],
+            faculty=people[(k + p) % faculty],
+            subject=rng.choice(courses),
+            semester=1 + k % 8,
+            section=f'S{k // 8}',
+            academic_year=year,
+        ))
+    TimetableEntry.objects.bulk_create(rows, batch_size=batch_size)
+    return DepartmentData(department, people, halls, courses, rows)
+
@@ -0,0 +1,108 @@
+"""
+A small S3-compatible server for the download benchmarks.
+
+Serves path-style GET/HEAD/PUT/DELETE of /<bucket>/<key> from memory on a
+background thread, with an optional fixed delay per request to stand in for
+network latency. Request signatures are not checked; S3Storage pointed at it
+through AWS_S3_ENDPOINT_URL behaves as it would against a real bucket.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _key(self):
+        return unquote(urlsplit(self.path).path).lstrip('/')
+
+    def _wait(self):
+        self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _not_found(self):
+        body = b'<?xml version="1.0"?><Error><Code>NoSuchKey</Code></Error>'
+        self.send_response(404)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._wait()
+        body = self.server.objects.get(self._key())
+        if body is None:
+            return self._not_found()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        self._wait()
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.objects[self._key()] = self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_DELETE(self):
+        self._wait()
+        self.server.objects.pop(self._key(), None)
+        self.send_response(204)
+        self.end_headers()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections from concurrent benchmarks.
+    request_queue_size = 256
+
+
+class FakeS3Server:
+    """
+    Run as a context manager:
+
+        with FakeS3Server(latency=0.05) as server:
+            server.put('bucket', 'key.pdf', data)
+            ... AWS_S3_ENDPOINT_URL=server.url ...
+    """
+
+    def __init__(self, latency=0.0, host='127.0.0.1'):
+        self.httpd = _Server((host, 0), _Handler)
+        self.httpd.objects = {}
+        self.httpd.latency = latency
+        self.httpd.requests = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def put(self, bucket, key, data):
+        self.httpd.objects[f'{bucket}/{key}'] = data
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -0,0 +1,116 @@
+"""
+Timing, query counting and result comparison for the benchmarks.
+"""
+import statistics
+import time
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class _AllQueries:
+    """CaptureQueriesContext over every configured database at once."""
+
+    def __init__(self):
+        self.contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+
+    def __enter__(self):
+        for context in self.contexts:
+            context.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        for context in self.contexts:
+            context.__exit__(*exc)
+
+    def __len__(self):
+        return sum(len(context) for context in self.contexts)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(name, run, iterations, warmup=1, setup=None, items=1):
+    """
+    Call run(i) `iterations` times after `warmup` untimed calls and return
+    the summary dict for `name`. setup(i), if given, runs untimed before
+    each call. `items` is how many operations one call performs (rows
+    imported, say), for the throughput figure.
+    """
+    for i in range(warmup):
+        if setup:
+            setup(i)
+        run(i)
+
+    latencies, queries = [], []
+    for i in range(warmup, warmup + iterations):
+        if setup:
+            setup(i)
+        with _AllQueries() as captured:
+            started = time.perf_counter()
+            run(i)
+            elapsed = time.perf_counter() - started
+        latencies.append(elapsed)
+        queries.append(len(captured))
+
+    total = sum(latencies)
+    ordered = sorted(latencies)
+    return {
+        'name': name,
+        'iterations': iterations,
+        'items_per_call': items,
+        'total_s': round(total, 6),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'throughput_per_s': round(iterations * items / total, 2) if total else None,
+        'queries_mean': round(statistics.fmean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def expect(resp, *codes):
+    """Fail the scenario on an unexpected status, after draining a streamed body."""
+    if resp.streaming:
+        for _ in resp.streaming_content:
+            pass
+    if resp.status_code not in codes:
+        body = b'' if resp.streaming else resp.content[:300]
+        raise BenchmarkError(f'{resp.status_code} (expected {codes}): {body!r}')
+    return resp
+
+
+def compare(previous, current, max_regression):
+    """
+    (lines, regressed): a p50 and query-count comparison of two result
+    documents, and whether any scenario's p50 grew by more than
+    `max_regression` percent or its query count grew at all.
+    """
+    before = {r['name']: r for r in previous.get('results', [])}
+    lines, regressed = [], False
+    for result in current['results']:
+        old = before.get(result['name'])
+        if not old:
+            lines.append(f"{result['name']:<28} new")
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+        flag = ''
+        if max_regression is not None and change > max_regression:
+            flag, regressed = '  REGRESSION', True
+        if max_regression is not None and result['queries_max'] > old['queries_max']:
+            flag, regressed = flag or '  MORE QUERIES', True
+        lines.append(
+            f"{result['name']:<28} p50 {old['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms "
+            f"({change:+.1f}%), queries {old['queries_max']} -> {result['queries_max']}{flag}"
+        )
+    return lines, regressed
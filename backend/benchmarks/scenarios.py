@@ -0,0 +1,276 @@
+"""
+Benchmark scenarios.
+
+Each scenario takes a Bench and returns a list of harness.measure() results.
+Requests go through the test client, so middleware, authentication,
+routing, the response cache and rendering are all part of the timings.
+"""
+import asyncio
+import os
+import tempfile
+import time
+from datetime import time as clock
+
+import jwt
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from rest_framework.test import APIClient
+
+from core import authentication
+from documents import pdf_cache, storage
+from documents.async_views import AsyncDownloadPDFView
+from documents.models import ReferencePDF
+from documents.views import DownloadPDFView
+from timetable import response_cache
+
+from .factory import FIRST_HOUR, FREE_DAY
+from .fake_storage import FakeS3Server
+from .harness import BenchmarkError, expect, measure
+
+ENTRIES = '/api/v1/entries/'
+BUCKET = 'bench-bucket'
+
+
+class BenchUser:
+    """What ClerkAuthentication attaches to a request, without the database."""
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+    pk = id = 0
+    username = 'bench'
+
+    def __init__(self, department_id):
+        self.department_id = department_id
+
+
+class Bench:
+    def __init__(self, institution, iterations=30, warmup=2, bulk_rows=500, pdfs=20, pdf_kb=256,
+                 storage_latency=0.02, concurrency=20):
+        self.institution = institution
+        self.iterations = iterations
+        self.warmup = warmup
+        self.bulk_rows = bulk_rows
+        self.pdfs = pdfs
+        self.pdf_kb = pdf_kb
+        self.storage_latency = storage_latency
+        self.concurrency = concurrency
+        self.data = institution.departments[0]
+        self.department_id = self.data.department.id
+        self.client = APIClient()
+        self.client.force_authenticate(BenchUser(self.department_id))
+
+    def run(self, name, run, **kwargs):
+        kwargs.setdefault('iterations', self.iterations)
+        kwargs.setdefault('warmup', self.warmup)
+        return measure(name, run, **kwargs)
+
+
+def _hhmm(value):
+    return value.strftime('%H:%M')
+
+
+def _entry_row(entry, **overrides):
+    row = {
+        'day_of_week': entry.day_of_week,
+        'start_time': _hhmm(entry.start_time),
+        'end_time': _hhmm(entry.end_time),
+        'faculty': str(entry.faculty_id),
+        'subject': str(entry.subject_id),
+        'room': str(entry.room_id),
+        'semester': entry.semester,
+        'section': entry.section,
+        'academic_year': entry.academic_year,
+    }
+    row.update(overrides)
+    return row
+
+
+def entries_list(bench):
+    client, department_id = bench.client, bench.department_id
+    uncached = lambda i: response_cache.clear()
+
+    def page(query):
+        return lambda i: expect(client.get(ENTRIES + query), 200)
+
+    rows = len(bench.data.entries)
+    return [
+        bench.run('entries_list', page('?page_size=100'), setup=uncached),
+        bench.run('entries_list_compact', page('?page_size=100&format=compact'), setup=uncached),
+        bench.run('entries_list_cached', page('?page_size=100')),
+        bench.run('entries_export', page('export/'), setup=uncached,
+                  iterations=max(1, bench.iterations // 10), warmup=1, items=rows),
+    ]
+
+
+def entries_create(bench):
+    """POST single entries, through the serializer's conflict checks, on the free day."""
+    data, client = bench.data, bench.client
+    hours = 24 - FIRST_HOUR
+    slots = hours * min(len(data.rooms), len(data.faculty))
+    if bench.iterations + bench.warmup > slots:
+        raise BenchmarkError(f'entries_create has room for {slots} iterations.')
+    template = data.entries[0]
+
+    def create(i):
+        hour, k = FIRST_HOUR + i % hours, i // hours
+        row = _entry_row(
+            template, day_of_week=FREE_DAY,
+            start_time=_hhmm(clock(hour)), end_time=_hhmm(clock(hour, 50)),
+            room=str(data.rooms[k].id), faculty=str(data.faculty[k].id), section=f'X{k}',
+        )
+        expect(client.post(ENTRIES, row, format='json'), 201)
+
+    def clash(i):
+        # Same room, faculty and section as an existing entry.
+        expect(client.post(ENTRIES, _entry_row(template), format='json'), 400)
+
+    return [
+        bench.run('entries_create', create),
+        bench.run('entries_create_conflict', clash),
+    ]
+
+
+def bulk_import(bench):
+    """Import a copy of part of the timetable into a new academic year per call."""
+    data, client = bench.data, bench.client
+    source = data.entries[:bench.bulk_rows]
+    if not source:
+        return []
+    base_year = bench.institution.year + 1
+
+    def run(dry_run):
+        query = '?dry_run=1' if dry_run else ''
+
+        def call(i):
+            year = base_year + i
+            rows = [_entry_row(entry, academic_year=year) for entry in source]
+            resp = expect(client.post(ENTRIES + 'bulk/' + query, rows, format='json'), 200, 201)
+            if resp.data['failed']:
+                raise BenchmarkError(f"{resp.data['failed']} rows failed to import.")
+        return call
+
+    iterations = max(1, bench.iterations // 5)
+    return [
+        bench.run('bulk_import_dry_run', run(True), iterations=iterations, warmup=1, items=len(source)),
+        bench.run('bulk_import', run(False), iterations=iterations, warmup=1, items=len(source)),
+    ]
+
+
+def auth(bench):
+    """ClerkAuthentication with a fresh token (signature check, user sync) and a cached one."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+    def token(subject):
+        now = int(time.time())
+        return jwt.encode({
+            'sub': subject, 'iat': now, 'exp': now + 3600,
+            'public_metadata': {'department_code': bench.data.department.code},
+        }, key, algorithm='RS256')
+
+    backend = authentication.ClerkAuthentication()
+    factory = RequestFactory()
+    fresh = {}
+
+    def authenticate(value):
+        request = factory.get(ENTRIES, HTTP_AUTHORIZATION=f'Bearer {value}')
+        user, _ = backend.authenticate(request)
+        if user.department_id != bench.department_id:
+            raise BenchmarkError('Token resolved to the wrong department.')
+
+    # Tokens are signed outside the timed section.
+    prepare = lambda i: fresh.__setitem__(i, token(f'user_bench_{i}'))
+    repeated = token('user_bench_cached')
+    with override_settings(CLERK_PEM_PUBLIC_KEY=public_pem):
+        return [
+            bench.run('auth_verify', lambda i: authenticate(fresh.pop(i)), setup=prepare),
+            bench.run('auth_cached', lambda i: authenticate(repeated)),
+        ]
+
+
+def _stored_pdfs(bench, server):
+    blob = b'%PDF-1.4\n' + os.urandom(bench.pdf_kb * 1024) + b'\n%%EOF\n'
+    pdfs = []
+    for n in range(bench.pdfs):
+        key = f'bench/{n}.pdf'
+        server.put(BUCKET, key, blob)
+        pdfs.append(ReferencePDF.objects.create(
+            department_id=bench.department_id, storage_backend='s3', cloudinary_public_id=key,
+            cloudinary_url='', filename=f'{n}.pdf', file_size=len(blob),
+        ))
+    return pdfs, len(blob)
+
+
+def pdf_download(bench):
+    """
+    DownloadPDFView proxying from the fake S3 server, with and without the
+    local PDF cache, and AsyncDownloadPDFView serving `concurrency`
+    downloads at once. The async view's queries run on a worker thread and
+    are not counted.
+    """
+    sync_view = DownloadPDFView.as_view()
+    async_view = AsyncDownloadPDFView.as_view()
+    factory, async_factory = RequestFactory(), AsyncRequestFactory()
+
+    with FakeS3Server(latency=bench.storage_latency) as server, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        pdfs, size = _stored_pdfs(bench, server)
+
+        def download(i):
+            pdf = pdfs[i % len(pdfs)]
+            resp = sync_view(factory.get(f'/api/v1/documents/download/{pdf.id}/'), pdf_id=pdf.id)
+            if hasattr(resp, 'render'):
+                resp.render()
+            expect(resp, 200)
+
+        async def one(pdf):
+            resp = await async_view(async_factory.get(f'/api/v1/documents/download/{pdf.id}/'), pdf_id=pdf.id)
+            if resp.status_code != 200:
+                raise BenchmarkError(f'Async download returned {resp.status_code}.')
+            async for _ in resp.streaming_content:
+                pass
+
+        def download_many(i):
+            async def many():
+                await asyncio.gather(*(one(pdfs[(i + n) % len(pdfs)]) for n in range(bench.concurrency)))
+            asyncio.run(many())
+
+        storage_settings = dict(
+            AWS_S3_ENDPOINT_URL=server.url, AWS_STORAGE_BUCKET_NAME=BUCKET,
+            AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench',
+            DOCUMENT_DOWNLOAD_REDIRECT=False, PDF_CACHE_DIR=cache_dir,
+        )
+        results = []
+        try:
+            with override_settings(**storage_settings):
+                # The backend and cache are process-wide; rebuild them for the fake server.
+                storage._backends.pop('s3', None)
+                pdf_cache._cache = None
+                with override_settings(PDF_CACHE_ENABLED=False):
+                    results.append(bench.run('pdf_download', download, items=1))
+                    results.append(bench.run(
+                        'pdf_download_async', download_many,
+                        iterations=max(1, bench.iterations // 5), warmup=1, items=bench.concurrency,
+                    ))
+                for i in range(len(pdfs)):
+                    download(i)
+                results.append(bench.run('pdf_download_cached', download))
+        finally:
+            storage._backends.pop('s3', None)
+            pdf_cache._cache = None
+        for result in results:
+            result['bytes_per_call'] = size
+        return results
+
+
+SCENARIOS = {
+    'entries_list': entries_list,
+    'entries_create': entries_create,
+    'bulk_import': bulk_import,
+    'auth': auth,
+    'pdf_download': pdf_download,
+}
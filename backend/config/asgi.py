@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# The native async document views; the WSGI web process keeps the sync ones.
+os.environ.setdefault("DOCUMENT_ASYNC_VIEWS", "true")
 
 application = get_asgi_application()
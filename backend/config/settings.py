@@ -14,6 +14,8 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 
+from .database import databases
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -50,9 +52,12 @@ INSTALLED_APPS = [
     "meta",
     "timetable",
     "documents",
+    "jobs",
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover every other middleware
+    "core.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS first
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -61,8 +66,6 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    # Custom
-    "core.middleware.ClerkMiddleware", # Placeholder for now
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -87,13 +90,40 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# DATABASE_URL (PostgreSQL) with optional read replicas and pooling; see
+# config/database.py. Without it, a local SQLite file in WAL mode.
+
+DATABASES = databases(BASE_DIR)
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+# Seconds a department's reads stay on the primary after it writes
+DATABASE_REPLICA_LAG = int(os.getenv('DATABASE_REPLICA_LAG', '5'))
+# Cache alias holding those markers; must be shared by all processes when
+# replicas are configured (checked at startup)
+DATABASE_REPLICA_LAG_CACHE = os.getenv('DATABASE_REPLICA_LAG_CACHE', 'default')
+SQLITE_WAL = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+
 
-DATABASES = {
+# Cache
+# Local memory by default (per process). Point CACHE_BACKEND/CACHE_LOCATION at a
+# shared backend (e.g. django.core.cache.backends.filebased.FileBasedCache) when
+# running several workers; required with DATABASE_REPLICA_URLS.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "BACKEND": os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.getenv('CACHE_LOCATION', 'timetable'),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv('CACHE_MAX_ENTRIES', 10000))},
+    },
+    # Rendered API responses; point RESPONSE_CACHE_BACKEND at FileBasedCache
+    # or DatabaseCache to share them between processes.
+    "responses": {
+        "BACKEND": os.getenv('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.getenv('RESPONSE_CACHE_LOCATION', 'responses'),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 5000))},
+    },
 }
+TIMETABLE_RESPONSE_CACHE = 'responses'
+TIMETABLE_RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
 
 
 # Password validation
@@ -147,6 +177,20 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Clerk token verification. Keys come from the JWKS URL, a local JWKS file,
+# or a PEM public key (Clerk dashboard -> API keys -> JWT public key).
+CLERK_JWKS_URL = os.getenv('CLERK_JWKS_URL', '')
+CLERK_JWKS_FILE = os.getenv('CLERK_JWKS_FILE', '')
+CLERK_PEM_PUBLIC_KEY = os.getenv('CLERK_PEM_PUBLIC_KEY', '').replace('\\n', '\n')
+CLERK_ISSUER = os.getenv('CLERK_ISSUER', '')
+CLERK_AUTHORIZED_PARTIES = [p for p in os.getenv('CLERK_AUTHORIZED_PARTIES', '').split(',') if p]
+CLERK_JWKS_CACHE_SECONDS = int(os.getenv('CLERK_JWKS_CACHE_SECONDS', 3600))
+CLERK_TOKEN_CACHE_SIZE = int(os.getenv('CLERK_TOKEN_CACHE_SIZE', 10000))
+CLERK_TOKEN_CACHE_SECONDS = int(os.getenv('CLERK_TOKEN_CACHE_SECONDS', 300))
+# Clerk roles (public_metadata.role) allowed institution-wide operations such
+# as /generate/institution/; Django staff users always are
+TIMETABLE_INSTITUTION_ROLES = [r for r in os.getenv('TIMETABLE_INSTITUTION_ROLES', 'admin').split(',') if r]
+
 # CORS
 CORS_ALLOW_ALL_ORIGINS = True  # For dev only
 
@@ -154,3 +198,86 @@ CORS_ALLOW_ALL_ORIGINS = True  # For dev only
 CLOUDINARY_CLOUD_NAME = os.getenv('CLOUDINARY_CLOUD_NAME', '')
 CLOUDINARY_API_KEY = os.getenv('CLOUDINARY_API_KEY', '')
 CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET', '')
+
+# Document storage: 'cloudinary', 's3' or 'local'. Existing documents keep the backend they were stored with.
+DOCUMENT_STORAGE_BACKEND = os.getenv('DOCUMENT_STORAGE_BACKEND', 'cloudinary')
+DOCUMENT_STORAGE_ROOT = Path(os.getenv('DOCUMENT_STORAGE_ROOT', BASE_DIR / 'media' / 'documents'))
+DOCUMENT_STORAGE_BASE_URL = os.getenv('DOCUMENT_STORAGE_BASE_URL', '')
+# Serve upload/list/download with the native async views; config/asgi.py turns
+# this on for the ASGI events process (under WSGI their streamed bodies would be
+# buffered), and the limits of their shared HTTP client to storage
+DOCUMENT_ASYNC_VIEWS = os.getenv('DOCUMENT_ASYNC_VIEWS', 'false').lower() == 'true'
+DOCUMENT_HTTP_MAX_CONNECTIONS = int(os.getenv('DOCUMENT_HTTP_MAX_CONNECTIONS', '200'))
+DOCUMENT_HTTP_MAX_KEEPALIVE = int(os.getenv('DOCUMENT_HTTP_MAX_KEEPALIVE', '50'))
+DOCUMENT_HTTP_PER_HOST = int(os.getenv('DOCUMENT_HTTP_PER_HOST', '50'))
+DOCUMENT_HTTP_TIMEOUT = float(os.getenv('DOCUMENT_HTTP_TIMEOUT', '30'))
+# Lifetime in seconds of presigned direct-upload requests
+DOCUMENT_DIRECT_UPLOAD_EXPIRES = int(os.getenv('DOCUMENT_DIRECT_UPLOAD_EXPIRES', '3600'))
+# Redirect downloads to a presigned storage URL where the backend has one (S3)
+DOCUMENT_DOWNLOAD_REDIRECT = os.getenv('DOCUMENT_DOWNLOAD_REDIRECT', 'false').lower() == 'true'
+
+# S3 (AWS_S3_ENDPOINT_URL for S3-compatible servers such as MinIO)
+AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
+AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME', 'us-east-1')
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL', '')
+AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME', 'timetable-input-bucket')
+
+# Background jobs: files handed to a job are staged here until a worker picks them up.
+UPLOAD_STAGING_DIR = Path(os.getenv('UPLOAD_STAGING_DIR', BASE_DIR / 'media' / 'staging'))
+# Largest PDF a chunked upload session may declare and receive
+PDF_MAX_BYTES = int(os.getenv('PDF_MAX_BYTES', 100 * 1024 * 1024))
+# Chunked uploads: largest accepted chunk, and how long an idle session is kept.
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24'))
+
+# Local cache for proxied PDF downloads
+PDF_CACHE_ENABLED = os.getenv('PDF_CACHE_ENABLED', 'true').lower() == 'true'
+PDF_CACHE_DIR = Path(os.getenv('PDF_CACHE_DIR', BASE_DIR / 'media' / 'pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Upstream archives larger than this spill from memory to a temp file
+PDF_PROXY_SPOOL_MAX_BYTES = int(os.getenv('PDF_PROXY_SPOOL_MAX_BYTES', 1024 * 1024))
+
+# Rendered CSV/XLSX/PDF timetable exports, kept per department data version
+EXPORT_CACHE_ENABLED = os.getenv('EXPORT_CACHE_ENABLED', 'true').lower() == 'true'
+EXPORT_CACHE_DIR = Path(os.getenv('EXPORT_CACHE_DIR', BASE_DIR / 'media' / 'exports'))
+
+# Default and maximum page sizes for keyset-paginated list endpoints.
+TIMETABLE_PAGE_SIZE = int(os.getenv('TIMETABLE_PAGE_SIZE', '100'))
+# How often a background job's worker records that it is still alive and
+# checks for a cancel request (see jobs.queue; 0 = never)
+JOBS_HEARTBEAT_SECONDS = float(os.getenv('JOBS_HEARTBEAT_SECONDS', '5'))
+# Longest solver time_limit, in seconds, a generate request may ask for
+TIMETABLE_GENERATE_MAX_SECONDS = float(os.getenv('TIMETABLE_GENERATE_MAX_SECONDS', '120'))
+
+# Change feed: events pass between processes through the FeedEvent table,
+# polled this often by the process serving /api/v1/feed/ and kept this long
+# for Last-Event-ID replay. timetable.feed.Broker keeps them in-process.
+TIMETABLE_FEED_BROKER = os.getenv('TIMETABLE_FEED_BROKER', 'timetable.feed.DatabaseBroker')
+TIMETABLE_FEED_POLL_SECONDS = float(os.getenv('TIMETABLE_FEED_POLL_SECONDS', '0.5'))
+TIMETABLE_FEED_RETENTION_SECONDS = int(os.getenv('TIMETABLE_FEED_RETENTION_SECONDS', '3600'))
+
+# Request metrics served on /metrics in Prometheus text format; set
+# METRICS_TOKEN to require it as a bearer token, otherwise only staff
+# sessions may read it.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Sampling profiler: dump folded stacks of requests slower than this (0 = off)
+PROFILE_SLOW_REQUEST_MS = int(os.getenv('PROFILE_SLOW_REQUEST_MS', '0'))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', BASE_DIR / 'media' / 'profiles'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'root': {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'INFO')},
+    # httpx logs every storage request at INFO
+    'loggers': {'httpx': {'level': 'WARNING'}},
+}
@@ -18,8 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from core.views import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include("timetable.urls")),
     path("api/v1/documents/", include("documents.urls")),
+    path("api/v1/jobs/", include("jobs.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .db_router import check_lag_cache, enable_sqlite_wal
+        from .metrics import install_query_counter
+
+        check_lag_cache()
+        connection_created.connect(enable_sqlite_wal)
+        connection_created.connect(install_query_counter)
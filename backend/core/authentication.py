@@ -1,14 +1,111 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+
 import jwt
 import requests
 from django.conf import settings
-from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.auth.models import User
 from rest_framework import authentication
 from rest_framework import exceptions
 from meta.models import Department
-import json
-import base64
+from .cache import TTLCache
+
+
+class JWKSClient:
+    """
+    Fetches Clerk's signing keys and caches them by key id.
+
+    Keys come from CLERK_JWKS_URL or, for offline setups and tests, from a
+    local CLERK_JWKS_FILE. The set is refetched when it is older than
+    CLERK_JWKS_CACHE_SECONDS or when a token names a key id we have not seen
+    (key rotation), at most once per `min_refresh_interval` seconds.
+    """
+
+    def __init__(self, url=None, path=None, ttl=3600, min_refresh_interval=30):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        if self.path:
+            with open(self.path) as f:
+                data = json.load(f)
+        else:
+            resp = requests.get(self.url, timeout=5)
+            resp.raise_for_status()
+            data = resp.json()
+        return {key.key_id: key.key for key in jwt.PyJWKSet.from_dict(data).keys}
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if self._fetched_at is not None:
+            age = now - self._fetched_at
+            if age < self.min_refresh_interval or (not force and age < self.ttl):
+                return
+        try:
+            self._keys = self._fetch()
+        except Exception as e:
+            if not self._keys:
+                raise exceptions.AuthenticationFailed(f'Could not load signing keys: {e}')
+            # Keep serving the keys we have if a refresh fails.
+        self._fetched_at = now
+
+    def get_signing_key(self, kid):
+        with self._lock:
+            self._refresh()
+            if kid not in self._keys:
+                self._refresh(force=True)
+            key = self._keys.get(kid)
+        if key is None:
+            raise exceptions.AuthenticationFailed('Invalid token: unknown signing key')
+        return key
+
+
+_jwks_client = None
+_token_cache = None
+_lock = threading.Lock()
+
+
+def get_jwks_client():
+    global _jwks_client
+    with _lock:
+        if _jwks_client is None:
+            url = getattr(settings, 'CLERK_JWKS_URL', '')
+            path = getattr(settings, 'CLERK_JWKS_FILE', '')
+            if not url and not path:
+                return None
+            _jwks_client = JWKSClient(url=url, path=path, ttl=getattr(settings, 'CLERK_JWKS_CACHE_SECONDS', 3600))
+        return _jwks_client
+
+
+def get_token_cache():
+    global _token_cache
+    with _lock:
+        if _token_cache is None:
+            _token_cache = TTLCache(
+                maxsize=getattr(settings, 'CLERK_TOKEN_CACHE_SIZE', 10000),
+                ttl=getattr(settings, 'CLERK_TOKEN_CACHE_SECONDS', 300),
+            )
+        return _token_cache
+
 
 class ClerkAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates requests carrying a Clerk session token (RS256 JWT).
+
+    Verified tokens are cached (keyed by their SHA-256) together with the
+    synced user and department, so repeat requests with the same token skip
+    both the signature check and the database until the token expires or
+    CLERK_TOKEN_CACHE_SECONDS passes.
+    """
+
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
         if not auth_header:
@@ -19,27 +116,23 @@ class ClerkAuthentication(authentication.BaseAuthentication):
         except IndexError:
             raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
 
-        return self._authenticate_credentials(request, token)
+        return self.authenticate_credentials(request, token)
 
-    def _authenticate_credentials(self, request, token):
-        # In a real production app, fetch JWKS from Clerk and verify signature.
-        # For this setup, we will decode unverified to get the payload (if verifying locally is complex without keys)
-        # OR we fetch the keys.
-        
-        # NOTE: For simplicity and since we don't have the CLERK_PEM_PUBLIC_KEY or JWKS_URL in env yet,
-        # we will Decode without verification for the MVP step, BUT structure it to be replaceable.
-        # Ideally: 
-        # jwks_url = 'https://<your-clerk-domain>/.well-known/jwks.json'
-        # jwks = requests.get(jwks_url).json()
-        # ... verify ...
-        
-        try:
-            # Decoding without verification for MVP speed, 
-            # assuming HTTPS and Clerk-Frontend trust.
-            # WARNING: IN PRODUCTION, VERIFY SIGNATURE using PyJWT and JWKS.
-            payload = jwt.decode(token, options={"verify_signature": False})
-        except Exception as e:
-            raise exceptions.AuthenticationFailed(f'Invalid token: {str(e)}')
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+    def authenticate_credentials(self, request, token):
+        cache = get_token_cache()
+        cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        cached = cache.get(cache_key)
+        if cached is not None:
+            user, department_id = cached
+            # Hand each request its own copy; the cached one is shared.
+            user = copy.copy(user)
+            user.department_id = department_id
+            return (user, None)
+
+        payload = self._verify(token)
 
         user_id = payload.get('sub')
         if not user_id:
@@ -68,7 +161,46 @@ class ClerkAuthentication(authentication.BaseAuthentication):
             user, created = User.objects.get_or_create(username=user_id)
             # Attach department_id (UUID) to the user object temporarily for the request
             user.department_id = department.id
+            # Clerk role from public_metadata, e.g. {'role': 'admin'}; kept with the cached copy.
+            user.clerk_role = str(metadata.get('role') or '')
         except Exception as e:
              raise exceptions.AuthenticationFailed(f'User sync failed: {str(e)}')
 
+        cache.set(cache_key, (copy.copy(user), department.id), ttl=payload['exp'] - time.time())
         return (user, None)
+
+    def _verify(self, token):
+        """Check the RS256 signature, expiry, issuer and authorized party."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise exceptions.AuthenticationFailed(f'Invalid token: {str(e)}')
+
+        pem = getattr(settings, 'CLERK_PEM_PUBLIC_KEY', '')
+        if pem:
+            key = pem
+        else:
+            client = get_jwks_client()
+            if client is None:
+                raise exceptions.AuthenticationFailed(
+                    'Token verification is not configured (set CLERK_JWKS_URL, CLERK_JWKS_FILE or CLERK_PEM_PUBLIC_KEY).'
+                )
+            key = client.get_signing_key(header.get('kid'))
+
+        issuer = getattr(settings, 'CLERK_ISSUER', '') or None
+        try:
+            payload = jwt.decode(
+                token,
+                key=key,
+                algorithms=['RS256'],
+                issuer=issuer,
+                leeway=getattr(settings, 'CLERK_CLOCK_SKEW_SECONDS', 5),
+                options={'require': ['exp', 'sub'], 'verify_aud': False},
+            )
+        except jwt.PyJWTError as e:
+            raise exceptions.AuthenticationFailed(f'Invalid token: {str(e)}')
+
+        parties = getattr(settings, 'CLERK_AUTHORIZED_PARTIES', [])
+        if parties and payload.get('azp') not in parties:
+            raise exceptions.AuthenticationFailed('Invalid token: unauthorized party')
+        return payload
@@ -0,0 +1,113 @@
+"""
+Primary/replica routing.
+
+Everything reads from and writes to the primary ('default') unless a
+request opts in with replica_reads(); DepartmentScopedViewSet does so for
+list/retrieve/export. Writes, and the reads they depend on (serializer
+conflict checks, the in-memory indexes), therefore always see the primary.
+
+After a department writes, its reads stay on the primary for
+DATABASE_REPLICA_LAG seconds, so a client does not read its own change back
+stale and a stale response is not cached under the new data version. The
+marker lives in the DATABASE_REPLICA_LAG_CACHE cache, which every process
+serving requests must share; check_lag_cache() refuses to start with a
+per-process one while replicas are configured.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+# Backends whose entries are only visible to the process that wrote them.
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+@contextmanager
+def replica_reads():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def primary_reads():
+    """Send the rest of the current replica_reads() block to the primary."""
+    _use_replica.set(False)
+
+
+def _lag_cache():
+    return caches[getattr(settings, 'DATABASE_REPLICA_LAG_CACHE', 'default')]
+
+
+def check_lag_cache():
+    """
+    Raise ImproperlyConfigured if replicas are configured but the marker
+    cache is local to each process: a write served by one worker would not
+    keep the next request, served by another, off a lagging replica.
+    """
+    if not replica_aliases() or not getattr(settings, 'DATABASE_REPLICA_LAG', 5):
+        return
+    alias = getattr(settings, 'DATABASE_REPLICA_LAG_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None or backend in PER_PROCESS_CACHES:
+        raise ImproperlyConfigured(
+            f'DATABASE_REPLICA_URLS needs a cache shared between processes for '
+            f'read-your-writes routing, but the {alias!r} cache is {backend or "not configured"}. '
+            f'Set CACHE_BACKEND (or DATABASE_REPLICA_LAG_CACHE) to a shared backend '
+            f'such as FileBasedCache, DatabaseCache or Redis.'
+        )
+
+
+def _written_key(department_id):
+    return f'dbwrite:{department_id}'
+
+
+def mark_written(department_id):
+    lag = getattr(settings, 'DATABASE_REPLICA_LAG', 5)
+    if department_id and lag and replica_aliases():
+        _lag_cache().set(_written_key(department_id), time.time(), lag)
+
+
+def recently_written(department_id):
+    return bool(department_id) and _lag_cache().get(_written_key(department_id)) is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def enable_sqlite_wal(sender, connection, **kwargs):
+    """connection_created receiver: WAL lets readers run alongside a writer."""
+    if connection.vendor == 'sqlite' and getattr(settings, 'SQLITE_WAL', True):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL;')
+            cursor.execute('PRAGMA synchronous=NORMAL;')
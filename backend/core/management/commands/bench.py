@@ -0,0 +1,147 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.factory import build_institution
+from benchmarks.harness import BenchmarkError, compare
+from benchmarks.scenarios import SCENARIOS, Bench
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = "Benchmark the API against a synthetic institution in a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departments', type=int, default=4)
+        parser.add_argument('--faculty', type=int, default=100, help='Faculty members per department.')
+        parser.add_argument('--rooms', type=int, default=100, help='Rooms per department.')
+        parser.add_argument('--subjects', type=int, default=120, help='Subjects per department.')
+        parser.add_argument('--entries', type=int, default=20000, help='Timetable entries in total.')
+        parser.add_argument('--iterations', type=int, default=30, help='Timed calls per scenario.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed calls before each scenario.')
+        parser.add_argument('--bulk-rows', type=int, default=500, help='Rows per bulk import.')
+        parser.add_argument('--pdfs', type=int, default=20, help='Documents in the fake storage server.')
+        parser.add_argument('--pdf-kb', type=int, default=256, help='Size of each document.')
+        parser.add_argument('--storage-latency', type=float, default=20, help='Fake storage delay in ms.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Simultaneous async downloads.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only', default='',
+            help=f"Comma-separated scenarios to run: {', '.join(SCENARIOS)}.",
+        )
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='A previous --output file to compare against.')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='With --compare, fail if a p50 grows by more than this percentage or a scenario runs more queries.',
+        )
+        parser.add_argument(
+            '--in-memory', action='store_true',
+            help='Keep an SQLite test database in memory instead of in a temporary file.',
+        )
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['only'].split(',') if n.strip()] or list(SCENARIOS)
+        unknown = [n for n in names if n not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            document = self._run(names, options, workdir)
+
+        for result in document['results']:
+            self.stdout.write(
+                f"{result['name']:<28} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"{result['throughput_per_s'] or 0:>10.1f}/s  {result['queries_mean']:>7.1f} queries"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+        if previous is not None:
+            lines, regressed = compare(previous, document, options['max_regression'])
+            self.stdout.write(f"Compared with {previous.get('meta', {}).get('commit') or options['compare']}:")
+            for line in lines:
+                self.stdout.write(line)
+            if regressed:
+                raise CommandError('Performance regressed.')
+
+    def _run(self, names, options, workdir):
+        default = connections['default'].settings_dict
+        if default['ENGINE'].endswith('sqlite3') and not options['in_memory']:
+            # A file-backed database, so disk I/O and WAL are part of the numbers.
+            default.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            started = time.perf_counter()
+            try:
+                institution = build_institution(
+                    departments=options['departments'], faculty=options['faculty'], rooms=options['rooms'],
+                    subjects=options['subjects'], entries=options['entries'], seed=options['seed'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            build_seconds = time.perf_counter() - started
+            self.stdout.write(f"Built {institution.entry_count} entries in {build_seconds:.1f}s.")
+
+            bench = Bench(
+                institution, iterations=options['iterations'], warmup=options['warmup'],
+                bulk_rows=options['bulk_rows'], pdfs=options['pdfs'], pdf_kb=options['pdf_kb'],
+                storage_latency=options['storage_latency'] / 1000, concurrency=options['concurrency'],
+            )
+            results = []
+            for name in names:
+                self.stdout.write(f"Running {name}...")
+                try:
+                    results += SCENARIOS[name](bench)
+                except BenchmarkError as e:
+                    raise CommandError(f'{name}: {e}')
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        return {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': sys.version.split()[0],
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'database': default['ENGINE'].rsplit('.', 1)[-1],
+                'build_seconds': round(build_seconds, 3),
+                'options': {
+                    key: options[key] for key in (
+                        'departments', 'faculty', 'rooms', 'subjects', 'entries', 'iterations', 'warmup',
+                        'bulk_rows', 'pdfs', 'pdf_kb', 'storage_latency', 'concurrency', 'seed',
+                    )
+                },
+            },
+            'results': results,
+        }
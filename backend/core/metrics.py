@@ -0,0 +1,206 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+MetricsMiddleware gives each request a RequestStats in a context variable.
+SQL queries are counted and timed by an execute wrapper installed on every
+database connection (see CoreConfig.ready), serializer and storage time by
+span() blocks around serializer output and the storage backends' upstream
+calls. Because the stats live in a context variable, work done for the
+request in sync_to_async threads or while a streaming body is sent is
+counted as well. When the response is closed the stats go into the
+histograms below, labelled by the URL name of the view.
+
+The registry is per process: with several gunicorn workers each one serves
+its own numbers on /metrics, which Prometheus sums by scraping each worker
+or through a sidecar.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        self._open = set()
+
+
+def start_request():
+    stats = RequestStats()
+    _stats.set(stats)
+    return stats
+
+
+def current():
+    return _stats.get()
+
+
+@contextmanager
+def span(kind):
+    """
+    Add the time spent in the block to the current request's `kind` total.
+    Nested spans of the same kind are only counted once.
+    """
+    stats = _stats.get()
+    if stats is None or kind in stats._open:
+        yield
+        return
+    stats._open.add(kind)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats._open.discard(kind)
+        stats.spans[kind] = stats.spans.get(kind, 0.0) + time.perf_counter() - started
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper: count and time each query of the current request."""
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_labels(self.label_names, labels)} {_number(value)}' for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels):
+        self.inc(*labels, amount=-1)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(
+                    f'{self.name}_bucket{_labels(self.label_names, labels, [("le", _number(bound))])} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {_number(round(total, 6))}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'Requests served.', ('method', 'view', 'status'))
+IN_PROGRESS = Gauge('http_requests_in_progress', 'Requests being served.', ())
+LATENCY = Histogram('http_request_duration_seconds', 'Time from request to the last byte sent.', ('method', 'view'))
+QUERIES = Histogram('http_request_db_queries', 'SQL queries per request.', ('view',), QUERY_BUCKETS)
+DB_TIME = Histogram('http_request_db_seconds', 'Time spent in SQL per request.', ('view',))
+SERIALIZER_TIME = Histogram('http_request_serializer_seconds', 'Time spent serializing per request.', ('view',))
+STORAGE_TIME = Histogram('http_request_storage_seconds', 'Time spent waiting on document storage per request.', ('view',))
+
+REGISTRY = [REQUESTS, IN_PROGRESS, LATENCY, QUERIES, DB_TIME, SERIALIZER_TIME, STORAGE_TIME]
+
+
+def record(method, view, status, seconds, stats):
+    REQUESTS.inc(method, view, str(status))
+    LATENCY.observe(seconds, method, view)
+    QUERIES.observe(stats.queries, view)
+    DB_TIME.observe(stats.db_seconds, view)
+    SERIALIZER_TIME.observe(stats.spans.get('serializer', 0.0), view)
+    STORAGE_TIME.observe(stats.spans.get('storage', 0.0), view)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+class TimedSerializerMixin:
+    """Count the serializer's output time towards the request's serializer span."""
+
+    def to_representation(self, instance):
+        with span('serializer'):
+            return super().to_representation(instance)
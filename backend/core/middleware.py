@@ -1,21 +1,107 @@
 """
-Clerk Authentication Middleware
-Verifies JWT tokens from Clerk and attaches user/department info to requests.
+Request instrumentation middleware.
+
+Records latency, SQL, serializer and storage time for every request into
+core.metrics and, with PROFILE_SLOW_REQUEST_MS set, samples the stacks of
+requests and dumps those that turn out slow (see core.profiler). Timings
+end when the response is closed, i.e. after a streamed body has been sent.
+
+Sampling starts in process_view, a sync hook: Django runs it in the thread
+the view itself runs in, which under ASGI is the worker thread of a sync
+view rather than the event loop thread that runs the middleware.
 """
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, profiler
+
+logger = logging.getLogger(__name__)
+
+
+def view_label(request):
+    """The URL name of the view that served the request; bounded, unlike the path."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
 
 
-class ClerkMiddleware:
-    """
-    Middleware to handle Clerk JWT verification.
-    For now, this is a pass-through for development.
-    In production, it should verify the Clerk JWT.
-    """
-    
+class MetricsMiddleware:
+    # Usable on both stacks, so async views under ASGI stay on the event loop.
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-    
+        self.metrics_enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.slow_ms = getattr(settings, 'PROFILE_SLOW_REQUEST_MS', 0)
+        if not self.metrics_enabled and not self.slow_ms:
+            raise MiddlewareNotUsed()
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 1.0)
+        self.profile_dir = getattr(settings, 'PROFILE_DIR', 'profiles')
+        if self.slow_ms:
+            self.sampler = profiler.get_sampler(getattr(settings, 'PROFILE_INTERVAL_MS', 5) / 1000)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
-        # For development, skip JWT verification
-        # In production, verify Clerk JWT here
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self._begin(request)
+        return self._finish(request, self.get_response(request), state)
+
+    async def __acall__(self, request):
+        state = self._begin(request)
+        return self._finish(request, await self.get_response(request), state)
+
+    def _begin(self, request):
+        metrics.IN_PROGRESS.inc()
+        stats = metrics.start_request()
+        if self.slow_ms and random.random() < self.sample_rate:
+            # Started by process_view once the view's thread is known.
+            request._profile = {'caller': threading.get_ident(), 'thread': None, 'samples': None}
+        return stats, time.perf_counter()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is None or profile['thread'] is not None:
+            return None
+        # An async view runs on the thread that called the middleware (the
+        # event loop); a sync one on the thread running this hook.
+        thread_id = profile['caller'] if iscoroutinefunction(view_func) else threading.get_ident()
+        profile['thread'], profile['samples'] = thread_id, self.sampler.start(thread_id)
+        return None
+
+    def _finish(self, request, response, state):
+        # Runs when the server closes the response, after the last byte.
+        response._resource_closers.append(lambda: self._done(request, response, state))
         return response
+
+    def _done(self, request, response, state):
+        stats, started = state
+        seconds = time.perf_counter() - started
+        metrics.IN_PROGRESS.dec()
+        view = view_label(request)
+        if self.metrics_enabled:
+            metrics.record(request.method, view, response.status_code, seconds, stats)
+        profile = getattr(request, '_profile', None)
+        if profile is None or profile['thread'] is None:
+            return
+        samples = profile['samples']
+        self.sampler.stop(profile['thread'], samples)
+        if seconds * 1000 >= self.slow_ms and samples:
+            try:
+                path = profiler.dump(self.profile_dir, view, request.method, seconds, samples)
+            except OSError as e:
+                logger.warning('Could not write request profile: %s', e)
+                return
+            logger.warning(
+                'Slow request %s %s took %.0f ms (%d queries, %.0f ms SQL); profile written to %s',
+                request.method, request.path, seconds * 1000, stats.queries, stats.db_seconds * 1000, path,
+            )
@@ -0,0 +1,101 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+With PROFILE_SLOW_REQUEST_MS set, MetricsMiddleware registers the thread
+running a request's view (a PROFILE_SAMPLE_RATE fraction of requests) with
+one shared sampler thread: the request thread under WSGI, and under ASGI the
+worker thread of a sync view. Every PROFILE_INTERVAL_MS it reads the stacks of the
+registered threads from sys._current_frames(). If the request turns out
+slower than the threshold its samples are written to PROFILE_DIR as folded
+stacks, one "frame;frame;frame count" line per distinct stack, ready for
+flamegraph.pl, speedscope or inferno. Faster requests are discarded.
+
+Async views are sampled on the event loop thread, which they share, so
+their samples include whatever else the loop was running at the time.
+Middleware and URL resolution before the view are not sampled.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+def fold(frame):
+    """A frame's stack as 'outer;...;inner', each frame as file:function."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id):
+        samples = Counter()
+        with self._lock:
+            self._targets[thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return samples
+
+    def stop(self, thread_id, samples):
+        with self._lock:
+            if self._targets.get(thread_id) is samples:
+                del self._targets[thread_id]
+
+    def _run(self):
+        while True:
+            # Clear before reading the targets: a start() after the read sets
+            # it again, so the wait below cannot miss it.
+            self._wake.clear()
+            with self._lock:
+                targets = list(self._targets.items())
+            if not targets:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[fold(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler(interval):
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = Sampler(interval)
+        return _sampler
+
+
+def dump(directory, view, method, seconds, samples):
+    """Write the folded stacks of one request; returns the file's path."""
+    os.makedirs(directory, exist_ok=True)
+    name = (
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{view.replace(':', '_')}"
+        f"-{int(seconds * 1000)}ms-{uuid.uuid4().hex[:6]}.folded"
+    )
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    return path
@@ -0,0 +1,53 @@
+"""
+Streaming response bodies the server can actually stream.
+
+Django reads a synchronous streaming body (a generator, a FileResponse) into
+memory in one go before sending it under ASGI, and does the same to an
+asynchronous one under WSGI. Views that stream from sync code return their
+response through for_server(), which leaves it alone under WSGI and gives it
+an async body under ASGI.
+
+async_body() pulls the synchronous body through sync_to_async in batches of
+about BATCH_BYTES. Within a request that is the thread a sync view ran in,
+so a generator reading from a database cursor keeps its connection, and
+neither queries nor file reads run on the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+BATCH_BYTES = 64 * 1024
+
+
+def _take(chunks, limit):
+    batch, size = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return batch
+
+
+def async_body(resp):
+    """Replace a response's synchronous streaming body with an async one."""
+    if resp.streaming and not resp.is_async:
+        chunks = iter(resp.streaming_content)
+        take = sync_to_async(_take)
+
+        async def body():
+            while True:
+                batch = await take(chunks, BATCH_BYTES)
+                if not batch:
+                    break
+                for chunk in batch:
+                    yield chunk
+
+        resp.streaming_content = body()
+    return resp
+
+
+def for_server(request, resp):
+    """`resp` with a body the server serving `request` streams."""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return async_body(resp)
+    return resp
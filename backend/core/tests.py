@@ -1,3 +1,251 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from asgiref.sync import async_to_sync
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework import exceptions
+from rest_framework.test import APIClient
+
+from benchmarks.factory import build_institution
+from benchmarks.harness import compare
+from benchmarks.scenarios import SCENARIOS, Bench
+from meta.models import Department
+
+from . import authentication, db_router, metrics, profiler
+from .streaming import for_server
+
+
+class ForServerTests(SimpleTestCase):
+    def response(self):
+        return StreamingHttpResponse(iter([b'a' * 40000, b'b' * 40000, b'c']))
+
+    def test_wsgi_response_is_left_alone(self):
+        resp = for_server(RequestFactory().get('/'), self.response())
+        self.assertFalse(resp.is_async)
+
+    def test_asgi_response_gets_an_async_body(self):
+        request = ASGIRequest(
+            {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': []}, io.BytesIO(),
+        )
+        resp = for_server(request, self.response())
+        self.assertTrue(resp.is_async)
+
+        async def read():
+            return [chunk async for chunk in resp.streaming_content]
+
+        self.assertEqual(b''.join(async_to_sync(read)()), b'a' * 40000 + b'b' * 40000 + b'c')
+
+
+@override_settings(PROFILE_SLOW_REQUEST_MS=60000, PROFILE_SAMPLE_RATE=1.0, METRICS_TOKEN='secret')
+class ProfiledThreadTests(SimpleTestCase):
+    def sampled_and_view_threads(self, get):
+        started, rendered = [], []
+        render = metrics.render
+
+        def record_render():
+            rendered.append(threading.get_ident())
+            return render()
+
+        sampler = profiler.get_sampler(0.005)
+        with mock.patch.object(sampler, 'start', side_effect=lambda thread_id: started.append(thread_id) or {}), \
+                mock.patch.object(sampler, 'stop'), \
+                mock.patch.object(metrics, 'render', side_effect=record_render):
+            self.assertEqual(get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code, 200)
+        return started, rendered
+
+    def test_wsgi_samples_the_request_thread(self):
+        started, rendered = self.sampled_and_view_threads(Client().get)
+        self.assertEqual(started, rendered)
+
+    def test_asgi_samples_the_sync_view_thread(self):
+        started, rendered = self.sampled_and_view_threads(async_to_sync(AsyncClient().get))
+        self.assertEqual(started, rendered)
+
+
+class SamplerTests(SimpleTestCase):
+    def test_a_target_registered_during_the_idle_check_is_sampled(self):
+        sampler = profiler.Sampler(0.001)
+        lock, samples = sampler._lock, Counter()
+
+        class RegisterAfterCheck:
+            # Registers a target right after the sampler found none.
+            def __enter__(self):
+                lock.acquire()
+
+            def __exit__(self, *exc):
+                lock.release()
+                if not sampler._targets:
+                    sampler._targets[threading.get_ident()] = samples
+                    sampler._wake.set()
+
+        sampler._lock = RegisterAfterCheck()
+        threading.Thread(target=sampler._run, daemon=True).start()
+        deadline = time.monotonic() + 2
+        while not samples and time.monotonic() < deadline:
+            time.sleep(0.005)
+        sampler._targets.clear()
+        self.assertTrue(samples)
+
+
+class MetricsViewTests(TestCase):
+    @override_settings(METRICS_TOKEN='')
+    def test_without_a_token_only_staff_may_scrape(self):
+        client = Client()
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        client.force_login(User.objects.create(username='ops'))
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        client.force_login(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_set(self):
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+        self.assertEqual(Client().get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(Client().get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code, 200)
+
+
+class LagCacheCheckTests(SimpleTestCase):
+    replicas = {'default': {}, 'replica_0': {}}
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'}}
+
+    def check(self, databases, caches):
+        # Only the settings are read, so no connection or cache is opened.
+        with mock.patch.object(db_router, 'settings', mock.Mock(
+            DATABASES=databases, CACHES=caches, DATABASE_REPLICA_LAG=5, DATABASE_REPLICA_LAG_CACHE='default',
+        )):
+            db_router.check_lag_cache()
+
+    def test_replicas_need_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.check(self.replicas, self.locmem)
+        with self.assertRaises(ImproperlyConfigured):
+            self.check(self.replicas, {})
+        self.check(self.replicas, self.shared)
+
+    def test_without_replicas_any_cache_will_do(self):
+        self.check({'default': {}}, self.locmem)
+
+
+class ClerkAuthenticationTests(TestCase):
+    """Tokens signed with a local key, verified against a CLERK_JWKS_FILE."""
+
+    def setUp(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.jwks_file = os.path.join(directory.name, 'jwks.json')
+        self.write_jwks(('k1', self.key))
+        overrides = override_settings(
+            CLERK_JWKS_FILE=self.jwks_file, CLERK_JWKS_URL='', CLERK_PEM_PUBLIC_KEY='',
+            CLERK_ISSUER='https://clerk.test', CLERK_AUTHORIZED_PARTIES=['https://app.test'],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(self.reset)
+        self.reset()
+
+    def reset(self):
+        authentication._jwks_client = None
+        authentication._token_cache = None
+
+    def write_jwks(self, *keys):
+        jwks = {'keys': []}
+        for kid, key in keys:
+            jwk = jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key(), as_dict=True)
+            jwks['keys'].append(dict(jwk, kid=kid, alg='RS256', use='sig'))
+        with open(self.jwks_file, 'w') as f:
+            json.dump(jwks, f)
+
+    def token(self, key=None, kid='k1', **claims):
+        payload = {
+            'sub': 'user_1', 'iss': 'https://clerk.test', 'azp': 'https://app.test',
+            'exp': int(time.time()) + 300, 'public_metadata': {'department_code': 'CS', 'role': 'admin'},
+        }
+        payload.update(claims)
+        return jwt.encode(payload, key or self.key, algorithm='RS256', headers={'kid': kid})
+
+    def authenticate(self, token):
+        return authentication.ClerkAuthentication().authenticate_credentials(RequestFactory().get('/'), token)
+
+    def test_valid_token_syncs_user_and_department(self):
+        user, _ = self.authenticate(self.token())
+        department = Department.objects.get(code='CS')
+        self.assertEqual((user.username, user.department_id, user.clerk_role), ('user_1', department.id, 'admin'))
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token()}')
+        self.assertEqual(client.get('/api/v1/faculty/').status_code, 200)
+
+    def test_bad_tokens_are_rejected(self):
+        other = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        for token in [
+            self.token(exp=int(time.time()) - 60),
+            self.token(key=other),
+            self.token(kid='unknown'),
+            self.token(iss='https://evil.test'),
+            self.token(azp='https://evil.test'),
+            self.token()[:-4] + 'AAAA',
+            'not-a-jwt',
+        ]:
+            with self.subTest(token=token[:20]), self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate(token)
+
+    def test_verified_tokens_are_cached(self):
+        token = self.token()
+        self.authenticate(token)
+        with mock.patch.object(authentication.ClerkAuthentication, '_verify') as verify:
+            user, _ = self.authenticate(token)
+        verify.assert_not_called()
+        self.assertEqual((user.department_id, user.clerk_role), (Department.objects.get(code='CS').id, 'admin'))
+
+    def test_rotated_keys_are_picked_up(self):
+        client = authentication.JWKSClient(path=self.jwks_file, min_refresh_interval=0)
+        self.assertIsNotNone(client.get_signing_key('k1'))
+        self.write_jwks(('k1', self.key), ('k2', rsa.generate_private_key(public_exponent=65537, key_size=2048)))
+        self.assertIsNotNone(client.get_signing_key('k2'))
+
+
+class BenchTests(TransactionTestCase):
+    """
+    Every scenario on a tiny institution. Transactional, as the bench is:
+    the async download scenario queries from another thread.
+    """
+
+    def test_scenarios_run(self):
+        institution = build_institution(departments=2, faculty=6, rooms=6, subjects=6, entries=60)
+        bench = Bench(institution, iterations=2, warmup=1, bulk_rows=10, pdfs=2, pdf_kb=4,
+                      storage_latency=0, concurrency=2)
+        for name, scenario in SCENARIOS.items():
+            with self.subTest(name):
+                results = scenario(bench)
+                self.assertTrue(results)
+                for result in results:
+                    self.assertGreater(result['iterations'], 0)
+                    self.assertGreaterEqual(result['p95_ms'], result['p50_ms'])
+
+    def test_compare_flags_slower_and_chattier_scenarios(self):
+        before = {'results': [
+            {'name': 'a', 'p50_ms': 10.0, 'queries_max': 3},
+            {'name': 'b', 'p50_ms': 10.0, 'queries_max': 3},
+        ]}
+        same = {'results': [{'name': 'a', 'p50_ms': 11.0, 'queries_max': 3}]}
+        slower = {'results': [{'name': 'a', 'p50_ms': 13.0, 'queries_max': 3}]}
+        chattier = {'results': [{'name': 'b', 'p50_ms': 10.0, 'queries_max': 4}]}
+        self.assertFalse(compare(before, same, 20)[1])
+        self.assertTrue(compare(before, slower, 20)[1])
+        self.assertTrue(compare(before, chattier, 20)[1])
+        lines, regressed = compare(before, {'results': [{'name': 'c', 'p50_ms': 1.0, 'queries_max': 0}]}, 20)
+        self.assertEqual((lines, regressed), (['c                            new'], False))
@@ -1,11 +1,18 @@
 from django.contrib import admin
-from .models import ReferencePDF
+from .models import ReferencePDF, UploadSession
 
 
 @admin.register(ReferencePDF)
 class ReferencePDFAdmin(admin.ModelAdmin):
-    list_display = ('filename', 'note', 'file_size', 'uploaded_at', 'cloudinary_url')
-    list_filter = ('uploaded_at',)
+    list_display = ('filename', 'note', 'file_size', 'storage_backend', 'uploaded_at', 'cloudinary_url')
+    list_filter = ('uploaded_at', 'storage_backend')
     search_fields = ('filename', 'note')
-    readonly_fields = ('id', 'cloudinary_public_id', 'cloudinary_url', 'file_size', 'uploaded_at')
+    readonly_fields = ('id', 'cloudinary_public_id', 'cloudinary_url', 'file_size', 'content_hash', 'uploaded_at')
     ordering = ('-uploaded_at',)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'status', 'received', 'size', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('id', 'received', 'job_id', 'pdf', 'created_at', 'updated_at')
@@ -0,0 +1,224 @@
+"""
+Native async versions of the upload, list and download views.
+
+Served from the ASGI application (config/asgi.py, see the Procfile), a
+proxied download waiting on storage holds no thread: storage traffic goes
+through the pooled client in documents.http and responses are streamed from
+async iterators. documents/urls.py routes to these views when
+DOCUMENT_ASYNC_VIEWS is on, as config/asgi.py sets it; the WSGI process
+serves the DRF views in documents.views, which behave the same.
+"""
+import logging
+import os
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+
+from core import metrics
+from core.streaming import async_body
+from core.authentication import ClerkAuthentication
+from jobs.serializers import JobSerializer
+
+from . import uploads
+from .http import aiter_file
+from .models import ReferencePDF
+from .pdf_cache import CachedPDF, get_pdf_cache, serve_cached_pdf
+from .storage import StorageError, get_storage
+from .streaming import EmptyArchive, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+
+async def authenticate(request):
+    """
+    (department_id, None) for the request's bearer token, or (None, 401
+    response) if one was sent and is invalid. Anonymous requests are allowed,
+    as on the DRF views.
+    """
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None, None
+    try:
+        user, _ = await sync_to_async(ClerkAuthentication().authenticate_credentials)(
+            request, header.split(' ', 1)[1]
+        )
+    except exceptions.AuthenticationFailed as e:
+        return None, JsonResponse({'error': str(e.detail)}, status=401)
+    return getattr(user, 'department_id', None), None
+
+
+def duplicate_response(pdf):
+    return JsonResponse({
+        'status': 'duplicate',
+        'id': str(pdf.id),
+        'url': pdf.cloudinary_url,
+        'filename': pdf.filename
+    }, status=200)
+
+
+def job_status_response(request, job):
+    data = JobSerializer(job).data
+    data['status_url'] = request.build_absolute_uri(f'/api/v1/jobs/{job.id}/')
+    data['result_url'] = request.build_absolute_uri(f'/api/v1/jobs/{job.id}/result/')
+    return JsonResponse(data, status=202)
+
+
+async def _close_after(chunks, fileobj):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUploadPDFView(View):
+    """
+    Upload a PDF to the storage backend. With ?async=1 the file is staged
+    locally and handed to a background job. Identical files already stored
+    for the department are returned instead of being uploaded again.
+    """
+
+    async def post(self, request):
+        logger.info('PDF upload request')
+        department_id, error = await authenticate(request)
+        if error:
+            return error
+
+        # Parsing the multipart body reads the spooled request from disk.
+        files, data = await sync_to_async(lambda: (request.FILES, request.POST))()
+        file = files.get('file')
+        note = data.get('note', '')
+        department = data.get('department', 'default')
+
+        if not file:
+            return JsonResponse({'error': 'File is required'}, status=400)
+
+        logger.info('File received: %s, size: %s', file.name, file.size)
+
+        if not file.name.lower().endswith('.pdf'):
+            return JsonResponse({'error': 'Only PDF files are allowed'}, status=400)
+
+        folder = f"timetable_pdfs/{department}"
+
+        if request.GET.get('async', '').lower() in ('1', 'true', 'yes'):
+            duplicate, job = await sync_to_async(uploads.stage_for_job)(file, folder, note, department_id)
+            if duplicate:
+                return duplicate_response(duplicate)
+            return job_status_response(request, job)
+
+        content_hash = await sync_to_async(uploads.hash_chunks, thread_sensitive=False)(file.chunks())
+        file.seek(0)
+        duplicate = await sync_to_async(uploads.find_duplicate)(department_id, content_hash)
+        if duplicate:
+            return duplicate_response(duplicate)
+
+        storage = get_storage()
+        try:
+            stored = await storage.aupload(file, folder, file.name)
+        except StorageError as e:
+            return JsonResponse({'error': str(e)}, status=500)
+        except Exception as e:
+            logger.exception('Storage exception: %s', e)
+            return JsonResponse({'error': f'Storage error: {str(e)}'}, status=500)
+
+        logger.info('Storage upload success: %s', stored.key)
+
+        try:
+            pdf = await ReferencePDF.objects.acreate(
+                department_id=department_id,
+                storage_backend=storage.name,
+                cloudinary_public_id=stored.key,
+                cloudinary_url=stored.url,
+                filename=file.name,
+                file_size=stored.size,
+                content_hash=content_hash,
+                note=note
+            )
+        except Exception as e:
+            logger.exception('Database error: %s', e)
+            await sync_to_async(storage.delete, thread_sensitive=False)(stored.key)
+            return JsonResponse({'error': f'Database error: {str(e)}'}, status=500)
+
+        return JsonResponse({
+            'status': 'success',
+            'id': str(pdf.id),
+            'url': stored.url,
+            'filename': file.name
+        }, status=201)
+
+
+class AsyncListPDFsView(View):
+    """List uploaded PDFs with backend proxy download URLs."""
+
+    async def get(self, request):
+        backend_base = request.build_absolute_uri('/api/v1/documents/')
+        data = [{
+            'id': str(pdf.id),
+            'filename': pdf.filename,
+            'url': f"{backend_base}download/{pdf.id}/",
+            'note': pdf.note,
+            'uploaded_at': pdf.uploaded_at.isoformat() if pdf.uploaded_at else None
+        } async for pdf in ReferencePDF.objects.order_by('-uploaded_at')]
+        return JsonResponse(data, safe=False)
+
+
+class AsyncDownloadPDFView(View):
+    """
+    Proxy download, as DownloadPDFView: local files come straight from disk,
+    remote ones are fetched through the pooled client, kept in the PDF cache
+    and served with ETag and Range support.
+    """
+
+    async def get(self, request, pdf_id):
+        pdf = await ReferencePDF.objects.filter(id=pdf_id).afirst()
+        if pdf is None:
+            return JsonResponse({'error': 'PDF not found'}, status=404)
+
+        storage = get_storage(pdf.storage_backend)
+        key = pdf.cloudinary_public_id
+
+        local_path = storage.local_path(key)
+        if local_path:
+            cached = CachedPDF(local_path, pdf.content_hash or pdf.id.hex, os.path.getsize(local_path))
+            return async_body(serve_cached_pdf(request, cached, pdf.filename))
+
+        if settings.DOCUMENT_DOWNLOAD_REDIRECT:
+            url = storage.presigned_url(key)
+            if url:
+                return HttpResponseRedirect(url)
+
+        cache = get_pdf_cache()
+        cached = cache.get(key) if cache else None
+        if cached:
+            return async_body(serve_cached_pdf(request, cached, pdf.filename))
+
+        try:
+            pdf_file, size = await storage.aopen(key)
+        except (UpstreamError, StorageError) as e:
+            return JsonResponse({'error': str(e)}, status=502)
+        except httpx.HTTPError as e:
+            return JsonResponse({'error': f'Storage request failed: {e}'}, status=502)
+        except EmptyArchive:
+            return JsonResponse({'error': 'Empty archive'}, status=500)
+
+        if cache:
+            try:
+                # The body is still being read from storage here.
+                with metrics.span('storage'):
+                    cached = await sync_to_async(cache.put_file, thread_sensitive=False)(key, pdf_file)
+            finally:
+                pdf_file.close()
+            return async_body(serve_cached_pdf(request, cached, pdf.filename))
+
+        resp = StreamingHttpResponse(_close_after(aiter_file(pdf_file), pdf_file), content_type='application/pdf')
+        resp['Content-Length'] = str(size)
+        resp['Content-Disposition'] = f'inline; filename="{pdf.filename}"'
+        resp['Access-Control-Allow-Origin'] = '*'
+        return resp
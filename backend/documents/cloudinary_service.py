@@ -1,3 +1,5 @@
+import logging
+
 import cloudinary
 import cloudinary.uploader
 import cloudinary.utils
@@ -11,6 +13,8 @@ cloudinary.config(
     secure=True
 )
 
+logger = logging.getLogger(__name__)
+
 class CloudinaryService:
     """Service for uploading files to Cloudinary."""
     
@@ -42,7 +46,7 @@ class CloudinaryService:
                 'bytes': result.get('bytes')
             }
         except Exception as e:
-            print(f"Cloudinary upload error: {e}")
+            logger.error('Cloudinary upload error: %s', e)
             return None
     
     def delete_file(self, public_id, resource_type="raw"):
@@ -51,7 +55,7 @@ class CloudinaryService:
             result = cloudinary.uploader.destroy(public_id, resource_type=resource_type)
             return result.get('result') == 'ok'
         except Exception as e:
-            print(f"Cloudinary delete error: {e}")
+            logger.error('Cloudinary delete error: %s', e)
             return False
     
     def get_download_url(self, public_id, resource_type="raw"):
@@ -67,5 +71,5 @@ class CloudinaryService:
             )
             return url
         except Exception as e:
-            print(f"Cloudinary download URL error: {e}")
+            logger.error('Cloudinary download URL error: %s', e)
             return None
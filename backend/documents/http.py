@@ -0,0 +1,101 @@
+"""
+Shared async HTTP client for talking to storage from the async document views.
+
+One httpx.AsyncClient per event loop keeps connections to Cloudinary/S3 alive
+between requests. Its pool caps the number of open connections
+(DOCUMENT_HTTP_MAX_CONNECTIONS); on top of that a semaphore per host
+(DOCUMENT_HTTP_PER_HOST) stops one slow upstream from taking every
+connection. Requests beyond either limit wait for a free slot instead of
+failing.
+"""
+import asyncio
+import tempfile
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .streaming import CHUNK_SIZE, UpstreamError
+
+# Keyed weakly so clients of loops that have finished (e.g. async_to_sync
+# under WSGI) don't pile up.
+_clients = weakref.WeakKeyDictionary()
+
+
+class _LoopState:
+    def __init__(self):
+        limits = httpx.Limits(
+            max_connections=getattr(settings, 'DOCUMENT_HTTP_MAX_CONNECTIONS', 200),
+            max_keepalive_connections=getattr(settings, 'DOCUMENT_HTTP_MAX_KEEPALIVE', 50),
+            keepalive_expiry=30,
+        )
+        # The pool timeout is how long a request may wait for a free connection.
+        timeout = httpx.Timeout(getattr(settings, 'DOCUMENT_HTTP_TIMEOUT', 30), pool=60)
+        self.client = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True)
+        self.per_host = getattr(settings, 'DOCUMENT_HTTP_PER_HOST', 50)
+        self.hosts = {}
+
+    def host_slot(self, url):
+        host = urlsplit(url).netloc
+        semaphore = self.hosts.get(host)
+        if semaphore is None:
+            semaphore = self.hosts[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+
+def _state():
+    loop = asyncio.get_running_loop()
+    state = _clients.get(loop)
+    if state is None or state.client.is_closed:
+        state = _clients[loop] = _LoopState()
+    return state
+
+
+def get_client():
+    """The pooled client for the running event loop."""
+    return _state().client
+
+
+async def request(method, url, **kwargs):
+    """A non-streaming request through the shared client, within the host's limit."""
+    state = _state()
+    async with state.host_slot(url):
+        return await state.client.request(method, url, **kwargs)
+
+
+async def fetch_to_spool(url):
+    """
+    Async counterpart of streaming.fetch_to_spool: download `url` in chunks
+    into a spooled temp file, rewound to the start.
+    """
+    spool = tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, 'PDF_PROXY_SPOOL_MAX_BYTES', 1024 * 1024)
+    )
+    state = _state()
+    try:
+        async with state.host_slot(url):
+            async with state.client.stream('GET', url) as upstream:
+                if upstream.status_code != 200:
+                    raise UpstreamError(upstream.status_code)
+                async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                    spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def aiter_file(fileobj):
+    """
+    Async iterator over a file object's chunks. Uploads and spools past
+    their memory limit are on disk, so reads run in a worker thread.
+    """
+    read = sync_to_async(fileobj.read, thread_sensitive=False)
+    while True:
+        chunk = await read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
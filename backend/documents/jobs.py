@@ -0,0 +1,41 @@
+"""Background job handlers for document operations (see jobs.queue)."""
+import os
+
+from jobs.queue import register
+
+from .models import ReferencePDF, UploadSession
+from .storage import get_storage
+from .uploads import find_duplicate
+
+
+@register('documents.upload', public=False)
+def upload_pdf(job, params):
+    """Push a staged PDF to the storage backend and register it."""
+    path = params['path']
+    department_id = params.get('department_id')
+    content_hash = params.get('content_hash', '')
+    try:
+        # An identical file may have been stored while this job was queued.
+        pdf = find_duplicate(department_id, content_hash)
+        duplicate = pdf is not None
+        if not duplicate:
+            job.progress(10, 'Uploading to storage')
+            storage = get_storage()
+            with open(path, 'rb') as f:
+                stored = storage.upload(f, params['folder'], params['filename'])
+            pdf = ReferencePDF.objects.create(
+                department_id=department_id,
+                storage_backend=storage.name,
+                cloudinary_public_id=stored.key,
+                cloudinary_url=stored.url,
+                filename=params['filename'],
+                file_size=stored.size,
+                content_hash=content_hash,
+                note=params.get('note', '')
+            )
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    if params.get('session'):
+        UploadSession.objects.filter(id=params['session']).update(status=UploadSession.DONE, pdf=pdf)
+    return {'id': str(pdf.id), 'url': pdf.cloudinary_url, 'filename': pdf.filename, 'duplicate': duplicate}
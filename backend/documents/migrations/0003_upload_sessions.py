@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:42
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0002_alter_referencepdf_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "department_id",
+                    models.UUIDField(blank=True, db_index=True, null=True),
+                ),
+                ("folder", models.CharField(max_length=255)),
+                ("filename", models.CharField(max_length=255)),
+                ("note", models.TextField(blank=True, default="")),
+                ("size", models.PositiveBigIntegerField()),
+                ("received", models.PositiveBigIntegerField(default=0)),
+                (
+                    "expected_hash",
+                    models.CharField(blank=True, default="", max_length=64),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("open", "Open"),
+                            ("queued", "Queued"),
+                            ("done", "Done"),
+                        ],
+                        default="open",
+                        max_length=10,
+                    ),
+                ),
+                ("job_id", models.UUIDField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="referencepdf",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="referencepdf",
+            index=models.Index(
+                fields=["department_id", "content_hash"],
+                name="documents_r_departm_08c9aa_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="uploadsession",
+            name="pdf",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="documents.referencepdf",
+            ),
+        ),
+    ]
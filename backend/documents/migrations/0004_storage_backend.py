@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0003_upload_sessions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referencepdf",
+            name="storage_backend",
+            field=models.CharField(default="cloudinary", max_length=20),
+        ),
+        migrations.AlterField(
+            model_name="referencepdf",
+            name="cloudinary_url",
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
@@ -6,12 +6,16 @@ class ReferencePDF(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     department_id = models.UUIDField(null=True, blank=True, db_index=True)
     
-    # Cloudinary fields
+    # Storage key and URL in `storage_backend` (named for the original,
+    # Cloudinary-only storage; see documents.storage).
+    storage_backend = models.CharField(max_length=20, default='cloudinary')
     cloudinary_public_id = models.CharField(max_length=255)
-    cloudinary_url = models.URLField(max_length=500)
+    cloudinary_url = models.URLField(max_length=500, blank=True)
     
     filename = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField(default=0)
+    # SHA-256 of the file, used to store identical uploads once per department.
+    content_hash = models.CharField(max_length=64, blank=True, default='')
     note = models.TextField(blank=True, default='')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
@@ -19,6 +23,48 @@ class ReferencePDF(models.Model):
         ordering = ['-uploaded_at']
         verbose_name = 'Reference PDF'
         verbose_name_plural = 'Reference PDFs'
+        indexes = [
+            models.Index(fields=['department_id', 'content_hash']),
+        ]
     
     def __str__(self):
         return f"{self.filename} ({self.uploaded_at})"
+
+
+class UploadSession(models.Model):
+    """
+    A chunked, resumable PDF upload (see documents.uploads).
+
+    Chunks are appended to a staging file until `received` reaches `size`;
+    completing the session hashes the file and either points at an identical
+    ReferencePDF or queues the upload to cloud storage.
+    """
+    OPEN = 'open'
+    QUEUED = 'queued'
+    DONE = 'done'
+    STATUSES = [
+        (OPEN, 'Open'),
+        (QUEUED, 'Queued'),
+        (DONE, 'Done'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    department_id = models.UUIDField(null=True, blank=True, db_index=True)
+    folder = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    note = models.TextField(blank=True, default='')
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # Optional client-supplied SHA-256, checked on completion.
+    expected_hash = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUSES, default=OPEN)
+    job_id = models.UUIDField(null=True, blank=True)
+    pdf = models.ForeignKey(ReferencePDF, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
@@ -0,0 +1,266 @@
+"""
+Disk-backed, content-addressed cache for proxied PDFs.
+
+Layout under PDF_CACHE_DIR::
+
+    objects/ab/ab12...ef.pdf    PDF bytes, named by SHA-256 of the content
+    refs/<sha1 of public_id>    text file holding the content hash
+    tmp/                        in-flight writes, renamed into place
+
+Several public ids with identical content share one object. Objects are
+evicted least-recently-used first (by mtime, refreshed on every hit) once
+the cache grows past PDF_CACHE_MAX_BYTES, by this or any other process, so
+get() and put_stream() hand back a file already open on the content: an
+object removed before it is served (or one larger than the cache, which
+evicts itself) is still read from that handle.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+CHUNK_SIZE = 64 * 1024
+
+
+class CachedPDF:
+    """A PDF on disk; `fileobj`, if given, is an open handle on its content."""
+
+    def __init__(self, path, content_hash, size, fileobj=None):
+        self.path = path
+        self.content_hash = content_hash
+        self.size = size
+        self.fileobj = fileobj
+
+    @property
+    def etag(self):
+        return f'"{self.content_hash}"'
+
+    def open(self):
+        """The content as a binary file, which the caller closes."""
+        if self.fileobj is not None:
+            fileobj, self.fileobj = self.fileobj, None
+            return fileobj
+        return open(self.path, 'rb')
+
+    def close(self):
+        if self.fileobj is not None:
+            self.fileobj.close()
+            self.fileobj = None
+
+
+class PDFCache:
+    def __init__(self, root, max_bytes):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _ref_path(self, public_id):
+        name = hashlib.sha1(public_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'refs', name)
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.root, 'objects', content_hash[:2], f'{content_hash}.pdf')
+
+    def get(self, public_id):
+        """Return the CachedPDF for a public id, open on its content, or None on a miss."""
+        try:
+            with open(self._ref_path(public_id)) as f:
+                content_hash = f.read().strip()
+            path = self._object_path(content_hash)
+            fileobj = open(path, 'rb')
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # Mark as recently used.
+        except OSError:
+            pass  # Evicted since it was opened; the handle still reads it.
+        return CachedPDF(path, content_hash, os.fstat(fileobj.fileno()).st_size, fileobj)
+
+    def put_stream(self, public_id, chunks):
+        """
+        Store an iterable of byte chunks for a public id, hashing as it
+        writes. The CachedPDF returned is open on the copy just written.
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            fileobj = open(tmp_path, 'rb')
+            try:
+                cached = self._commit(public_id, tmp_path, digest.hexdigest(), size)
+            except BaseException:
+                fileobj.close()
+                raise
+            cached.fileobj = fileobj
+            return cached
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_file(self, public_id, fileobj):
+        """Store the remaining contents of a binary file object."""
+        return self.put_stream(public_id, iter(lambda: fileobj.read(CHUNK_SIZE), b''))
+
+    def _commit(self, public_id, tmp_path, content_hash, size):
+        path = self._object_path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+
+        ref_path = self._ref_path(public_id)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        fd, tmp_ref = tempfile.mkstemp(dir=os.path.dirname(ref_path))
+        with os.fdopen(fd, 'w') as f:
+            f.write(content_hash)
+        os.replace(tmp_ref, ref_path)
+
+        self.evict()
+        return CachedPDF(path, content_hash, size)
+
+    def invalidate(self, public_id):
+        try:
+            os.remove(self._ref_path(public_id))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Delete least-recently-used objects until the cache fits max_bytes."""
+        with self._lock:
+            objects = []
+            total = 0
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, 'objects')):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    objects.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            objects.sort()
+            for _, size, path in objects:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            # Refs to evicted objects are left behind; get() treats them as misses.
+
+
+_cache = None
+
+
+def get_pdf_cache():
+    """The process-wide cache, or None when PDF_CACHE_ENABLED is off."""
+    global _cache
+    if not getattr(settings, 'PDF_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        _cache = PDFCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
+    return _cache
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(header, size):
+    """
+    Parse a Range header into (start, end) inclusive. None means the header
+    is ignored and the whole file served: it is malformed or asks for several
+    ranges. A single well-formed range outside the file raises
+    RangeNotSatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _file_range(f, start, length):
+    with f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_cached_pdf(request, cached, filename):
+    """
+    Serve a cached PDF with ETag/If-None-Match and single-range support.
+    Malformed and multi-range Range headers get the whole file.
+
+    Full responses use FileResponse so the WSGI server can sendfile().
+    """
+    if_none_match = request.headers.get('If-None-Match', '')
+    if cached.etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        cached.close()
+        resp = HttpResponseNotModified()
+        resp['ETag'] = cached.etag
+        return resp
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range.strip() == cached.etag):
+        try:
+            byte_range = _parse_range(range_header, cached.size)
+        except RangeNotSatisfiable:
+            cached.close()
+            resp = HttpResponse(status=416)
+            resp['Content-Range'] = f'bytes */{cached.size}'
+            return resp
+
+    if byte_range:
+        start, end = byte_range
+        resp = StreamingHttpResponse(
+            _file_range(cached.open(), start, end - start + 1),
+            status=206,
+            content_type='application/pdf'
+        )
+        resp['Content-Range'] = f'bytes {start}-{end}/{cached.size}'
+        resp['Content-Length'] = str(end - start + 1)
+    else:
+        resp = FileResponse(cached.open(), content_type='application/pdf')
+
+    resp['ETag'] = cached.etag
+    resp['Accept-Ranges'] = 'bytes'
+    resp['Content-Disposition'] = f'inline; filename="{filename}"'
+    resp['Access-Control-Allow-Origin'] = '*'
+    return resp
@@ -1,7 +1,11 @@
+import logging
+
 import boto3
 from django.conf import settings
 from botocore.exceptions import ClientError
 
+logger = logging.getLogger(__name__)
+
 def generate_presigned_url(s3_client, bucket_name, object_name, expiration=3600):
     try:
         response = s3_client.generate_presigned_url('put_object',
@@ -9,7 +13,7 @@ def generate_presigned_url(s3_client, bucket_name, object_name, expiration=3600)
                                                             'Key': object_name},
                                                     ExpiresIn=expiration)
     except ClientError as e:
-        print(e)
+        logger.error('Presigned URL error: %s', e)
         return None
     return response
 
@@ -19,7 +23,8 @@ class S3Service:
             's3',
             aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
             aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
-            region_name=getattr(settings, 'AWS_S3_REGION_NAME', 'us-east-1')
+            region_name=getattr(settings, 'AWS_S3_REGION_NAME', 'us-east-1'),
+            endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None) or None
         )
         self.bucket_name = getattr(settings, 'AWS_STORAGE_BUCKET_NAME', 'timetable-input-bucket')
 
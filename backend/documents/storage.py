@@ -0,0 +1,398 @@
+"""
+Where uploaded PDFs live.
+
+Every backend offers the same four operations:
+
+    upload(fileobj, folder, filename) -> StoredFile(key, url, size)
+    delete(key) -> bool
+    open(key) -> (readable file object, size); the caller closes it
+    presigned_url(key, expires) -> time-limited download URL, or None
+
+Backends that clients can upload to directly also implement
+presigned_upload(key, expires), the request the client should make, and
+stat(key), the size of a stored object (None if it is missing). Then there is
+local_path(key), which is only set for files on this machine so they
+can be served straight from disk (FileResponse hands them to sendfile()).
+
+The async views use aupload() and aopen(), which go through the shared
+pooled client in documents.http wherever the backend can hand out a
+presigned request, and run the blocking call in a thread otherwise.
+
+DOCUMENT_STORAGE_BACKEND picks the backend new uploads go to. Each
+ReferencePDF records the backend it was stored with, so switching a
+deployment keeps older documents readable.
+"""
+import functools
+import inspect
+import logging
+import os
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.text import get_valid_filename
+
+from core import metrics
+
+from .streaming import fetch_to_spool, open_pdf
+
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def upstream(method):
+    """Count a backend method's time towards the request's storage metrics."""
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            with metrics.span('storage'):
+                return await method(*args, **kwargs)
+    else:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with metrics.span('storage'):
+                return method(*args, **kwargs)
+    return wrapper
+
+
+class StorageError(Exception):
+    pass
+
+
+class StoredFile:
+    def __init__(self, key, url, size):
+        self.key = key
+        self.url = url
+        self.size = size
+
+
+class StreamHandle:
+    """A readable stream that closes the objects it was read through."""
+
+    def __init__(self, fileobj, *closables):
+        self.fileobj = fileobj
+        self.closables = closables
+
+    def read(self, size=-1):
+        return self.fileobj.read(size)
+
+    def close(self):
+        self.fileobj.close()
+        for closable in self.closables:
+            closable.close()
+
+
+def new_key(folder, filename):
+    return f'{folder}/{uuid.uuid4().hex}/{get_valid_filename(filename)}'
+
+
+def _size_of(fileobj):
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell() - position
+    fileobj.seek(position)
+    return size
+
+
+class StorageBackend:
+    name = None
+
+    def upload(self, fileobj, folder, filename):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def open(self, key):
+        raise NotImplementedError
+
+    def presigned_url(self, key, expires=3600):
+        return None
+
+    def presigned_upload(self, key, expires=3600):
+        return None
+
+    def stat(self, key):
+        raise NotImplementedError
+
+    def url(self, key):
+        raise NotImplementedError
+
+    def local_path(self, key):
+        return None
+
+    async def aupload(self, fileobj, folder, filename):
+        key = new_key(folder, filename)
+        upload = self.presigned_upload(key)
+        if upload is None:
+            return await sync_to_async(self.upload, thread_sensitive=False)(fileobj, folder, filename)
+        return await self._send_upload(upload, key, fileobj, filename)
+
+    async def _send_upload(self, upload, key, fileobj, filename):
+        raise NotImplementedError
+
+    async def aopen(self, key):
+        return await sync_to_async(self.open, thread_sensitive=False)(key)
+
+
+class CloudinaryStorage(StorageBackend):
+    """Raw uploads on Cloudinary, read back through the archive API."""
+    name = 'cloudinary'
+
+    def __init__(self):
+        from .cloudinary_service import CloudinaryService
+
+        self.service = CloudinaryService()
+
+    @upstream
+    def upload(self, fileobj, folder, filename):
+        result = self.service.upload_file(fileobj, folder=folder, resource_type="raw")
+        if not result:
+            raise StorageError('Failed to upload to cloud storage.')
+        return StoredFile(result['public_id'], result['url'], result.get('bytes') or 0)
+
+    @upstream
+    def delete(self, key):
+        return self.service.delete_file(key, resource_type="raw")
+
+    @upstream
+    def open(self, key):
+        download_url = self.service.get_download_url(key)
+        if not download_url:
+            raise StorageError('Could not generate download URL')
+        spool = fetch_to_spool(download_url, timeout=30)
+        try:
+            pdf_file, size = open_pdf(spool)
+        except Exception:
+            spool.close()
+            raise
+        return StreamHandle(pdf_file, spool), size
+
+    def presigned_upload(self, key, expires=3600):
+        """A signed upload: the client POSTs the file as multipart `file` with these fields."""
+        import cloudinary
+        import cloudinary.utils
+
+        config = cloudinary.config()
+        if not config.api_secret:
+            raise StorageError('Cloudinary credentials are not configured.')
+        params = {'public_id': key, 'timestamp': int(time.time())}
+        params['signature'] = cloudinary.utils.api_sign_request(params, config.api_secret)
+        params['api_key'] = config.api_key
+        return {
+            'method': 'POST',
+            'url': cloudinary.utils.cloudinary_api_url('upload', resource_type='raw'),
+            'fields': params,
+        }
+
+    @upstream
+    def stat(self, key):
+        import cloudinary.api
+        from cloudinary.exceptions import NotFound
+
+        try:
+            return cloudinary.api.resource(key, resource_type='raw')['bytes']
+        except NotFound:
+            return None
+
+    @upstream
+    async def _send_upload(self, upload, key, fileobj, filename):
+        from . import http
+
+        resp = await http.request(
+            'POST', upload['url'], data=upload['fields'],
+            files={'file': (filename, fileobj.read(), 'application/pdf')},
+        )
+        if resp.status_code != 200:
+            raise StorageError(f'Cloudinary upload failed ({resp.status_code}).')
+        result = resp.json()
+        return StoredFile(result['public_id'], result.get('secure_url', ''), result.get('bytes') or 0)
+
+    @upstream
+    async def aopen(self, key):
+        from . import http
+
+        download_url = self.service.get_download_url(key)
+        if not download_url:
+            raise StorageError('Could not generate download URL')
+        spool = await http.fetch_to_spool(download_url)
+        try:
+            pdf_file, size = open_pdf(spool)
+        except Exception:
+            spool.close()
+            raise
+        return StreamHandle(pdf_file, spool), size
+
+    def url(self, key):
+        import cloudinary.utils
+
+        return cloudinary.utils.cloudinary_url(key, resource_type='raw', secure=True)[0]
+
+
+class S3Storage(StorageBackend):
+    """
+    An S3 bucket. AWS_S3_ENDPOINT_URL points it at any S3-compatible
+    server (MinIO, moto) for local runs and tests.
+    """
+    name = 's3'
+
+    def __init__(self):
+        from .services import S3Service
+
+        service = S3Service()
+        self.client = service.s3_client
+        self.bucket = service.bucket_name
+
+    @upstream
+    def upload(self, fileobj, folder, filename):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        key = new_key(folder, filename)
+        size = _size_of(fileobj)
+        try:
+            self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs={'ContentType': 'application/pdf'})
+        except (BotoCoreError, ClientError) as e:
+            raise StorageError(f'S3 upload failed: {e}')
+        return StoredFile(key, self.url(key), size)
+
+    @upstream
+    def delete(self, key):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except (BotoCoreError, ClientError) as e:
+            logger.warning('S3 delete error: %s', e)
+            return False
+        return True
+
+    @upstream
+    def open(self, key):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key)
+        except (BotoCoreError, ClientError) as e:
+            raise StorageError(f'S3 download failed: {e}')
+        return obj['Body'], obj['ContentLength']
+
+    def presigned_url(self, key, expires=3600):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=expires
+        )
+
+    def presigned_upload(self, key, expires=3600):
+        """A presigned PUT: the client sends the file as the raw request body."""
+        from .services import generate_presigned_url
+
+        url = generate_presigned_url(self.client, self.bucket, key, expiration=expires)
+        return {'method': 'PUT', 'url': url} if url else None
+
+    @upstream
+    def stat(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise StorageError(f'S3 lookup failed: {e}')
+
+    def url(self, key):
+        return f'{self.client.meta.endpoint_url}/{self.bucket}/{key}'
+
+    @upstream
+    async def _send_upload(self, upload, key, fileobj, filename):
+        from . import http
+
+        size = _size_of(fileobj)
+        resp = await http.request(
+            upload['method'], upload['url'], content=http.aiter_file(fileobj),
+            headers={'Content-Length': str(size), 'Content-Type': 'application/pdf'},
+        )
+        if resp.status_code != 200:
+            raise StorageError(f'S3 upload failed ({resp.status_code}).')
+        return StoredFile(key, self.url(key), size)
+
+    @upstream
+    async def aopen(self, key):
+        from . import http
+
+        spool = await http.fetch_to_spool(self.presigned_url(key))
+        size = _size_of(spool)
+        return spool, size
+
+
+class LocalStorage(StorageBackend):
+    """Files under DOCUMENT_STORAGE_ROOT on this machine."""
+    name = 'local'
+
+    def __init__(self):
+        self.root = os.path.realpath(settings.DOCUMENT_STORAGE_ROOT)
+
+    def _path(self, key):
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise StorageError('Invalid storage key.')
+        return path
+
+    def upload(self, fileobj, folder, filename):
+        key = new_key(folder, filename)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = 0
+        with open(path, 'wb') as out:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+                out.write(chunk)
+                size += len(chunk)
+        return StoredFile(key, self.url(key), size)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            return False
+        return True
+
+    def open(self, key):
+        path = self._path(key)
+        try:
+            return open(path, 'rb'), os.path.getsize(path)
+        except OSError as e:
+            raise StorageError(f'Stored file is missing: {e}')
+
+    def stat(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def url(self, key):
+        base_url = getattr(settings, 'DOCUMENT_STORAGE_BASE_URL', '')
+        return f'{base_url.rstrip("/")}/{key}' if base_url else ''
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+
+BACKENDS = {
+    CloudinaryStorage.name: CloudinaryStorage,
+    S3Storage.name: S3Storage,
+    LocalStorage.name: LocalStorage,
+}
+
+_backends = {}
+
+
+def get_storage(name=None):
+    """The backend called `name`, or the deployment's DOCUMENT_STORAGE_BACKEND."""
+    name = name or getattr(settings, 'DOCUMENT_STORAGE_BACKEND', CloudinaryStorage.name)
+    if name not in BACKENDS:
+        raise StorageError(f'Unknown storage backend: {name}')
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
@@ -0,0 +1,78 @@
+"""
+Constant-memory helpers for the PDF download proxy.
+
+The upstream archive is fetched in chunks into a SpooledTemporaryFile
+(memory up to PDF_PROXY_SPOOL_MAX_BYTES, disk beyond that) and the PDF
+member is decompressed on the fly, so peak memory per download does not
+depend on the size of the file.
+"""
+import tempfile
+import zipfile
+
+import requests as http_requests
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'Cloudinary returned {status_code}')
+        self.status_code = status_code
+
+
+class EmptyArchive(Exception):
+    pass
+
+
+def fetch_to_spool(url, timeout=30):
+    """Download `url` in chunks into a spooled temp file, rewound to the start."""
+    spool = tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, 'PDF_PROXY_SPOOL_MAX_BYTES', 1024 * 1024)
+    )
+    try:
+        with http_requests.get(url, stream=True, timeout=timeout) as upstream:
+            if upstream.status_code != 200:
+                raise UpstreamError(upstream.status_code)
+            for chunk in upstream.iter_content(CHUNK_SIZE):
+                spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def open_pdf(spool):
+    """
+    Return (fileobj, size) for the PDF inside a spooled archive.
+
+    The archive API wraps the file in a zip; the first member is opened as a
+    decompressing stream. Anything that is not a zip is taken to be the raw PDF.
+    """
+    try:
+        archive = zipfile.ZipFile(spool, 'r')
+    except zipfile.BadZipFile:
+        spool.seek(0, 2)
+        size = spool.tell()
+        spool.seek(0)
+        return spool, size
+    members = archive.infolist()
+    if not members:
+        archive.close()
+        raise EmptyArchive('Empty archive')
+    return archive.open(members[0]), members[0].file_size
+
+
+def iter_chunks(fileobj, *closables):
+    """Yield fixed-size chunks from fileobj, closing everything when done."""
+    try:
+        while True:
+            chunk = fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+        for closable in closables:
+            closable.close()
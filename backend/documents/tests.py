@@ -1,3 +1,416 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from contextlib import closing
+from unittest import mock
 
-# Create your tests here.
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+
+from benchmarks.fake_storage import FakeS3Server
+
+from . import http, pdf_cache, storage, uploads
+from .async_views import AsyncDownloadPDFView
+from .models import ReferencePDF, UploadSession
+from .pdf_cache import PDFCache, serve_cached_pdf
+from .storage import CloudinaryStorage, LocalStorage, S3Storage, StorageError
+from .streaming import EmptyArchive
+from .views import DownloadPDFView
+
+BUCKET = 'test-bucket'
+
+
+class FakeS3Fixture:
+    """S3Storage and the PDF cache pointed at a FakeS3Server for each test."""
+    latency = 0.0
+
+    def setUp(self):
+        self.server = FakeS3Server(latency=self.latency).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        overrides = override_settings(
+            AWS_S3_ENDPOINT_URL=self.server.url, AWS_STORAGE_BUCKET_NAME=BUCKET,
+            AWS_ACCESS_KEY_ID='test', AWS_SECRET_ACCESS_KEY='test',
+            DOCUMENT_DOWNLOAD_REDIRECT=False, PDF_CACHE_DIR=cache_dir.name,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Both are process-wide; rebuild them for this server.
+        self.addCleanup(self.reset)
+        self.reset()
+
+    def reset(self):
+        storage._backends.pop('s3', None)
+        pdf_cache._cache = None
+
+
+class AsyncDownloadTests(FakeS3Fixture, TestCase):
+    latency = 0.05
+
+    # The URLconf routes the sync views outside the ASGI process, so these
+    # call the async view directly.
+    async def download(self, pdf):
+        return await AsyncDownloadPDFView.as_view()(AsyncRequestFactory().get('/'), pdf_id=pdf.id)
+
+    def test_sync_views_are_routed_by_default(self):
+        match = resolve('/api/v1/documents/download/00000000-0000-0000-0000-000000000000/')
+        self.assertIs(match.func.view_class, DownloadPDFView)
+
+    @override_settings(PDF_CACHE_ENABLED=False)
+    async def test_download_is_proxied_from_storage(self):
+        data = b'%PDF-1.4 ' + b'x' * 200_000
+        pdf = await ReferencePDF.objects.acreate(
+            storage_backend='s3', cloudinary_public_id='big.pdf', filename='big.pdf', file_size=len(data),
+        )
+        self.server.put(BUCKET, 'big.pdf', data)
+
+        resp = await self.download(pdf)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Length'], str(len(data)))
+        self.assertEqual(b''.join([chunk async for chunk in resp.streaming_content]), data)
+
+    async def test_cached_download_does_not_touch_storage(self):
+        pdf = await ReferencePDF.objects.acreate(
+            storage_backend='s3', cloudinary_public_id='a.pdf', filename='a.pdf', file_size=13,
+        )
+        self.server.put(BUCKET, 'a.pdf', b'%PDF-1.4 test')
+        first = await self.download(pdf)
+        requests = self.server.requests
+        second = await self.download(pdf)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(b''.join([chunk async for chunk in second.streaming_content]), b'%PDF-1.4 test')
+        self.assertEqual(self.server.requests, requests)
+
+    @override_settings(PDF_CACHE_ENABLED=False, DOCUMENT_HTTP_PER_HOST=2)
+    async def test_concurrent_downloads_wait_for_a_host_slot(self):
+        pdfs = []
+        for n in range(8):
+            self.server.put(BUCKET, f'{n}.pdf', b'%PDF-1.4 ' + bytes([n]))
+            pdfs.append(await ReferencePDF.objects.acreate(
+                storage_backend='s3', cloudinary_public_id=f'{n}.pdf', filename=f'{n}.pdf',
+            ))
+        responses = await asyncio.gather(*(self.download(pdf) for pdf in pdfs))
+        self.assertEqual([resp.status_code for resp in responses], [200] * 8)
+        self.assertEqual(self.server.requests, 8)
+
+    async def test_missing_object_is_a_bad_gateway(self):
+        pdf = await ReferencePDF.objects.acreate(
+            storage_backend='s3', cloudinary_public_id='gone.pdf', filename='gone.pdf',
+        )
+        resp = await self.download(pdf)
+        self.assertEqual(resp.status_code, 502)
+
+
+class S3StorageTests(FakeS3Fixture, TestCase):
+    def test_round_trip(self):
+        backend = S3Storage()
+        stored = backend.upload(io.BytesIO(b'%PDF-1.4 hello'), 'dept', 'a.pdf')
+        self.assertTrue(stored.key.startswith('dept/') and stored.key.endswith('/a.pdf'))
+        self.assertEqual(stored.size, 14)
+        self.assertEqual(backend.stat(stored.key), 14)
+
+        fileobj, size = backend.open(stored.key)
+        with closing(fileobj):
+            self.assertEqual((fileobj.read(), size), (b'%PDF-1.4 hello', 14))
+
+        self.assertTrue(backend.delete(stored.key))
+        self.assertIsNone(backend.stat(stored.key))
+        with self.assertRaises(StorageError):
+            backend.open(stored.key)
+
+    def test_async_round_trip_uses_presigned_requests(self):
+        backend = S3Storage()
+
+        async def round_trip():
+            stored = await backend.aupload(io.BytesIO(b'%PDF-1.4 async'), 'dept', 'a.pdf')
+            fileobj, size = await backend.aopen(stored.key)
+            with closing(fileobj):
+                return stored, fileobj.read(), size
+
+        stored, data, size = asyncio.run(round_trip())
+        self.assertEqual((data, size, stored.size), (b'%PDF-1.4 async', 14, 14))
+
+    @override_settings(PDF_CACHE_ENABLED=False)
+    def test_sync_download_view_proxies_the_object(self):
+        self.server.put(BUCKET, 'a.pdf', b'%PDF-1.4 sync')
+        pdf = ReferencePDF.objects.create(storage_backend='s3', cloudinary_public_id='a.pdf', filename='a.pdf')
+        resp = DownloadPDFView.as_view()(RequestFactory().get('/'), pdf_id=pdf.id)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), b'%PDF-1.4 sync')
+
+    @override_settings(PDF_CACHE_ENABLED=False)
+    def test_wsgi_download_is_streamed_in_chunks(self):
+        data = b'%PDF-1.4 ' + b'x' * 200_000
+        self.server.put(BUCKET, 'big.pdf', data)
+        pdf = ReferencePDF.objects.create(storage_backend='s3', cloudinary_public_id='big.pdf', filename='big.pdf')
+        resp = Client().get(f'/api/v1/documents/download/{pdf.id}/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertFalse(resp.is_async)
+        chunks = list(resp.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), data)
+
+
+class LocalStorageTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        overrides = override_settings(DOCUMENT_STORAGE_ROOT=root.name, DOCUMENT_STORAGE_BASE_URL='')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(storage._backends.pop, 'local', None)
+        storage._backends.pop('local', None)
+        self.backend = LocalStorage()
+
+    def test_round_trip(self):
+        stored = self.backend.upload(io.BytesIO(b'%PDF-1.4 local'), 'dept', 'a.pdf')
+        path = self.backend.local_path(stored.key)
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(self.backend.stat(stored.key), 14)
+        fileobj, size = self.backend.open(stored.key)
+        with closing(fileobj):
+            self.assertEqual((fileobj.read(), size), (b'%PDF-1.4 local', 14))
+
+        self.assertTrue(self.backend.delete(stored.key))
+        self.assertIsNone(self.backend.local_path(stored.key))
+        self.assertIsNone(self.backend.stat(stored.key))
+
+    def test_keys_cannot_leave_the_root(self):
+        for key in ['../outside.pdf', '/etc/passwd', 'dept/../../outside.pdf']:
+            with self.subTest(key), self.assertRaises(StorageError):
+                self.backend.open(key)
+
+    def test_direct_upload_completion_records_the_hash(self):
+        data = b'%PDF-1.4 direct'
+
+        def complete(key):
+            token = uploads.sign_direct_upload({
+                'backend': 'local', 'key': key, 'filename': 'a.pdf', 'note': '', 'department_id': None,
+            })
+            return Client().post('/api/v1/documents/direct/complete/', {'token': token}, content_type='application/json')
+
+        first = self.backend.upload(io.BytesIO(data), 'dept', 'a.pdf')
+        resp = complete(first.key)
+        self.assertEqual(resp.status_code, 201)
+        pdf = ReferencePDF.objects.get(id=resp.json()['id'])
+        self.assertEqual(pdf.content_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(complete(first.key).json()['id'], str(pdf.id))
+
+        # The same file uploaded again is deduplicated against the first.
+        second = self.backend.upload(io.BytesIO(data), 'dept', 'b.pdf')
+        resp = complete(second.key)
+        self.assertEqual((resp.status_code, resp.json()['status'], resp.json()['id']), (200, 'duplicate', str(pdf.id)))
+        self.assertIsNone(self.backend.stat(second.key))
+        self.assertEqual(ReferencePDF.objects.count(), 1)
+
+    def test_download_is_served_from_disk_with_ranges(self):
+        stored = self.backend.upload(io.BytesIO(b'%PDF-1.4 local'), 'dept', 'a.pdf')
+        pdf = ReferencePDF.objects.create(
+            storage_backend='local', cloudinary_public_id=stored.key, filename='a.pdf', content_hash='abc',
+        )
+        view = DownloadPDFView.as_view()
+        resp = view(RequestFactory().get('/', headers={'Range': 'bytes=0-3'}), pdf_id=pdf.id)
+        self.assertEqual((resp.status_code, b''.join(resp.streaming_content)), (206, b'%PDF'))
+        resp = view(RequestFactory().get('/', headers={'If-None-Match': '"abc"'}), pdf_id=pdf.id)
+        self.assertEqual(resp.status_code, 304)
+
+
+class CloudinaryStorageTests(FakeS3Fixture, TestCase):
+    """The archive download is served by the stand-in server; the SDK calls are mocked."""
+
+    def setUp(self):
+        super().setUp()
+        self.backend = CloudinaryStorage()
+        url = mock.patch.object(
+            self.backend.service, 'get_download_url', side_effect=lambda key: f'{self.server.url}/{BUCKET}/{key}',
+        )
+        url.start()
+        self.addCleanup(url.stop)
+
+    def archive(self, key, *members):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as archive:
+            for name, content in members:
+                archive.writestr(name, content)
+        self.server.put(BUCKET, key, data.getvalue())
+
+    def test_open_extracts_the_pdf_from_the_archive(self):
+        self.archive('a', ('a.pdf', b'%PDF-1.4 zipped'))
+        fileobj, size = self.backend.open('a')
+        with closing(fileobj):
+            self.assertEqual((fileobj.read(), size), (b'%PDF-1.4 zipped', 15))
+
+        fileobj, size = asyncio.run(self.backend.aopen('a'))
+        with closing(fileobj):
+            self.assertEqual(fileobj.read(), b'%PDF-1.4 zipped')
+
+    def test_raw_files_and_empty_archives(self):
+        self.server.put(BUCKET, 'raw', b'%PDF-1.4 raw')
+        fileobj, size = self.backend.open('raw')
+        with closing(fileobj):
+            self.assertEqual((fileobj.read(), size), (b'%PDF-1.4 raw', 12))
+
+        self.archive('empty')
+        with self.assertRaises(EmptyArchive):
+            self.backend.open('empty')
+
+    def test_upload_reports_the_stored_file(self):
+        result = {'public_id': 'dept/a', 'url': 'https://cdn.test/dept/a', 'bytes': 14}
+        with mock.patch.object(self.backend.service, 'upload_file', return_value=result) as upload:
+            stored = self.backend.upload(io.BytesIO(b'%PDF-1.4 hello'), 'dept', 'a.pdf')
+        self.assertEqual((stored.key, stored.url, stored.size), ('dept/a', 'https://cdn.test/dept/a', 14))
+        self.assertEqual(upload.call_args.kwargs['folder'], 'dept')
+
+        with mock.patch.object(self.backend.service, 'upload_file', return_value=None):
+            with self.assertRaises(StorageError):
+                self.backend.upload(io.BytesIO(b''), 'dept', 'a.pdf')
+
+
+class AiterFileTests(TestCase):
+    async def test_reads_run_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        readers = set()
+
+        class Recording(io.BytesIO):
+            def read(self, size=-1):
+                readers.add(threading.get_ident())
+                return super().read(size)
+
+        data = b'x' * (http.CHUNK_SIZE * 2 + 1)
+        chunks = [chunk async for chunk in http.aiter_file(Recording(data))]
+        self.assertEqual(b''.join(chunks), data)
+        self.assertNotIn(loop_thread, readers)
+
+
+class UploadSessionTests(TestCase):
+    data = b'%PDF-1.4 ' + b'x' * 91
+
+    def setUp(self):
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        overrides = override_settings(UPLOAD_STAGING_DIR=staging.name, PDF_MAX_BYTES=1000)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = Client()
+
+    def start(self, **fields):
+        body = dict({'filename': 'a.pdf', 'size': len(self.data)}, **fields)
+        return self.client.post('/api/v1/documents/uploads/', body, content_type='application/json')
+
+    def put(self, session_id, offset, chunk):
+        return self.client.put(
+            f'/api/v1/documents/uploads/{session_id}/', chunk, content_type='application/octet-stream',
+            headers={'Upload-Offset': str(offset)},
+        )
+
+    def staged(self, session_id):
+        with open(uploads.staging_path(UploadSession.objects.get(id=session_id)), 'rb') as f:
+            return f.read()
+
+    def test_upload_resumes_from_the_reported_offset(self):
+        session_id = self.start().json()['id']
+        self.assertEqual(self.put(session_id, 0, self.data[:40])['Upload-Offset'], '40')
+        # The connection dropped; ask where to carry on.
+        resumed = self.client.get(f'/api/v1/documents/uploads/{session_id}/')
+        self.assertEqual(resumed.json()['offset'], 40)
+        self.assertEqual(self.put(session_id, 40, self.data[40:]).json()['offset'], len(self.data))
+
+        resp = self.client.post(f'/api/v1/documents/uploads/{session_id}/complete/')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(UploadSession.objects.get(id=session_id).status, UploadSession.QUEUED)
+        self.assertEqual(self.staged(session_id), self.data)
+
+    def test_wrong_offset_is_a_conflict(self):
+        session_id = self.start().json()['id']
+        self.put(session_id, 0, self.data[:40])
+        resp = self.put(session_id, 10, self.data[10:50])
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp['Upload-Offset'], '40')
+
+    def test_a_writer_that_loses_the_race_does_not_write(self):
+        session_id = self.start().json()['id']
+        stale = UploadSession.objects.get(id=session_id)
+        self.put(session_id, 0, self.data[:40])
+        with self.assertRaises(uploads.UploadError) as caught:
+            uploads.append(stale, 0, io.BytesIO(b'%PDF-9.9 ' + b'y' * 31), 40)
+        self.assertEqual(caught.exception.offset, 40)
+        self.assertEqual(self.staged(session_id)[:40], self.data[:40])
+
+    def test_a_short_chunk_gives_its_range_back(self):
+        session_id = self.start().json()['id']
+        session = UploadSession.objects.get(id=session_id)
+        with self.assertRaises(uploads.UploadError):
+            uploads.append(session, 0, io.BytesIO(self.data[:30]), 40)
+        self.assertEqual(UploadSession.objects.get(id=session_id).received, 0)
+        self.assertEqual(self.put(session_id, 0, self.data[:40]).status_code, 200)
+
+    def test_sessions_are_capped_at_pdf_max_bytes(self):
+        resp = self.start(size=1001)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(UploadSession.objects.count(), 0)
+
+    def test_identical_pdfs_are_stored_once(self):
+        content_hash = hashlib.sha256(self.data).hexdigest()
+        pdf = ReferencePDF.objects.create(cloudinary_public_id='a.pdf', filename='a.pdf', content_hash=content_hash)
+
+        # Known up front from the client's hash...
+        self.assertEqual(self.start(sha256=content_hash).json(), {
+            'status': 'duplicate', 'id': str(pdf.id), 'url': '', 'filename': 'a.pdf',
+        })
+        # ...or found once the server has hashed the upload.
+        session_id = self.start().json()['id']
+        self.put(session_id, 0, self.data)
+        resp = self.client.post(f'/api/v1/documents/uploads/{session_id}/complete/')
+        self.assertEqual((resp.json()['status'], resp.json()['id']), ('duplicate', str(pdf.id)))
+        self.assertEqual(UploadSession.objects.get(id=session_id).pdf_id, pdf.id)
+
+
+class PDFCacheTests(SimpleTestCase):
+    data = b'%PDF-1.4 0123456789'
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.cache = PDFCache(root.name, max_bytes=1024)
+
+    def serve(self, cached, **headers):
+        resp = serve_cached_pdf(RequestFactory().get('/', headers=headers), cached, 'a.pdf')
+        body = b''.join(resp.streaming_content) if resp.streaming else resp.content
+        resp.close()
+        return resp.status_code, body
+
+    def test_ranges(self):
+        self.cache.put_file('a', io.BytesIO(self.data)).close()
+        cases = [
+            ('bytes=2-5', 206, self.data[2:6]),
+            ('bytes=-4', 206, self.data[-4:]),
+            ('bytes=10-', 206, self.data[10:]),
+            ('bytes=0-1,5-6', 200, self.data),
+            ('bytes=5-2', 200, self.data),
+            ('items=0-1', 200, self.data),
+            ('bytes=abc', 200, self.data),
+            ('bytes=100-', 416, b''),
+            ('bytes=-0', 416, b''),
+        ]
+        for header, status, body in cases:
+            with self.subTest(header):
+                self.assertEqual(self.serve(self.cache.get('a'), Range=header), (status, body))
+
+    def test_object_larger_than_the_cache_is_still_served(self):
+        self.cache.max_bytes = 4
+        cached = self.cache.put_file('a', io.BytesIO(self.data))
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.serve(cached), (200, self.data))
+
+    def test_object_evicted_after_lookup_is_still_served(self):
+        self.cache.put_file('a', io.BytesIO(self.data)).close()
+        cached = self.cache.get('a')
+        self.cache.max_bytes = 0
+        self.cache.evict()
+        self.assertEqual(self.serve(cached, Range='bytes=0-3'), (206, self.data[:4]))
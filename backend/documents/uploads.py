@@ -0,0 +1,236 @@
+"""
+Chunked, resumable PDF uploads.
+
+    POST   uploads/                 {filename, size, note, department, sha256}
+    PUT    uploads/<id>/            raw bytes, Upload-Offset: <bytes already sent>
+    GET    uploads/<id>/            where to resume (Upload-Offset header and body)
+    POST   uploads/<id>/complete/   hash, dedup and hand off to a background job
+    DELETE uploads/<id>/            abort
+
+Chunks are written at their offset into UPLOAD_STAGING_DIR/sessions/<id>.part.
+A chunk first claims its byte range by moving `received` forward with a
+conditional UPDATE and only then writes, so of two writers racing for the
+same offset only the winner touches the file; a write that fails gives the
+range back. A chunk retried after a dropped connection is therefore
+harmless. Sessions are capped at PDF_MAX_BYTES.
+
+Backends that support it can also take the file straight from the client
+(see DirectUploadView): the server hands out a presigned request and a
+signed token, and the completion callback verifies the token, reads the
+object back to hash it and registers it.
+
+Identical files are stored once per department: a ReferencePDF with the same
+SHA-256 is returned instead of uploading again, both when the client sends
+the hash up front and when the server computes it on completion.
+"""
+import hashlib
+import os
+import uuid
+from contextlib import closing
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from jobs.queue import submit
+
+from .models import ReferencePDF, UploadSession
+
+CHUNK_SIZE = 64 * 1024
+PDF_MAGIC = b'%PDF-'
+
+
+class UploadError(Exception):
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+def staging_path(session):
+    return os.path.join(settings.UPLOAD_STAGING_DIR, 'sessions', f'{session.id}.part')
+
+
+def find_duplicate(department_id, content_hash):
+    if not content_hash:
+        return None
+    return ReferencePDF.objects.filter(department_id=department_id, content_hash=content_hash).first()
+
+
+def hash_chunks(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hash_chunks(iter(lambda: f.read(CHUNK_SIZE), b''))
+
+
+def hash_stored(storage, key):
+    """SHA-256 of an object already in storage, read back in chunks."""
+    fileobj, _ = storage.open(key)
+    with closing(fileobj):
+        return hash_chunks(iter(lambda: fileobj.read(CHUNK_SIZE), b''))
+
+
+def stage_for_job(file, folder, note, department_id, user=None):
+    """
+    Copy an uploaded file to the staging area and queue the storage upload.
+    Returns (duplicate, job): an identical stored document, or the new job.
+    """
+    os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+    path = os.path.join(settings.UPLOAD_STAGING_DIR, f"{uuid.uuid4()}.pdf")
+    digest = hashlib.sha256()
+    with open(path, 'wb') as staged:
+        for chunk in file.chunks():
+            digest.update(chunk)
+            staged.write(chunk)
+    duplicate = find_duplicate(department_id, digest.hexdigest())
+    if duplicate:
+        os.remove(path)
+        return duplicate, None
+    job = submit('documents.upload', {
+        'path': path,
+        'folder': folder,
+        'filename': file.name,
+        'note': note,
+        'department_id': str(department_id) if department_id else None,
+        'content_hash': digest.hexdigest(),
+    }, department_id=department_id, user=user)
+    return None, job
+
+
+def max_bytes():
+    return getattr(settings, 'PDF_MAX_BYTES', 100 * 1024 * 1024)
+
+
+def start(department_id, folder, filename, size, note='', expected_hash=''):
+    if size > max_bytes():
+        raise UploadError(f'PDFs may be at most {max_bytes()} bytes.')
+    purge_expired()
+    session = UploadSession.objects.create(
+        department_id=department_id, folder=folder, filename=filename,
+        size=size, note=note, expected_hash=expected_hash.lower(),
+    )
+    path = staging_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def append(session, offset, stream, length):
+    """
+    Write `length` bytes from `stream` at `offset` and return the new offset.
+    The offset must be what the server has already received.
+    """
+    if session.status != UploadSession.OPEN:
+        raise UploadError('Upload is already complete.')
+    if offset != session.received:
+        raise UploadError('Upload-Offset does not match the bytes received.', offset=session.received)
+    if offset + length > min(session.size, max_bytes()):
+        raise UploadError('Chunk runs past the declared size.', offset=session.received)
+    max_chunk = getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024)
+    if length > max_chunk:
+        raise UploadError(f'Chunks may be at most {max_chunk} bytes.', offset=session.received)
+
+    # Claim the range before writing: a writer that loses the race must not
+    # touch the file.
+    new_offset = offset + length
+    if not UploadSession.objects.filter(id=session.id, received=offset, status=UploadSession.OPEN).update(
+        received=new_offset, updated_at=timezone.now()
+    ):
+        session.refresh_from_db(fields=['received'])
+        raise UploadError('Another chunk was written at this offset.', offset=session.received)
+    try:
+        write_chunk(session, offset, stream, length)
+    except BaseException:
+        UploadSession.objects.filter(id=session.id, received=new_offset).update(
+            received=offset, updated_at=timezone.now()
+        )
+        raise
+    session.received = new_offset
+    return new_offset
+
+
+def write_chunk(session, offset, stream, length):
+    written = 0
+    with open(staging_path(session), 'r+b') as out:
+        out.seek(offset)
+        if offset == 0 and length:
+            head = stream.read(min(length, CHUNK_SIZE))
+            if not head.startswith(PDF_MAGIC[:len(head)]):
+                raise UploadError('Only PDF files are allowed.', offset=0)
+            out.write(head)
+            written = len(head)
+        while written < length:
+            chunk = stream.read(min(CHUNK_SIZE, length - written))
+            if not chunk:
+                break
+            out.write(chunk)
+            written += len(chunk)
+    if written != length:
+        raise UploadError('Chunk was cut short; resend it.', offset=offset)
+
+
+def complete(session):
+    """
+    Check and hash the staged file. Returns (content_hash, duplicate) where
+    duplicate is an existing ReferencePDF of the same department, if any.
+    """
+    if session.received != session.size:
+        raise UploadError(f'Received {session.received} of {session.size} bytes.', offset=session.received)
+    path = staging_path(session)
+    content_hash = hash_file(path)
+    if session.expected_hash and session.expected_hash != content_hash:
+        abort(session)
+        raise UploadError('Content does not match the sha256 given at the start; upload it again.')
+    return content_hash, find_duplicate(session.department_id, content_hash)
+
+
+def finish_as_duplicate(session, pdf):
+    remove_staged(session)
+    session.status = UploadSession.DONE
+    session.pdf = pdf
+    session.save(update_fields=['status', 'pdf', 'updated_at'])
+
+
+def remove_staged(session):
+    try:
+        os.remove(staging_path(session))
+    except OSError:
+        pass
+
+
+def abort(session):
+    remove_staged(session)
+    session.delete()
+
+
+def purge_expired():
+    """Drop open sessions idle for longer than UPLOAD_SESSION_TTL_HOURS."""
+    hours = getattr(settings, 'UPLOAD_SESSION_TTL_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=hours)
+    for session in UploadSession.objects.filter(status=UploadSession.OPEN, updated_at__lt=cutoff)[:100]:
+        abort(session)
+
+
+DIRECT_UPLOAD_SALT = 'documents.direct-upload'
+
+
+def sign_direct_upload(payload):
+    return signing.dumps(payload, salt=DIRECT_UPLOAD_SALT, compress=True)
+
+
+def read_direct_upload(token):
+    """The payload of a direct-upload token, or UploadError if it is forged or stale."""
+    # An upload started just before the URL expired may take a while to finish.
+    max_age = getattr(settings, 'DOCUMENT_DIRECT_UPLOAD_EXPIRES', 3600) * 2
+    try:
+        return signing.loads(token, salt=DIRECT_UPLOAD_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        raise UploadError('Upload token has expired.')
+    except signing.BadSignature:
+        raise UploadError('Invalid upload token.')
@@ -1,8 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from .views import UploadPDFView, ListPDFsView, DownloadPDFView
+from .views import (
+    UploadSessionView, UploadSessionDetailView, UploadSessionCompleteView,
+    DirectUploadView, DirectUploadCompleteView,
+)
+
+if getattr(settings, 'DOCUMENT_ASYNC_VIEWS', True):
+    from .async_views import (
+        AsyncUploadPDFView as UploadPDFView,
+        AsyncListPDFsView as ListPDFsView,
+        AsyncDownloadPDFView as DownloadPDFView,
+    )
+else:
+    from .views import UploadPDFView, ListPDFsView, DownloadPDFView
 
 urlpatterns = [
     path('upload/', UploadPDFView.as_view(), name='upload-pdf'),
+    path('uploads/', UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<uuid:session_id>/', UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:session_id>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
+    path('direct/', DirectUploadView.as_view(), name='direct-upload'),
+    path('direct/complete/', DirectUploadCompleteView.as_view(), name='direct-upload-complete'),
     path('list/', ListPDFsView.as_view(), name='list-pdfs'),
     path('download/<uuid:pdf_id>/', DownloadPDFView.as_view(), name='download-pdf'),
 ]
@@ -1,20 +1,33 @@
 from rest_framework import views, status, response, permissions
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import HttpResponse
-from .models import ReferencePDF
-from .cloudinary_service import CloudinaryService
-import requests as http_requests
-import zipfile
-import io
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from .models import ReferencePDF, UploadSession
+from . import uploads
+from .pdf_cache import CachedPDF, get_pdf_cache, serve_cached_pdf
+from .storage import StorageError, get_storage, new_key
+from .streaming import EmptyArchive, UpstreamError, iter_chunks
+from django.conf import settings
+from jobs.queue import submit
+from jobs.views import job_status_response
+from core import metrics
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 
 class UploadPDFView(views.APIView):
-    """Upload PDF directly to Cloudinary."""
+    """
+    Upload PDF directly to the storage backend (see documents.storage).
+    With ?async=1 the file is staged locally and handed to a background job.
+    A file identical to one already stored for the department is not
+    uploaded again; the existing document is returned instead.
+    """
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request):
-        print("=== PDF Upload Request ===")
+        logger.info('PDF upload request')
         file = request.FILES.get('file')
         note = request.data.get('note', '')
         department = request.data.get('department', 'default')
@@ -25,7 +38,7 @@ class UploadPDFView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        print(f"File received: {file.name}, size: {file.size}")
+        logger.info('File received: %s, size: %s', file.name, file.size)
         
         if not file.name.lower().endswith('.pdf'):
             return response.Response(
@@ -33,55 +46,339 @@ class UploadPDFView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        cloudinary_service = CloudinaryService()
         folder = f"timetable_pdfs/{department}"
-        
+        department_id = getattr(request.user, 'department_id', None)
+
+        if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+            return self._upload_in_background(request, file, folder, note, department_id)
+
+        content_hash = uploads.hash_chunks(file.chunks())
+        file.seek(0)
+        duplicate = uploads.find_duplicate(department_id, content_hash)
+        if duplicate:
+            return duplicate_response(duplicate)
+
+        storage = get_storage()
+
         try:
-            result = cloudinary_service.upload_file(
-                file,
-                folder=folder,
-                resource_type="raw"
-            )
-        except Exception as e:
-            print(f"Cloudinary exception: {e}")
+            stored = storage.upload(file, folder, file.name)
+        except StorageError as e:
             return response.Response(
-                {'error': f'Cloudinary error: {str(e)}'}, 
+                {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        
-        if not result:
+        except Exception as e:
+            logger.exception('Storage exception: %s', e)
             return response.Response(
-                {'error': 'Failed to upload to cloud storage.'}, 
+                {'error': f'Storage error: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
-        print(f"Cloudinary upload success: {result['url']}")
+        logger.info('Storage upload success: %s', stored.key)
         
         try:
             pdf = ReferencePDF.objects.create(
-                department_id=None,
-                cloudinary_public_id=result['public_id'],
-                cloudinary_url=result['url'],
+                department_id=department_id,
+                storage_backend=storage.name,
+                cloudinary_public_id=stored.key,
+                cloudinary_url=stored.url,
                 filename=file.name,
-                file_size=result.get('bytes', 0),
+                file_size=stored.size,
+                content_hash=content_hash,
                 note=note
             )
             
             return response.Response({
                 'status': 'success',
                 'id': str(pdf.id),
-                'url': result['url'],
+                'url': stored.url,
                 'filename': file.name
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            print(f"Database error: {e}")
-            cloudinary_service.delete_file(result['public_id'], resource_type="raw")
+            logger.exception('Database error: %s', e)
+            storage.delete(stored.key)
             return response.Response(
                 {'error': f'Database error: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _upload_in_background(self, request, file, folder, note, department_id):
+        duplicate, job = uploads.stage_for_job(file, folder, note, department_id, user=request.user)
+        if duplicate:
+            return duplicate_response(duplicate)
+        return job_status_response(request, job)
+
+
+def duplicate_response(pdf):
+    return response.Response({
+        'status': 'duplicate',
+        'id': str(pdf.id),
+        'url': pdf.cloudinary_url,
+        'filename': pdf.filename
+    }, status=status.HTTP_200_OK)
+
+
+def session_response(session, code=status.HTTP_200_OK):
+    resp = response.Response({
+        'id': str(session.id),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'status': session.status,
+        'job_id': str(session.job_id) if session.job_id else None,
+        'pdf_id': str(session.pdf_id) if session.pdf_id else None,
+    }, status=code)
+    resp['Upload-Offset'] = str(session.received)
+    return resp
+
+
+class UploadSessionView(views.APIView):
+    """
+    Start a chunked, resumable upload (see documents.uploads).
+
+    Body: {"filename": "a.pdf", "size": 12345678, "note": "", "department": "cse",
+    "sha256": "<optional hex digest>"}. If sha256 matches a document already
+    stored for the department, that document is returned and nothing needs
+    to be sent.
+    """
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [JSONParser, FormParser]
+
+    def post(self, request):
+        filename = str(request.data.get('filename', ''))
+        if not filename.lower().endswith('.pdf'):
+            return response.Response(
+                {'error': 'Only PDF files are allowed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+        if size <= 0:
+            return response.Response(
+                {'error': 'size must be a positive number of bytes.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        department_id = getattr(request.user, 'department_id', None)
+        expected_hash = str(request.data.get('sha256', '')).lower()
+        duplicate = uploads.find_duplicate(department_id, expected_hash)
+        if duplicate:
+            return duplicate_response(duplicate)
+
+        try:
+            session = uploads.start(
+                department_id,
+                folder=f"timetable_pdfs/{request.data.get('department', 'default')}",
+                filename=filename,
+                size=size,
+                note=request.data.get('note', ''),
+                expected_hash=expected_hash,
+            )
+        except uploads.UploadError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return session_response(session, status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(views.APIView):
+    """
+    GET reports the offset to resume from, PUT appends a chunk sent as the
+    raw request body with an Upload-Offset header, DELETE aborts.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get_session(self, request, session_id):
+        return UploadSession.objects.filter(
+            id=session_id, department_id=getattr(request.user, 'department_id', None)
+        ).first()
+
+    def get(self, request, session_id):
+        session = self.get_session(request, session_id)
+        if session is None:
+            return response.Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return session_response(session)
+
+    def put(self, request, session_id):
+        session = self.get_session(request, session_id)
+        if session is None:
+            return response.Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return response.Response(
+                {'error': 'Upload-Offset and Content-Length headers are required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            uploads.append(session, offset, request.stream, length)
+        except uploads.UploadError as e:
+            resp = response.Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+            if e.offset is not None:
+                resp['Upload-Offset'] = str(e.offset)
+            return resp
+        return session_response(session)
+
+    def delete(self, request, session_id):
+        session = self.get_session(request, session_id)
+        if session is None:
+            return response.Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        if session.status == UploadSession.OPEN:
+            uploads.abort(session)
+        return response.Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(UploadSessionDetailView):
+    """
+    Finish an upload: hash the staged file, return an identical document if
+    the department already has one, otherwise queue the cloud upload.
+    """
+
+    def post(self, request, session_id):
+        session = self.get_session(request, session_id)
+        if session is None:
+            return response.Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        if session.status != UploadSession.OPEN:
+            return session_response(session)
+        try:
+            content_hash, duplicate = uploads.complete(session)
+        except uploads.UploadError as e:
+            return response.Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+        if duplicate:
+            uploads.finish_as_duplicate(session, duplicate)
+            return duplicate_response(duplicate)
+
+        job = submit('documents.upload', {
+            'path': uploads.staging_path(session),
+            'folder': session.folder,
+            'filename': session.filename,
+            'note': session.note,
+            'department_id': str(session.department_id) if session.department_id else None,
+            'content_hash': content_hash,
+            'session': str(session.id),
+        }, department_id=session.department_id, user=request.user)
+        session.status = UploadSession.QUEUED
+        session.job_id = job.id
+        session.save(update_fields=['status', 'job_id', 'updated_at'])
+        return job_status_response(request, job)
+
+
+class DirectUploadView(views.APIView):
+    """
+    Start an upload that goes straight from the client to storage.
+
+    Body: {"filename": "a.pdf", "note": "", "department": "cse", "sha256": ""}.
+    Returns the request to make ("upload": method, url and, for multipart
+    POSTs, the form fields) and a token to send to direct/complete/ once the
+    upload succeeds. Backends that cannot sign uploads (local) answer 400.
+    """
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [JSONParser, FormParser]
+
+    def post(self, request):
+        filename = str(request.data.get('filename', ''))
+        if not filename.lower().endswith('.pdf'):
+            return response.Response(
+                {'error': 'Only PDF files are allowed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        department_id = getattr(request.user, 'department_id', None)
+        duplicate = uploads.find_duplicate(department_id, str(request.data.get('sha256', '')).lower())
+        if duplicate:
+            return duplicate_response(duplicate)
+
+        storage = get_storage()
+        expires = settings.DOCUMENT_DIRECT_UPLOAD_EXPIRES
+        key = new_key(f"timetable_pdfs/{request.data.get('department', 'default')}", filename)
+        try:
+            upload = storage.presigned_upload(key, expires=expires)
+        except StorageError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if upload is None:
+            return response.Response(
+                {'error': f'The {storage.name} storage backend does not take direct uploads; use uploads/.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        token = uploads.sign_direct_upload({
+            'backend': storage.name,
+            'key': key,
+            'filename': filename,
+            'note': request.data.get('note', ''),
+            'department_id': str(department_id) if department_id else None,
+        })
+        return response.Response({
+            'key': key,
+            'upload': upload,
+            'token': token,
+            'expires_in': expires,
+            'complete_url': request.build_absolute_uri('/api/v1/documents/direct/complete/'),
+        }, status=status.HTTP_201_CREATED)
+
+
+class DirectUploadCompleteView(views.APIView):
+    """
+    Register a PDF the client uploaded with DirectUploadView.
+
+    Body: {"token": "..."}. The token is signed, so the key and department
+    in it can be trusted; the object must exist in storage. It is read back
+    once to record its SHA-256; if the department already has that file,
+    the new copy is deleted and the existing document returned. Repeating
+    the call returns the same document.
+    """
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [JSONParser, FormParser]
+
+    def post(self, request):
+        try:
+            payload = uploads.read_direct_upload(str(request.data.get('token', '')))
+        except uploads.UploadError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        existing = ReferencePDF.objects.filter(
+            storage_backend=payload['backend'], cloudinary_public_id=payload['key']
+        ).first()
+        if existing:
+            return duplicate_response(existing)
+
+        storage = get_storage(payload['backend'])
+        try:
+            size = storage.stat(payload['key'])
+        except StorageError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        if size is None:
+            return response.Response(
+                {'error': 'The file has not arrived in storage yet.'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            content_hash = uploads.hash_stored(storage, payload['key'])
+        except (StorageError, UpstreamError, EmptyArchive) as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        duplicate = uploads.find_duplicate(payload['department_id'], content_hash)
+        if duplicate:
+            storage.delete(payload['key'])
+            return duplicate_response(duplicate)
+
+        pdf = ReferencePDF.objects.create(
+            department_id=payload['department_id'],
+            storage_backend=storage.name,
+            cloudinary_public_id=payload['key'],
+            cloudinary_url=storage.url(payload['key']),
+            filename=payload['filename'],
+            file_size=size,
+            content_hash=content_hash,
+            note=payload['note']
+        )
+        return response.Response({
+            'status': 'success',
+            'id': str(pdf.id),
+            'url': pdf.cloudinary_url,
+            'filename': pdf.filename
+        }, status=status.HTTP_201_CREATED)
+
 
 class ListPDFsView(views.APIView):
     """List uploaded PDFs with backend proxy download URLs."""
@@ -107,8 +404,14 @@ class ListPDFsView(views.APIView):
 class DownloadPDFView(views.APIView):
     """
     Proxy download endpoint.
-    Uses Cloudinary's archive API to fetch the PDF (bypasses CDN delivery restrictions),
-    extracts it from the zip, and serves it directly as a PDF.
+    Reads the PDF from the storage backend it was stored with. For Cloudinary
+    that is the archive API (bypasses CDN delivery restrictions), unzipped on
+    the fly; local files are served straight from disk, and with
+    DOCUMENT_DOWNLOAD_REDIRECT backends that can presign a URL get a redirect.
+    Extracted PDFs are kept in a local content-addressed cache, so repeat
+    downloads skip Cloudinary and support ETag revalidation and Range requests.
+    The upstream archive is spooled and decompressed in chunks, so memory use
+    does not grow with the file size.
     """
     permission_classes = [permissions.AllowAny]
     
@@ -120,62 +423,63 @@ class DownloadPDFView(views.APIView):
                 {'error': 'PDF not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+
+        storage = get_storage(pdf.storage_backend)
+        key = pdf.cloudinary_public_id
+
+        # Files on this machine are served from disk, with no cache copy.
+        local_path = storage.local_path(key)
+        if local_path:
+            return serve_cached_pdf(
+                request, CachedPDF(local_path, pdf.content_hash or pdf.id.hex, os.path.getsize(local_path)),
+                pdf.filename
+            )
+
+        if settings.DOCUMENT_DOWNLOAD_REDIRECT:
+            url = storage.presigned_url(key)
+            if url:
+                return HttpResponseRedirect(url)
+
+        cache = get_pdf_cache()
+        cached = cache.get(key) if cache else None
+        if cached:
+            return serve_cached_pdf(request, cached, pdf.filename)
         
         try:
-            # Use Cloudinary archive API to get a download URL
-            cloudinary_service = CloudinaryService()
-            download_url = cloudinary_service.get_download_url(pdf.cloudinary_public_id)
-            
-            if not download_url:
-                return response.Response(
-                    {'error': 'Could not generate download URL'}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            # Fetch the zip archive from Cloudinary
-            cloudinary_response = http_requests.get(download_url, timeout=30)
-            
-            if cloudinary_response.status_code != 200:
+            # Read from storage in chunks (memory, then disk for Cloudinary archives)
+            try:
+                pdf_file, size = storage.open(key)
+            except (UpstreamError, StorageError) as e:
                 return response.Response(
-                    {'error': f'Cloudinary returned {cloudinary_response.status_code}'}, 
+                    {'error': str(e)}, 
                     status=status.HTTP_502_BAD_GATEWAY
                 )
-            
-            # The archive API returns a zip file - extract the PDF from it
-            zip_buffer = io.BytesIO(cloudinary_response.content)
-            
-            try:
-                with zipfile.ZipFile(zip_buffer, 'r') as zf:
-                    # Get the first (and only) file in the zip
-                    file_list = zf.namelist()
-                    if not file_list:
-                        return response.Response(
-                            {'error': 'Empty archive'}, 
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                        )
-                    
-                    pdf_content = zf.read(file_list[0])
-                    
-                    resp = HttpResponse(
-                        pdf_content,
-                        content_type='application/pdf'
-                    )
-                    resp['Content-Disposition'] = f'inline; filename="{pdf.filename}"'
-                    resp['Access-Control-Allow-Origin'] = '*'
-                    return resp
-                    
-            except zipfile.BadZipFile:
-                # If not a zip, try serving the content directly (it may be raw PDF)
-                resp = HttpResponse(
-                    cloudinary_response.content,
-                    content_type='application/pdf'
+            except EmptyArchive:
+                return response.Response(
+                    {'error': 'Empty archive'}, 
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
-                resp['Content-Disposition'] = f'inline; filename="{pdf.filename}"'
-                resp['Access-Control-Allow-Origin'] = '*'
-                return resp
+
+            if cache:
+                try:
+                    # The body is still being read from storage here.
+                    with metrics.span('storage'):
+                        cached = cache.put_file(key, pdf_file)
+                finally:
+                    pdf_file.close()
+                return serve_cached_pdf(request, cached, pdf.filename)
+
+            resp = StreamingHttpResponse(
+                iter_chunks(pdf_file),
+                content_type='application/pdf'
+            )
+            resp['Content-Length'] = str(size)
+            resp['Content-Disposition'] = f'inline; filename="{pdf.filename}"'
+            resp['Access-Control-Allow-Origin'] = '*'
+            return resp
                 
         except Exception as e:
-            print(f"Download proxy error: {e}")
+            logger.exception('Download proxy error: %s', e)
             return response.Response(
                 {'error': f'Download failed: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
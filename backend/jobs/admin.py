@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'progress', 'department_id', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('kind', 'message', 'error')
+    readonly_fields = ('id', 'params', 'result', 'error', 'worker', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import requeue_stale, run_next, worker_name
+
+
+def _work(poll_interval, stop, parent_pid):
+    # Shutdown is coordinated by the parent through `stop`, so a signal sent
+    # to the whole process group lets the current job finish. Dying inside
+    # stop.wait() would also leave the Event's shared lock held.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    name = worker_name()
+    while not stop.is_set() and os.getppid() == parent_pid:
+        if not run_next(name):
+            stop.wait(poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes.')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue in this process, then exit.')
+        parser.add_argument(
+            '--requeue-stale', action='store_true',
+            help='Put jobs left "running" by a crashed worker back on the queue first.',
+        )
+        parser.add_argument(
+            '--stale-after', type=float, default=60,
+            help='Seconds without a heartbeat before a running job counts as stale '
+                 '(keep well above JOBS_HEARTBEAT_SECONDS).',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_stale']:
+            count = requeue_stale(options['stale_after'])
+            self.stdout.write(f"Requeued {count} stale job(s).")
+
+        if options['once']:
+            done = 0
+            while run_next():
+                done += 1
+            self.stdout.write(f"Ran {done} job(s).")
+            return
+
+        # Children must not inherit the parent's open database connections.
+        connections.close_all()
+        stop = multiprocessing.Event()
+
+        def spawn():
+            # Not daemonic, so handlers may use a process pool of their own;
+            # _work exits by itself if this process goes away.
+            process = multiprocessing.Process(
+                target=_work, args=(options['poll'], stop, os.getpid())
+            )
+            process.start()
+            return process
+
+        # The handler only flips a flag: calling stop.set() from a signal
+        # handler can deadlock on the Event's internal lock.
+        stopping = []
+
+        def shutdown(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        workers = [spawn() for _ in range(options['workers'])]
+        self.stdout.write(f"Started {len(workers)} job worker(s).")
+        try:
+            while not stopping:
+                for i, process in enumerate(workers):
+                    if not process.is_alive():
+                        # Replace a crashed worker.
+                        workers[i] = spawn()
+                time.sleep(1)
+        finally:
+            stop.set()
+            for process in workers:
+                process.join(timeout=30)
+                if process.is_alive():
+                    process.terminate()
+            self.stdout.write("Job workers stopped.")
@@ -0,0 +1,201 @@
+"""
+Database-backed job queue.
+
+Apps register handlers in their jobs.py::
+
+    from jobs.queue import register
+
+    @register('timetable.generate')
+    def generate(job, params):
+        job.progress(10, 'Building problem')
+        ...
+        return {'created': 42}      # stored as the job's JSON result
+
+Handlers run inside `manage.py runjobs` worker processes. They report
+progress through `job.progress()`, which also raises JobCancelled once a
+cancel has been requested.
+
+While a handler runs, a watcher thread stamps the job's heartbeat every
+JOBS_HEARTBEAT_SECONDS, so `runjobs --requeue-stale` can tell a job whose
+worker died from one that is merely slow, and sets `job.cancelled` when a
+cancel is requested. Long computations that never report progress (the
+timetable solver) poll that event to stop early.
+"""
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class UnknownJobKind(ValueError):
+    pass
+
+
+def register(kind, public=True):
+    """
+    Register a job handler for `kind`.
+
+    Public kinds can be submitted through the API; private ones (e.g. jobs
+    whose params point at server-side files) only from code.
+    """
+    def decorator(func):
+        _handlers[kind] = (func, public)
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    try:
+        return _handlers[kind][0]
+    except KeyError:
+        raise UnknownJobKind(f'Unknown job kind: {kind}')
+
+
+def is_public(kind):
+    return kind in _handlers and _handlers[kind][1]
+
+
+def flag(value):
+    """A boolean job param: JSON true/false, or 1/true/yes in any case."""
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def submit(kind, params=None, department_id=None, user=None):
+    """Queue a job on behalf of `user` (if authenticated) and return the Job row."""
+    get_handler(kind)
+    submitted_by = user.get_username() if user is not None and user.is_authenticated else ''
+    return Job.objects.create(
+        kind=kind, params=params or {}, department_id=department_id, submitted_by=submitted_by
+    )
+
+
+def cancel(job):
+    """Cancel a queued job right away, or ask a running one to stop."""
+    if Job.objects.filter(id=job.id, status=Job.QUEUED).update(
+        status=Job.CANCELLED, cancel_requested=True, finished_at=timezone.now()
+    ):
+        return True
+    return bool(Job.objects.filter(id=job.id, status=Job.RUNNING).update(cancel_requested=True))
+
+
+class JobContext:
+    """Handle passed to job handlers for progress reporting and cancellation."""
+
+    def __init__(self, job):
+        self.job = job
+        self.id = job.id
+        self.department_id = job.department_id
+        # Set by the watcher thread once a cancel has been requested.
+        self.cancelled = threading.Event()
+
+    def is_cancelled(self):
+        return Job.objects.filter(id=self.id, cancel_requested=True).exists()
+
+    def progress(self, percent, message=''):
+        Job.objects.filter(id=self.id).update(
+            progress=max(0, min(100, int(percent))), message=message[:255], heartbeat_at=timezone.now()
+        )
+        if self.is_cancelled():
+            self.cancelled.set()
+            raise JobCancelled()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next(worker=None):
+    """
+    Atomically move the oldest queued job to running and return it.
+
+    Uses a conditional UPDATE rather than SELECT ... FOR UPDATE so the same
+    code works on SQLite and PostgreSQL.
+    """
+    worker = worker or worker_name()
+    candidates = Job.objects.filter(status=Job.QUEUED).order_by('created_at').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, heartbeat_at=now, worker=worker
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def requeue_stale(seconds):
+    """
+    Put running jobs with no heartbeat for `seconds` back on the queue: their
+    worker has died. Returns how many were requeued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=seconds)
+    return Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ).update(status=Job.QUEUED, worker='', heartbeat_at=None)
+
+
+def _watch(context, done, interval):
+    try:
+        while not done.wait(interval):
+            Job.objects.filter(id=context.id).update(heartbeat_at=timezone.now())
+            if context.is_cancelled():
+                context.cancelled.set()
+    except Exception:
+        # Losing the heartbeat must not take the job down with it.
+        traceback.print_exc()
+    finally:
+        connection.close()
+
+
+def run(job):
+    """Run a claimed job to completion and record the outcome."""
+    context = JobContext(job)
+    done = threading.Event()
+    interval = getattr(settings, 'JOBS_HEARTBEAT_SECONDS', 5)
+    watcher = None
+    if interval:
+        watcher = threading.Thread(target=_watch, args=(context, done, interval), name=f'job-{job.id}', daemon=True)
+        watcher.start()
+    fields = {}
+    try:
+        handler = get_handler(job.kind)
+        result = handler(context, job.params)
+        fields.update(status=Job.SUCCEEDED, result=result, progress=100)
+    except JobCancelled:
+        fields.update(status=Job.CANCELLED)
+    except Exception as e:
+        traceback.print_exc()
+        fields.update(status=Job.FAILED, error=f'{type(e).__name__}: {e}')
+    finally:
+        done.set()
+        if watcher is not None:
+            watcher.join()
+    fields['finished_at'] = timezone.now()
+    # A job requeued as stale belongs to whichever worker claimed it next.
+    Job.objects.filter(id=job.id, status=Job.RUNNING, worker=job.worker).update(**fields)
+
+
+def run_next(worker=None):
+    """Claim and run one job. Returns False when the queue was empty."""
+    close_old_connections()
+    job = claim_next(worker)
+    if job is None:
+        return False
+    run(job)
+    return True
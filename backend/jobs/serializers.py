@@ -0,0 +1,17 @@
+from rest_framework import serializers
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'message', 'cancel_requested',
+            'error', 'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
+
+
+class JobSubmitSerializer(serializers.Serializer):
+    kind = serializers.CharField(max_length=100)
+    params = serializers.DictField(required=False, default=dict)
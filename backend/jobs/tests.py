@@ -0,0 +1,97 @@
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Job
+from .queue import cancel, claim_next, register, requeue_stale, run, submit
+
+
+@register('tests.echo', public=False)
+def echo(job, params):
+    return params
+
+
+@register('tests.wait_for_cancel', public=False)
+def wait_for_cancel(job, params):
+    # Never reports progress until the cancel has reached it.
+    if not job.cancelled.wait(10):
+        return 'not cancelled'
+    job.progress(50)
+
+
+class JobAccessTests(TestCase):
+    def client_for(self, user, department_id=None):
+        client = APIClient()
+        if user is not None:
+            user.department_id = department_id
+            client.force_authenticate(user=user)
+        return client
+
+    def status(self, client, job):
+        return client.get(f'/api/v1/jobs/{job.id}/').status_code
+
+    def test_department_jobs_stay_in_their_department(self):
+        department_id = uuid.uuid4()
+        job = submit('tests.echo', department_id=department_id)
+        self.assertEqual(self.status(self.client_for(User.objects.create(username='a'), department_id), job), 200)
+        self.assertEqual(self.status(self.client_for(User.objects.create(username='b'), uuid.uuid4()), job), 404)
+        self.assertEqual(self.status(self.client_for(None), job), 404)
+
+    def test_jobs_without_a_department_belong_to_their_submitter(self):
+        owner = User.objects.create(username='owner')
+        job = submit('tests.echo', user=owner)
+        self.assertEqual(self.status(self.client_for(owner), job), 200)
+        self.assertEqual(self.status(self.client_for(User.objects.create(username='other')), job), 404)
+        self.assertEqual(self.status(self.client_for(None), job), 404)
+        self.assertEqual(self.status(self.client_for(User.objects.create(username='staff', is_staff=True)), job), 200)
+
+        anonymous = submit('tests.echo')
+        self.assertEqual(anonymous.submitted_by, '')
+        self.assertEqual(self.status(self.client_for(None), anonymous), 404)
+        self.assertEqual(self.status(self.client_for(User.objects.create(username='nobody')), anonymous), 404)
+
+
+class StaleJobTests(TestCase):
+    def test_only_jobs_without_a_recent_heartbeat_are_requeued(self):
+        live = submit('tests.echo')
+        claim_next('live')
+        dead = submit('tests.echo')
+        claim_next('dead')
+        Job.objects.filter(id=dead.id).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(requeue_stale(60), 1)
+        self.assertEqual(Job.objects.get(id=live.id).status, Job.RUNNING)
+        self.assertEqual(Job.objects.get(id=dead.id).status, Job.QUEUED)
+
+    @override_settings(JOBS_HEARTBEAT_SECONDS=0)
+    def test_a_requeued_job_is_finished_by_its_new_worker(self):
+        submit('tests.echo', {'n': 1})
+        first = claim_next('first')
+        Job.objects.filter(id=first.id).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        requeue_stale(60)
+        second = claim_next('second')
+
+        run(first)
+        self.assertEqual(Job.objects.get(id=first.id).status, Job.RUNNING)
+        run(second)
+        job = Job.objects.get(id=first.id)
+        self.assertEqual((job.status, job.result, job.worker), (Job.SUCCEEDED, {'n': 1}, 'second'))
+
+
+class CancelRunningJobTests(TransactionTestCase):
+    # The watcher thread has its own connection, so the rows must be committed.
+
+    @override_settings(JOBS_HEARTBEAT_SECONDS=0.05)
+    def test_cancel_reaches_a_handler_that_does_not_report_progress(self):
+        submit('tests.wait_for_cancel')
+        job = claim_next()
+        self.assertTrue(cancel(job))
+
+        run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertIsNotNone(job.heartbeat_at)
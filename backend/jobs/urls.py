@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import JobSubmitView, JobStatusView, JobResultView, JobCancelView
+
+urlpatterns = [
+    path('', JobSubmitView.as_view(), name='job-submit'),
+    path('<uuid:job_id>/', JobStatusView.as_view(), name='job-status'),
+    path('<uuid:job_id>/result/', JobResultView.as_view(), name='job-result'),
+    path('<uuid:job_id>/cancel/', JobCancelView.as_view(), name='job-cancel'),
+]
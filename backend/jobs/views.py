@@ -0,0 +1,105 @@
+from rest_framework import views, status, response, permissions
+from .models import Job
+from .queue import cancel, is_public, submit
+from .serializers import JobSerializer, JobSubmitSerializer
+
+
+def job_status_response(request, job, code=status.HTTP_202_ACCEPTED):
+    """The 202 body returned wherever an operation was handed to a job."""
+    data = JobSerializer(job).data
+    data['status_url'] = request.build_absolute_uri(f'/api/v1/jobs/{job.id}/')
+    data['result_url'] = request.build_absolute_uri(f'/api/v1/jobs/{job.id}/result/')
+    return response.Response(data, status=code)
+
+
+def can_access(user, job):
+    """
+    Jobs are visible to their department. Jobs without one (anonymous
+    uploads, institution runs by staff with no department) are visible to
+    the user who queued them and to staff; anonymous ones to staff only.
+    """
+    if job.department_id is not None:
+        return job.department_id == getattr(user, 'department_id', None)
+    if not user.is_authenticated:
+        return False
+    return user.is_staff or (bool(job.submitted_by) and job.submitted_by == user.get_username())
+
+
+class DepartmentJobMixin:
+    """Looks jobs up by id, as 404 unless can_access() allows the request's user."""
+    permission_classes = [permissions.AllowAny]
+
+    def get_job(self, request, job_id):
+        job = Job.objects.filter(id=job_id).first()
+        if job is None or not can_access(request.user, job):
+            return None
+        return job
+
+
+class JobSubmitView(DepartmentJobMixin, views.APIView):
+    """Queue a background job: {"kind": "timetable.generate", "params": {...}}."""
+
+    def get(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        jobs = Job.objects.filter(department_id=department_id)[:50]
+        return response.Response(JobSerializer(jobs, many=True).data)
+
+    def post(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = JobSubmitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        kind = serializer.validated_data['kind']
+        if not is_public(kind):
+            return response.Response({'error': f'Unknown job kind: {kind}'}, status=status.HTTP_400_BAD_REQUEST)
+        job = submit(kind, serializer.validated_data['params'], department_id=department_id, user=request.user)
+        return job_status_response(request, job)
+
+
+class JobStatusView(DepartmentJobMixin, views.APIView):
+    def get(self, request, job_id):
+        job = self.get_job(request, job_id)
+        if job is None:
+            return response.Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return response.Response(JobSerializer(job).data)
+
+
+class JobResultView(DepartmentJobMixin, views.APIView):
+    def get(self, request, job_id):
+        job = self.get_job(request, job_id)
+        if job is None:
+            return response.Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.status == Job.SUCCEEDED:
+            return response.Response(job.result)
+        if job.is_finished:
+            return response.Response(
+                {'status': job.status, 'error': job.error or f'Job {job.status}'},
+                status=status.HTTP_410_GONE if job.status == Job.CANCELLED else status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return response.Response(
+            {'status': job.status, 'progress': job.progress, 'error': 'Job has not finished yet'},
+            status=status.HTTP_409_CONFLICT
+        )
+
+
+class JobCancelView(DepartmentJobMixin, views.APIView):
+    def post(self, request, job_id):
+        job = self.get_job(request, job_id)
+        if job is None:
+            return response.Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not cancel(job):
+            return response.Response(
+                {'error': f'Job already {job.status}'},
+                status=status.HTTP_409_CONFLICT
+            )
+        job.refresh_from_db()
+        return response.Response(JobSerializer(job).data)
@@ -0,0 +1,165 @@
+"""
+In-memory availability bitmaps for free-room and free-faculty search.
+
+Per department, every (academic_year, resource, day) that has bookings holds
+a bitmask over the SLOT_MINUTES slots of the day. "Is room R free on day D
+from 10:00 to 12:00" is then one AND against the wanted-slots mask, and a
+search is a pass over the department's rooms or faculty.
+
+Like the conflict index, each department's bookings are loaded from the
+database on first use, updated per entry by the TimetableEntry signals and
+revalidated against the database before each search (see
+timetable.conflicts). Room and faculty details are read with each search (a
+department has hundreds at most), so edits made by other processes show up
+at once.
+"""
+
+from .conflicts import DepartmentRegistry, to_minutes
+from .models import SLOT_MINUTES, SLOTS_PER_DAY, Faculty, Room
+
+ROOM = 'room'
+FACULTY = 'faculty'
+MINUTES_PER_DAY = 24 * 60
+
+
+def clock_minutes(value):
+    """Minutes since midnight for 'HH:MM[:SS]' between 00:00 and 24:00; ValueError otherwise."""
+    parts = value.split(':')
+    if not 2 <= len(parts) <= 3 or not all(part.isdigit() and len(part) <= 2 for part in parts):
+        raise ValueError(f'Invalid time {value!r}.')
+    hours, minutes = int(parts[0]), int(parts[1])
+    if minutes > 59 or hours * 60 + minutes > MINUTES_PER_DAY:
+        raise ValueError(f'Invalid time {value!r}.')
+    return hours * 60 + minutes
+
+
+def slot_range_mask(start_time, end_time):
+    """Mask of the slots a window touches, clipped to the day (0 if it is empty)."""
+    start = max(to_minutes(start_time) // SLOT_MINUTES, 0)
+    end = min(-(-to_minutes(end_time) // SLOT_MINUTES), SLOTS_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+class DepartmentAvailability:
+    def __init__(self):
+        # (academic_year, kind, resource_id, day) -> {entry_id: mask}
+        self.bookings = {}
+        # entry_id -> the keys it was added under
+        self.entries = {}
+        self.busy = {}
+        self.version = None
+
+    def _refresh(self, key):
+        masks = self.bookings.get(key)
+        if masks:
+            combined = 0
+            for mask in masks.values():
+                combined |= mask
+            self.busy[key] = combined
+        else:
+            self.bookings.pop(key, None)
+            self.busy.pop(key, None)
+
+    def add(self, entry_id, academic_year, day, start_slot, end_slot, room_id, faculty_id):
+        self.remove(entry_id)
+        mask = ((1 << (end_slot - start_slot)) - 1) << start_slot
+        keys = [
+            (academic_year, ROOM, str(room_id), day),
+            (academic_year, FACULTY, str(faculty_id), day),
+        ]
+        for key in keys:
+            self.bookings.setdefault(key, {})[entry_id] = mask
+            self.busy[key] = self.busy.get(key, 0) | mask
+        self.entries[entry_id] = keys
+
+    def remove(self, entry_id):
+        for key in self.entries.pop(entry_id, ()):
+            masks = self.bookings.get(key)
+            if masks:
+                masks.pop(entry_id, None)
+            self._refresh(key)
+
+    def busy_mask(self, academic_year, kind, resource_id, day):
+        return self.busy.get((academic_year, kind, resource_id, day), 0)
+
+
+class AvailabilityIndex(DepartmentRegistry):
+    """Per-department registry of DepartmentAvailability objects."""
+    columns = ('academic_year', 'day_of_week', 'start_slot', 'end_slot', 'room_id', 'faculty_id')
+
+    def new_index(self):
+        return DepartmentAvailability()
+
+    def add_row(self, index, row):
+        index.add(*row)
+
+    def free_rooms(self, department_id, academic_year, days, start_time, end_time,
+                   room_type=None, min_capacity=None, limit=None):
+        """
+        Rooms with no booking in the window on any of `days`, smallest
+        sufficient capacity first (best fit), then by name.
+        """
+        wanted = slot_range_mask(start_time, end_time)
+        rooms = Room.objects.filter(department_id=department_id)
+        if room_type:
+            rooms = rooms.filter(type=room_type)
+        if min_capacity is not None:
+            rooms = rooms.filter(capacity__gte=min_capacity)
+        rooms = list(rooms.values_list('id', 'name', 'type', 'capacity'))
+        availability = self.department(department_id)
+        with self._lock:
+            found = []
+            for room_id, name, kind, capacity in rooms:
+                room_id = str(room_id)
+                if any(availability.busy_mask(academic_year, ROOM, room_id, day) & wanted for day in days):
+                    continue
+                found.append({'id': room_id, 'name': name, 'type': kind, 'capacity': capacity})
+        found.sort(key=lambda room: (room['capacity'], room['name']))
+        return found[:limit] if limit else found
+
+    def free_faculty(self, department_id, academic_year, days, start_time, end_time,
+                     designation=None, limit=None):
+        """
+        Faculty members free in the window on all of `days`, least-booked on
+        those days first, then by name.
+        """
+        wanted = slot_range_mask(start_time, end_time)
+        faculty = Faculty.objects.filter(department_id=department_id)
+        if designation:
+            faculty = faculty.filter(designation=designation)
+        faculty = list(faculty.values_list('id', 'name', 'designation'))
+        availability = self.department(department_id)
+        with self._lock:
+            found = []
+            for faculty_id, name, title in faculty:
+                faculty_id = str(faculty_id)
+                masks = [availability.busy_mask(academic_year, FACULTY, faculty_id, day) for day in days]
+                if any(mask & wanted for mask in masks):
+                    continue
+                booked = sum(bin(mask).count('1') for mask in masks) * SLOT_MINUTES
+                found.append({'id': faculty_id, 'name': name, 'designation': title, 'booked_minutes': booked})
+        found.sort(key=lambda member: (member['booked_minutes'], member['name']))
+        return found[:limit] if limit else found
+
+    def update(self, entry):
+        with self._lock:
+            for department_id, availability in self._departments.items():
+                if department_id != entry.department_id:
+                    availability.remove(entry.id)
+            availability = self._departments.get(entry.department_id)
+            if availability is not None:
+                availability.add(
+                    entry.id, entry.academic_year, entry.day_of_week,
+                    entry.start_slot, entry.end_slot, entry.room_id, entry.faculty_id,
+                )
+
+    def remove(self, entry):
+        with self._lock:
+            availability = self._departments.get(entry.department_id)
+            if availability is not None:
+                availability.remove(entry.id)
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,183 @@
+"""
+Bulk timetable import.
+
+Rows arrive as a JSON list or a CSV file. Every row is field-validated, its
+faculty/subject/room are checked against the department, and then a single
+sort-and-sweep pass finds room, faculty and section clashes both inside the
+batch and against rows already in the database. Clean rows are written with
+bulk_create inside one transaction.
+"""
+import codecs
+import csv
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import parsers
+
+from .conflicts import sweep_overlaps, to_minutes
+from .models import Faculty, Room, Subject, TimetableEntry, SlotConflict
+from .serializers import TimetableEntryRowSerializer
+from .signals import entries_bulk_created
+
+CLASH_MESSAGES = {
+    'room': 'This room is already booked for this time slot.',
+    'faculty': 'This faculty member is already assigned to a class in this time slot.',
+    'section': 'This section already has a class in this time slot.',
+}
+
+
+class CSVParser(parsers.BaseParser):
+    """Parse a text/csv body into a list of dicts keyed by the header row."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_csv(stream)
+
+
+def read_csv(stream, encoding='utf-8-sig'):
+    # utf-8-sig drops the byte order mark Excel puts before the header row.
+    reader = csv.DictReader(codecs.iterdecode(stream, encoding))
+    return [
+        {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        for row in reader
+    ]
+
+
+def extract_rows(request):
+    """Pull the list of row dicts out of a JSON, CSV or multipart request."""
+    upload = request.FILES.get('file') if hasattr(request, 'FILES') else None
+    if upload is not None:
+        return read_csv(upload)
+    data = request.data
+    if isinstance(data, dict):
+        data = data.get('entries')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of entries, an {"entries": [...]} object or a CSV file.')
+    return data
+
+
+def _clash_keys(row):
+    year, day = row['academic_year'], row['day_of_week']
+    return (
+        ('room', (year, day, 'room', row['room'])),
+        ('faculty', (year, day, 'faculty', row['faculty'])),
+        ('section', (year, day, 'section', row['semester'], row['section'])),
+    )
+
+
+def import_entries(department_id, rows, dry_run=False, all_or_nothing=False):
+    """
+    Validate and insert a batch of entries for one department.
+
+    Returns a report dict with per-row status. Rows that fail validation or
+    clash with anything are skipped; with all_or_nothing a single bad row
+    rejects the whole batch.
+    """
+    max_rows = getattr(settings, 'TIMETABLE_BULK_MAX_ROWS', 20000)
+    if len(rows) > max_rows:
+        raise ValueError(f'A single import is limited to {max_rows} rows.')
+
+    faculty_ids = set(Faculty.objects.filter(department_id=department_id).values_list('id', flat=True))
+    subject_ids = set(Subject.objects.filter(department_id=department_id).values_list('id', flat=True))
+    room_ids = set(Room.objects.filter(department_id=department_id).values_list('id', flat=True))
+
+    errors = {}
+    valid = {}
+    for index, raw in enumerate(rows):
+        serializer = TimetableEntryRowSerializer(data=raw)
+        if not serializer.is_valid():
+            errors[index] = dict(serializer.errors)
+            continue
+        row = serializer.validated_data
+        row_errors = {}
+        if row['faculty'] not in faculty_ids:
+            row_errors['faculty'] = ['Unknown faculty for this department.']
+        if row['subject'] not in subject_ids:
+            row_errors['subject'] = ['Unknown subject for this department.']
+        if row['room'] not in room_ids:
+            row_errors['room'] = ['Unknown room for this department.']
+        if row_errors:
+            errors[index] = row_errors
+            continue
+        valid[index] = row
+
+    # One sweep over the batch plus the existing rows for the same years.
+    years = {row['academic_year'] for row in valid.values()}
+    existing = TimetableEntry.objects.filter(
+        department_id=department_id, academic_year__in=years
+    ).values(
+        'id', 'academic_year', 'day_of_week', 'start_time', 'end_time',
+        'room', 'faculty', 'semester', 'section',
+    )
+
+    intervals = []
+    for index, row in valid.items():
+        start, end = to_minutes(row['start_time']), to_minutes(row['end_time'])
+        for kind, key in _clash_keys(row):
+            intervals.append((key, start, end, (kind, 'row', index)))
+    for entry in existing.iterator():
+        start, end = to_minutes(entry['start_time']), to_minutes(entry['end_time'])
+        for kind, key in _clash_keys(entry):
+            intervals.append((key, start, end, (kind, 'entry', entry['id'])))
+
+    clashes = {}
+    for _, first, second in sweep_overlaps(intervals):
+        kind = first[0]
+        for this, other in ((first, second), (second, first)):
+            if this[1] != 'row':
+                continue
+            label = f'row {other[2]}' if other[1] == 'row' else str(other[2])
+            clashes.setdefault(this[2], {}).setdefault(kind, []).append(label)
+
+    for index, kinds in clashes.items():
+        errors[index] = {
+            kind: [CLASH_MESSAGES[kind]] for kind in kinds
+        }
+        errors[index]['conflicts'] = kinds
+        valid.pop(index, None)
+
+    to_create = []
+    if not (all_or_nothing and errors):
+        to_create = [
+            TimetableEntry(
+                department_id=department_id,
+                day_of_week=row['day_of_week'],
+                start_time=row['start_time'],
+                end_time=row['end_time'],
+                faculty_id=row['faculty'],
+                subject_id=row['subject'],
+                room_id=row['room'],
+                semester=row['semester'],
+                section=row['section'],
+                academic_year=row['academic_year'],
+            )
+            for index, row in sorted(valid.items())
+        ]
+
+    if to_create and not dry_run:
+        try:
+            with transaction.atomic():
+                TimetableEntry.objects.bulk_create(to_create, batch_size=500)
+                entries_bulk_created.send(sender=TimetableEntry, department_id=department_id, entries=to_create)
+        except SlotConflict:
+            raise ValueError('Entries saved while the import ran clash with some rows; nothing was written. Retry the import.')
+
+    created_ids = {index: entry.id for index, entry in zip(sorted(valid), to_create)}
+    report = []
+    for index in range(len(rows)):
+        if index in errors:
+            report.append({'row': index, 'status': 'error', 'errors': errors[index]})
+        elif index in created_ids and dry_run:
+            report.append({'row': index, 'status': 'valid'})
+        elif index in created_ids:
+            report.append({'row': index, 'status': 'created', 'id': str(created_ids[index])})
+        else:
+            report.append({'row': index, 'status': 'skipped'})
+
+    return {
+        'total': len(rows),
+        'created': 0 if dry_run else len(to_create),
+        'failed': len(errors),
+        'dry_run': dry_run,
+        'rows': report,
+    }
@@ -0,0 +1,289 @@
+"""
+In-memory interval index for room and faculty overlap checks.
+
+Each department gets an index that is loaded from the database on first use
+and kept in sync by the TimetableEntry save/delete signals. Intervals are
+bucketed per (academic_year, day_of_week, resource) and kept sorted by start
+time, so a conflict lookup is a pair of binary searches plus a scan over the
+hits.
+
+The index lives in process memory: every worker process builds its own copy,
+and the signals only report writes made by the same process. Entries written
+by other workers, runjobs, the admin or the shell are picked up by checking
+the department's TimetableEntry data_version() before each lookup; when it
+has moved, the rows updated since the index's version are re-read, and the
+whole department is reloaded if rows were deleted elsewhere.
+"""
+import bisect
+import threading
+
+
+def to_minutes(value):
+    """Convert a datetime.time (or 'HH:MM[:SS]' string) to minutes since midnight."""
+    if isinstance(value, str):
+        parts = value.split(':')
+        return int(parts[0]) * 60 + int(parts[1])
+    return value.hour * 60 + value.minute
+
+
+class IntervalBucket:
+    """Sorted intervals for a single (academic_year, day, resource) key."""
+    __slots__ = ('starts', 'items', 'max_length')
+
+    def __init__(self):
+        self.starts = []
+        self.items = []
+        self.max_length = 0
+
+    def add(self, start, end, entry_id):
+        item = (start, end, entry_id)
+        pos = bisect.bisect_left(self.items, item)
+        self.items.insert(pos, item)
+        self.starts.insert(pos, start)
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, start, end, entry_id):
+        item = (start, end, entry_id)
+        pos = bisect.bisect_left(self.items, item)
+        if pos < len(self.items) and self.items[pos] == item:
+            del self.items[pos]
+            del self.starts[pos]
+
+    def overlapping(self, start, end):
+        """Return ids of every interval with s < end and e > start."""
+        # Anything starting at or before start - max_length has already ended.
+        lo = bisect.bisect_right(self.starts, start - self.max_length)
+        hi = bisect.bisect_left(self.starts, end)
+        return [entry_id for s, e, entry_id in self.items[lo:hi] if e > start]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class DepartmentIndex:
+    """Room and faculty interval buckets for one department."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.entries = {}
+        self.version = None
+
+    def _keys(self, record):
+        academic_year, day, start, end, room_id, faculty_id = record
+        return (
+            (academic_year, day, 'room', room_id),
+            (academic_year, day, 'faculty', faculty_id),
+        )
+
+    def add(self, entry_id, record):
+        if entry_id in self.entries:
+            self.remove(entry_id)
+        self.entries[entry_id] = record
+        start, end = record[2], record[3]
+        for key in self._keys(record):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = IntervalBucket()
+            bucket.add(start, end, entry_id)
+
+    def remove(self, entry_id):
+        record = self.entries.pop(entry_id, None)
+        if record is None:
+            return
+        start, end = record[2], record[3]
+        for key in self._keys(record):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.remove(start, end, entry_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def find(self, academic_year, day, start, end, room_id=None, faculty_id=None, exclude=None):
+        result = {}
+        for resource, resource_id in (('room', room_id), ('faculty', faculty_id)):
+            if resource_id is None:
+                continue
+            bucket = self.buckets.get((academic_year, day, resource, resource_id))
+            hits = bucket.overlapping(start, end) if bucket else []
+            result[resource] = [entry_id for entry_id in hits if entry_id != exclude]
+        return result
+
+
+def entry_record(entry):
+    return (
+        entry.academic_year,
+        entry.day_of_week,
+        to_minutes(entry.start_time),
+        to_minutes(entry.end_time),
+        entry.room_id,
+        entry.faculty_id,
+    )
+
+
+class DepartmentRegistry:
+    """
+    Per-department in-memory indexes of TimetableEntry rows, built lazily and
+    revalidated against the database on every use (see the module docstring).
+
+    Subclasses give the entry columns they need and how to build an index and
+    add a row (id first, then `columns`) to it; an index must keep its
+    entries by id in `entries`.
+    """
+    columns = ()
+
+    def __init__(self):
+        self._departments = {}
+        self._lock = threading.RLock()
+
+    def new_index(self):
+        raise NotImplementedError
+
+    def add_row(self, index, row):
+        raise NotImplementedError
+
+    def _rows(self, department_id, since=None):
+        from .models import TimetableEntry
+
+        rows = TimetableEntry.objects.filter(department_id=department_id)
+        if since is not None:
+            rows = rows.filter(updated_at__gte=since)
+        return rows.values_list('id', *self.columns).iterator()
+
+    def _load(self, department_id, version):
+        index = self.new_index()
+        for row in self._rows(department_id):
+            self.add_row(index, row)
+        index.version = version
+        return index
+
+    def department(self, department_id):
+        from .models import TimetableEntry
+
+        version = TimetableEntry.objects.filter(department_id=department_id).data_version()
+        with self._lock:
+            index = self._departments.get(department_id)
+            if index is None:
+                index = self._departments[department_id] = self._load(department_id, version)
+            elif index.version != version:
+                # Catch up on rows written elsewhere since the last check.
+                for row in self._rows(department_id, since=index.version[1]):
+                    self.add_row(index, row)
+                if len(index.entries) != version[0]:
+                    index = self._departments[department_id] = self._load(department_id, version)
+                index.version = version
+            return index
+
+    def invalidate(self, department_id=None):
+        """Drop a department's index (or all of them); it is rebuilt on next use."""
+        with self._lock:
+            if department_id is None:
+                self._departments.clear()
+            else:
+                self._departments.pop(department_id, None)
+
+
+class ConflictIndex(DepartmentRegistry):
+    """Per-department registry of DepartmentIndex objects."""
+    columns = ('academic_year', 'day_of_week', 'start_time', 'end_time', 'room_id', 'faculty_id')
+
+    def new_index(self):
+        return DepartmentIndex()
+
+    def add_row(self, index, row):
+        entry_id, academic_year, day, start, end, room_id, faculty_id = row
+        index.add(entry_id, (academic_year, day, to_minutes(start), to_minutes(end), room_id, faculty_id))
+
+    def find_conflicts(self, department_id, academic_year, day_of_week, start_time, end_time,
+                       room_id=None, faculty_id=None, exclude=None):
+        """
+        Return every entry overlapping the given slot.
+
+        Returns a dict like {'room': [entry_id, ...], 'faculty': [...]} with a key
+        for each resource that was passed in.
+        """
+        index = self.department(department_id)
+        with self._lock:
+            return index.find(
+                academic_year, day_of_week, to_minutes(start_time), to_minutes(end_time),
+                room_id=room_id, faculty_id=faculty_id, exclude=exclude,
+            )
+
+    def update(self, entry):
+        with self._lock:
+            # Move the entry out of whichever department index it was in before.
+            for department_id, index in self._departments.items():
+                if department_id != entry.department_id:
+                    index.remove(entry.id)
+            index = self._departments.get(entry.department_id)
+            if index is not None:
+                index.add(entry.id, entry_record(entry))
+
+    def remove(self, entry):
+        with self._lock:
+            index = self._departments.get(entry.department_id)
+            if index is not None:
+                index.remove(entry.id)
+
+
+conflict_index = ConflictIndex()
+
+
+def sweep_overlaps(intervals):
+    """
+    Yield every overlapping pair from an iterable of (key, start, end, ident).
+
+    Intervals are sorted once by (key, start) and swept left to right, keeping
+    the still-open intervals for the current key. Runs in O(n log n + k) for
+    k reported pairs. Each pair is yielded as (key, earlier_ident, later_ident).
+    """
+    ordered = sorted(intervals, key=lambda item: (item[0], item[1], item[2]))
+    current_key = object()
+    active = []
+    for key, start, end, ident in ordered:
+        if key != current_key:
+            current_key = key
+            active = []
+        active = [item for item in active if item[0] > start]
+        for _, other in active:
+            yield key, other, ident
+        active.append((end, ident))
+
+
+def sweep_groups(intervals):
+    """
+    Yield every overlap group from an iterable of (key, start, end, ident).
+
+    A group is a maximal run of intervals of one key chained together by
+    overlaps: each interval starts before the latest end seen so far in the
+    run. Intervals are bucketed by key and each bucket sorted by start, so
+    this is O(n log n) whatever the number of clashes. Groups are yielded as
+    (key, start, end, [ident, ...]) with their members in start order;
+    intervals that overlap nothing are skipped.
+    """
+    buckets = {}
+    for key, start, end, ident in intervals:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = []
+        bucket.append((start, end, ident))
+    return sweep_buckets(buckets)
+
+
+def sweep_buckets(buckets):
+    """sweep_groups over intervals already bucketed as {key: [(start, end, ident), ...]}."""
+    by_start = lambda item: (item[0], item[1])
+    for key, bucket in buckets.items():
+        if len(bucket) < 2:
+            continue
+        bucket.sort(key=by_start)
+        group_start, group_end, members = bucket[0][0], bucket[0][1], [bucket[0][2]]
+        for start, end, ident in bucket[1:]:
+            if start < group_end:
+                members.append(ident)
+                group_end = max(group_end, end)
+                continue
+            if len(members) > 1:
+                yield key, group_start, group_end, members
+            group_start, group_end, members = start, end, [ident]
+        if len(members) > 1:
+            yield key, group_start, group_end, members
@@ -0,0 +1,387 @@
+"""
+Section, room and faculty timetables rendered as CSV, XLSX or PDF.
+
+Rows come from a single values_list() query read with .iterator(), so a CSV
+is written row by row and never held in memory. XLSX (openpyxl) and PDF
+(reportlab) also lay the week out as a day x period grid, which needs one
+document's rows at a time; both libraries are imported only when used.
+
+Rendered files are kept under EXPORT_CACHE_DIR keyed by the department's data
+version (data_version below), so any write to the department makes the next
+request render afresh; older versions are removed when a newer one is
+written::
+
+    <department>/<version>/section-2026-3-A.pdf
+    <department>/<version>/department-2026-pdf.zip
+
+The version is read from the database, so web workers and job workers agree
+on it: a job's download_url is served from the zip the job rendered.
+
+A department export renders every section, room and faculty timetable of an
+academic year in the solver process pool and packs them into one zip. The
+workers get plain rows and write files, they never touch the database. It
+runs in the timetable.export job, never in a web worker: forking the pool
+from a threaded server process is unsafe.
+"""
+import csv
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.text import slugify
+
+from .conflicts import to_minutes
+from .models import Faculty, Room, Subject, TimetableEntry
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+COLUMNS = ['Day', 'Start', 'End', 'Subject code', 'Subject', 'Faculty', 'Room', 'Semester', 'Section']
+ROW_FIELDS = (
+    'day_of_week', 'start_time', 'end_time', 'subject__code', 'subject__name',
+    'faculty__name', 'room__name', 'semester', 'section',
+)
+DAY_NAMES = dict(TimetableEntry.DAYS)
+CHUNK_SIZE = 2000
+
+
+class ExportError(Exception):
+    pass
+
+
+class Document:
+    """One timetable to render: a title, a file name stem and its rows."""
+
+    def __init__(self, kind, name, title, rows):
+        self.kind = kind
+        self.name = name
+        self.title = title
+        self.rows = rows
+
+
+def _hhmm(value):
+    minutes = to_minutes(value)
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def _cells(row):
+    day, start, end = row[:3]
+    return [DAY_NAMES.get(day, day), _hhmm(start), _hhmm(end), *row[3:]]
+
+
+def _ordered(queryset):
+    return queryset.order_by('day_of_week', 'start_time', 'semester', 'section')
+
+
+def document_for(department_id, kind, academic_year, semester=None, section=None, resource_id=None):
+    """The Document for one section, room or faculty timetable; rows are lazy."""
+    entries = TimetableEntry.objects.filter(department_id=department_id, academic_year=academic_year)
+    if kind == 'section':
+        entries = entries.filter(semester=semester, section=section)
+        name = f'section-{academic_year}-{semester}-{slugify(section)}'
+        title = f'Semester {semester}, section {section} ({academic_year})'
+    else:
+        model = Room if kind == 'room' else Faculty
+        resource = model.objects.filter(department_id=department_id, id=resource_id).only('name').first()
+        if resource is None:
+            raise ExportError(f'Unknown {kind}.')
+        entries = entries.filter(**{f'{kind}_id': resource_id})
+        name = f'{kind}-{academic_year}-{resource_id}'
+        title = f"{'Room ' if kind == 'room' else ''}{resource.name} ({academic_year})"
+    rows = _ordered(entries).values_list(*ROW_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    return Document(kind, name, title, rows)
+
+
+def department_documents(department_id, academic_year):
+    """Every section, room and faculty timetable of a year, from one query."""
+    documents = {}
+    entries = _ordered(TimetableEntry.objects.filter(department_id=department_id, academic_year=academic_year))
+    for row in entries.values_list(*ROW_FIELDS, 'room_id', 'faculty_id').iterator(chunk_size=CHUNK_SIZE):
+        row, room_id, faculty_id = row[:-2], row[-2], row[-1]
+        semester, section = row[7], row[8]
+        for key, name, title in (
+            (('section', semester, section), f'sections/{semester}-{slugify(section)}',
+             f'Semester {semester}, section {section} ({academic_year})'),
+            (('room', room_id), f'rooms/{slugify(row[6])}-{room_id}', f'Room {row[6]} ({academic_year})'),
+            (('faculty', faculty_id), f'faculty/{slugify(row[5])}-{faculty_id}', f'{row[5]} ({academic_year})'),
+        ):
+            document = documents.get(key)
+            if document is None:
+                document = documents[key] = Document(key[0], name, title, [])
+            document.rows.append(row)
+    return list(documents.values())
+
+
+class _Echo:
+    """File-like object whose write() hands the value back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """CSV lines as encoded byte strings, one per row."""
+    writer = csv.writer(_Echo())
+    yield ('\ufeff' + writer.writerow(COLUMNS)).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(_cells(row)).encode('utf-8')
+
+
+def write_csv(document, out):
+    for line in iter_csv(document.rows):
+        out.write(line)
+
+
+def _grid(rows):
+    """(days, periods, {(day, period): [lines]}) for a week layout."""
+    rows = list(rows)
+    periods = sorted({(to_minutes(row[1]), to_minutes(row[2])) for row in rows})
+    days = sorted({row[0] for row in rows} | set(range(5)))
+    cells = {}
+    for day, start, end, code, _, faculty, room, semester, section in rows:
+        text = f'{code} {semester}{section}\n{faculty}\n{room}'
+        cells.setdefault((day, (to_minutes(start), to_minutes(end))), []).append(text)
+    return rows, days, periods, cells
+
+
+def _period_label(period):
+    start, end = period
+    return f'{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}'
+
+
+def write_xlsx(document, out):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportError('XLSX export needs openpyxl installed.')
+
+    rows, days, periods, cells = _grid(document.rows)
+    workbook = Workbook(write_only=True)
+    grid = workbook.create_sheet('Timetable')
+    grid.append([document.title])
+    grid.append(['Day'] + [_period_label(period) for period in periods])
+    for day in days:
+        grid.append([DAY_NAMES.get(day, day)] + ['\n\n'.join(cells.get((day, period), [])) for period in periods])
+    sheet = workbook.create_sheet('Entries')
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append(_cells(row))
+    workbook.save(out)
+
+
+def write_pdf(document, out):
+    try:
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+    except ImportError:
+        raise ExportError('PDF export needs reportlab installed.')
+
+    _, days, periods, cells = _grid(document.rows)
+    styles = getSampleStyleSheet()
+    cell_style = styles['BodyText'].clone('cell', fontSize=7, leading=8.5)
+
+    def para(lines):
+        return Paragraph('<br/><br/>'.join(escape(text).replace('\n', '<br/>') for text in lines), cell_style)
+
+    data = [['Day'] + [_period_label(period) for period in periods]]
+    for day in days:
+        data.append([DAY_NAMES.get(day, day)] + [para(cells.get((day, period), [])) for period in periods])
+
+    page = landscape(A4)
+    margin = 24
+    day_width = 60
+    period_width = (page[0] - 2 * margin - day_width) / max(len(periods), 1)
+    table = Table(data, colWidths=[day_width] + [period_width] * len(periods), repeatRows=1)
+    table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('BACKGROUND', (0, 1), (0, -1), colors.whitesmoke),
+        ('FONTSIZE', (0, 0), (-1, 0), 8),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    doc = SimpleDocTemplate(
+        out, pagesize=page, title=document.title,
+        leftMargin=margin, rightMargin=margin, topMargin=margin, bottomMargin=margin,
+    )
+    doc.build([Paragraph(escape(document.title), styles['Heading2']), table])
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'pdf': write_pdf}
+
+
+def render(document, fmt, out):
+    """Write a document to a binary file object."""
+    if fmt not in WRITERS:
+        raise ExportError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    WRITERS[fmt](document, out)
+
+
+def render_to_path(kind, name, title, rows, fmt, path):
+    """Pool task: render plain rows to a file. Returns the path."""
+    with open(path, 'wb') as out:
+        render(Document(kind, name, title, rows), fmt, out)
+    return path
+
+
+def data_version(department_id):
+    """
+    Version of everything an export shows for a department: the count and
+    latest updated_at of its entries, faculty, rooms and subjects. It starts
+    with the latest write's timestamp, so versions sort by age.
+    """
+    parts, latest = [], 0
+    for model in (TimetableEntry, Faculty, Room, Subject):
+        version = model.objects.filter(department_id=department_id).aggregate(
+            count=Count('pk'), latest=Max('updated_at'),
+        )
+        stamp = int(version['latest'].timestamp() * 1_000_000) if version['latest'] else 0
+        parts.append(f"{version['count']}:{stamp}")
+        latest = max(latest, stamp)
+    digest = hashlib.sha1(','.join(parts).encode()).hexdigest()[:12]
+    return f'{latest}-{digest}'
+
+
+def _version_stamp(version):
+    stamp, separator, _ = str(version).partition('-')
+    # Anything not named by data_version() is older than all of its versions.
+    return int(stamp) if separator and stamp.isdigit() else -1
+
+
+class ExportCache:
+    def __init__(self, root):
+        self.root = str(root)
+
+    def path(self, department_id, version, filename):
+        return os.path.join(self.root, str(department_id), str(version), filename)
+
+    def get(self, department_id, version, filename):
+        path = self.path(department_id, version, filename)
+        return path if os.path.exists(path) else None
+
+    def put(self, department_id, version, filename, write):
+        """Call write(out) on a temporary file and move it into place."""
+        path = self.path(department_id, version, filename)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write(out)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.prune(department_id, version)
+        return path
+
+    def prune(self, department_id, version):
+        """
+        Remove files rendered for older versions of a department. A process
+        that read the version just before a write leaves the newer one alone.
+        """
+        department_dir = os.path.join(self.root, str(department_id))
+        current = _version_stamp(version)
+        for name in os.listdir(department_dir):
+            if _version_stamp(name) < current:
+                shutil.rmtree(os.path.join(department_dir, name), ignore_errors=True)
+
+
+_cache = None
+
+
+def get_export_cache():
+    """The process-wide export cache, or None when EXPORT_CACHE_ENABLED is off."""
+    global _cache
+    if not getattr(settings, 'EXPORT_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        _cache = ExportCache(settings.EXPORT_CACHE_DIR)
+    return _cache
+
+
+def export_document(document, fmt, department_id):
+    """Path of the rendered document, rendering it on a cache miss."""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    cache = get_export_cache()
+    filename = f'{document.name}.{FORMATS[fmt][1]}'
+    if cache is None:
+        fd, path = tempfile.mkstemp(suffix=f'.{FORMATS[fmt][1]}')
+        with os.fdopen(fd, 'wb') as out:
+            render(document, fmt, out)
+        return path
+    version = data_version(department_id)
+    return cache.get(department_id, version, filename) or cache.put(
+        department_id, version, filename, lambda out: render(document, fmt, out)
+    )
+
+
+def department_filename(academic_year, fmt):
+    return f'department-{academic_year}-{fmt}.zip'
+
+
+def cached_department_export(department_id, academic_year, fmt):
+    """
+    Path of the department zip already rendered for the current data
+    version, or None. Department zips are only rendered by the
+    timetable.export job, into the cache, so the cache must be enabled.
+    """
+    cache = get_export_cache()
+    if cache is None:
+        raise ExportError('Department exports need the export cache (EXPORT_CACHE_ENABLED).')
+    return cache.get(department_id, data_version(department_id), department_filename(academic_year, fmt))
+
+
+def export_department(department_id, academic_year, fmt, executor=None, progress=None):
+    """
+    Render every timetable of a department's year into one zip and return
+    (path, number of documents). Documents are rendered in `executor` when
+    given, otherwise one after another in this process.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    cache = get_export_cache()
+    version = data_version(department_id) if cache is not None else None
+    filename = department_filename(academic_year, fmt)
+    if cache is not None:
+        cached = cache.get(department_id, version, filename)
+        if cached:
+            with zipfile.ZipFile(cached) as archive:
+                return cached, len(archive.namelist())
+
+    documents = department_documents(department_id, academic_year)
+    if not documents:
+        raise ExportError(f'No timetable entries for {academic_year}.')
+    extension = FORMATS[fmt][1]
+
+    def write(out):
+        with tempfile.TemporaryDirectory() as work_dir, \
+                zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            tasks = []
+            for i, document in enumerate(documents):
+                args = (document.kind, document.name, document.title, document.rows, fmt,
+                        os.path.join(work_dir, f'{i}.{extension}'))
+                tasks.append(executor.submit(render_to_path, *args) if executor else args)
+            for i, (document, task) in enumerate(zip(documents, tasks)):
+                path = task.result() if executor else render_to_path(*task)
+                archive.write(path, f'{document.name}.{extension}')
+                os.remove(path)
+                if progress:
+                    progress(i + 1, len(documents))
+
+    if cache is None:
+        fd, path = tempfile.mkstemp(suffix='.zip')
+        with os.fdopen(fd, 'wb') as out:
+            write(out)
+    else:
+        path = cache.put(department_id, version, filename, write)
+    return path, len(documents)
@@ -0,0 +1,308 @@
+"""
+Per-department change feed for timetable entries.
+
+Entry writes publish compact diffs to a broker once their transaction
+commits; the change_feed view relays them to subscribers as Server-Sent
+Events. Event data::
+
+    {"op": "created", "entries": [{"id": "...", "day_of_week": 0, "start_time": "09:00", ...}]}
+    {"op": "updated", "entries": [{"id": "...", "room": "..."}]}     # changed fields only
+    {"op": "deleted", "entries": [{"id": "..."}]}
+    {"op": "resync"}   # events were missed; refetch the list
+
+The feed is served by the ASGI `events` process while writes happen in the
+WSGI web process and the job workers (see the Procfile), so the default
+DatabaseBroker passes events through the FeedEvent table: publish() inserts
+a row and each serving process polls for new rows every
+TIMETABLE_FEED_POLL_SECONDS while it has subscribers. The in-process Broker
+only suits a single process that both writes and serves the feed (e.g.
+uvicorn in development). TIMETABLE_FEED_BROKER names the class to use; a
+replacement (e.g. one backed by a message bus) needs the same
+subscribe/unsubscribe/replay/publish interface.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+FEED_FIELDS = (
+    ('day_of_week', 'day_of_week'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('faculty', 'faculty_id'),
+    ('subject', 'subject_id'),
+    ('room', 'room_id'),
+    ('semester', 'semester'),
+    ('section', 'section'),
+    ('academic_year', 'academic_year'),
+)
+
+
+def _wire(value):
+    if hasattr(value, 'strftime'):
+        return value.strftime('%H:%M')
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+
+def entry_fields(entry):
+    data = {'id': str(entry.pk)}
+    for name, attname in FEED_FIELDS:
+        data[name] = _wire(getattr(entry, attname))
+    return data
+
+
+def entry_diff(entry):
+    """Fields of an updated entry that differ from the values it was loaded with."""
+    loaded = getattr(entry, '_loaded_values', None)
+    if not loaded:
+        return entry_fields(entry)
+    data = {'id': str(entry.pk)}
+    for name, attname in FEED_FIELDS:
+        value = getattr(entry, attname)
+        if attname not in loaded or loaded[attname] != value:
+            data[name] = _wire(value)
+    return data
+
+
+class Subscription:
+    def __init__(self, department_id, loop, maxsize):
+        self.department_id = str(department_id)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that can't keep up gets one resync instead of a gap.
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Next event, {'op': 'resync'} after an overflow, or None on timeout."""
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return {'op': 'resync'}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    """
+    In-process pub/sub. publish() may be called from any thread; events are
+    handed to each subscriber's event loop with call_soon_threadsafe.
+
+    The last `history` events per department are kept so a reconnecting
+    client (Last-Event-ID) can catch up.
+    """
+
+    def __init__(self, history=256, queue_size=1000):
+        self.history = history
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._recent = {}
+        # Ids start from the clock so they keep increasing across restarts.
+        self._first_id = time.time_ns() // 1000
+        self._ids = itertools.count(self._first_id)
+
+    def subscribe(self, department_id):
+        sub = Subscription(department_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(sub.department_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.department_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.department_id]
+
+    def replay(self, department_id, last_id):
+        """Events after last_id, or None if some of them may have been lost."""
+        if last_id < self._first_id:
+            # An id from before this broker started (e.g. a server restart).
+            return None
+        with self._lock:
+            recent = list(self._recent.get(str(department_id), ()))
+        if len(recent) == self.history and recent[0]['id'] > last_id:
+            return None
+        return [event for event in recent if event['id'] > last_id]
+
+    def publish(self, department_id, event):
+        department_id = str(department_id)
+        with self._lock:
+            event = dict(event, id=next(self._ids))
+            self._recent.setdefault(department_id, deque(maxlen=self.history)).append(event)
+        self._fanout(department_id, event)
+        return event
+
+    def _fanout(self, department_id, event):
+        with self._lock:
+            subs = list(self._subscribers.get(department_id, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has closed.
+                self.unsubscribe(sub)
+
+
+class DatabaseBroker(Broker):
+    """
+    Broker shared by every process through the FeedEvent table.
+
+    publish() runs in the writing process (after the entry's transaction has
+    committed) and inserts one row. A poller thread in each process serving
+    the feed picks up rows newer than the last one it saw and hands them to
+    that process's subscribers; it only runs while there are subscribers.
+    Rows older than `retention` seconds are deleted every `prune_every`
+    publishes, and replay() reads from the table, so Last-Event-ID works
+    across processes and restarts.
+
+    Ids are handed out at insert but become visible at commit, so under
+    concurrent writers (PostgreSQL) a row can appear after a higher id was
+    already polled. Ids skipped over by the cursor are kept as gaps and
+    re-read on later polls for `gap_timeout` seconds; a gap that never fills
+    was a rolled-back insert. Such late rows are delivered out of id order.
+    """
+
+    def __init__(self, poll_interval=None, retention=None, prune_every=100, batch_size=500, gap_timeout=60):
+        super().__init__()
+        self.poll_interval = poll_interval or getattr(settings, 'TIMETABLE_FEED_POLL_SECONDS', 0.5)
+        self.retention = retention or getattr(settings, 'TIMETABLE_FEED_RETENTION_SECONDS', 3600)
+        self.prune_every = prune_every
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self._published = itertools.count(1)
+        self._cursor = None
+        self._gaps = {}  # id skipped by the cursor -> when it was first missed
+        self._wake = threading.Event()
+        self._thread = None
+
+    def subscribe(self, department_id):
+        sub = super().subscribe(department_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='feed-poller', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return sub
+
+    def replay(self, department_id, last_id):
+        """Events after last_id, or None if some of them may have been pruned."""
+        from .models import FeedEvent
+
+        oldest = FeedEvent.objects.order_by('id').values_list('id', flat=True).first()
+        if oldest is None or oldest > last_id + 1:
+            return None
+        rows = FeedEvent.objects.filter(department_id=department_id, id__gt=last_id).order_by('id')
+        return [dict(payload, id=event_id) for event_id, payload in rows.values_list('id', 'payload')]
+
+    def publish(self, department_id, event):
+        from .models import FeedEvent
+
+        row = FeedEvent.objects.create(department_id=department_id, payload=event)
+        if next(self._published) % self.prune_every == 0:
+            self.prune()
+        return dict(event, id=row.id)
+
+    def prune(self):
+        from .models import FeedEvent
+
+        cutoff = timezone.now() - timedelta(seconds=self.retention)
+        FeedEvent.objects.filter(created_at__lt=cutoff).delete()
+
+    def poll(self):
+        """Deliver rows published since the last poll; returns how many there were."""
+        from .models import FeedEvent
+
+        if self._cursor is None:
+            self._cursor = FeedEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            self._gaps.clear()
+            return 0
+        now = time.monotonic()
+        for gap, missed in list(self._gaps.items()):
+            if now - missed > self.gap_timeout:
+                del self._gaps[gap]
+        new_rows = Q(id__gt=self._cursor)
+        if self._gaps:
+            new_rows |= Q(id__in=list(self._gaps))
+        rows = list(
+            FeedEvent.objects.filter(new_rows).order_by('id')
+            .values_list('id', 'department_id', 'payload')[:self.batch_size]
+        )
+        for event_id, department_id, payload in rows:
+            if event_id > self._cursor:
+                # Ids skipped here may still be committing.
+                for gap in range(max(self._cursor + 1, event_id - self.batch_size), event_id):
+                    self._gaps[gap] = now
+                self._cursor = event_id
+            else:
+                del self._gaps[event_id]
+            self._fanout(str(department_id), dict(payload, id=event_id))
+        return len(rows)
+
+    def _run(self):
+        while True:
+            # Clear before checking: a subscribe() after the check sets it
+            # again, so the wait below cannot miss it.
+            self._wake.clear()
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                # Rows published while nobody listens are not delivered later.
+                self._cursor = None
+                self._wake.wait()
+                continue
+            close_old_connections()
+            try:
+                if self.poll() == self.batch_size:
+                    continue
+            except Exception:
+                logger.exception('Change feed poll failed')
+                connection.close()
+            time.sleep(self.poll_interval)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'TIMETABLE_FEED_BROKER', 'timetable.feed.DatabaseBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish(department_id, op, entries):
+    if department_id and entries:
+        try:
+            get_broker().publish(department_id, {'op': op, 'entries': entries})
+        except Exception:
+            # The change is committed; a lost feed event must not fail the request.
+            logger.exception('Could not publish %s change feed event', op)
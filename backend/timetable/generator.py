@@ -0,0 +1,262 @@
+"""
+Glue between the database and the timetable solver.
+
+build_problem() turns a department's subjects, faculty, rooms and existing
+entries into the plain-data problem format of timetable.solver, and
+save_solution() writes a solved timetable back as TimetableEntry rows.
+"""
+import uuid
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.db import transaction
+
+from .conflicts import to_minutes
+from .models import SLOT_MINUTES, Faculty, Room, Subject, TimetableEntry, SlotConflict
+from .signals import entries_bulk_created
+
+DEFAULT_DAYS = [0, 1, 2, 3, 4]
+
+
+class GenerationError(ValueError):
+    pass
+
+
+def section_label(semester, section):
+    return f'{semester}:{section}'
+
+
+def build_periods(day_start='09:00', period_minutes=60, periods_per_day=7, breaks=()):
+    """Return [[start, end], ...] in minutes, skipping periods that start at a break."""
+    if period_minutes <= 0 or periods_per_day <= 0:
+        raise GenerationError('period_minutes and periods_per_day must be positive.')
+    start = to_minutes(day_start)
+    if start % SLOT_MINUTES or period_minutes % SLOT_MINUTES:
+        raise GenerationError(f'day_start and period_minutes must be multiples of {SLOT_MINUTES} minutes.')
+    skip = {to_minutes(b) for b in breaks}
+    periods = []
+    cursor = start
+    while len(periods) < periods_per_day:
+        if cursor + period_minutes > 24 * 60:
+            raise GenerationError('Periods run past midnight.')
+        if cursor not in skip:
+            periods.append([cursor, cursor + period_minutes])
+        cursor += period_minutes
+    return periods
+
+
+def _mask_for(day_index, periods, start, end):
+    mask = 0
+    for period, (p_start, p_end) in enumerate(periods):
+        if p_start < end and p_end > start:
+            mask |= 1 << (day_index * len(periods) + period)
+    return mask
+
+
+def build_problem(department_id, params, extra_faculty=()):
+    """
+    Build a solver problem from request params.
+
+    params keys: academic_year, semester, sections (names or
+    {'name', 'size'} dicts), optional subjects, assignments, days, day_start,
+    period_minutes, periods_per_day, breaks, time_limit (at most
+    TIMETABLE_GENERATE_MAX_SECONDS), seed.
+    extra_faculty: ids from other departments that assignments may name.
+    Raises GenerationError for anything malformed.
+    """
+    try:
+        academic_year = int(params['academic_year'])
+        semester = int(params['semester'])
+    except (KeyError, TypeError, ValueError):
+        raise GenerationError('academic_year and semester are required integers.')
+
+    try:
+        sections = []
+        for item in params.get('sections') or []:
+            if isinstance(item, dict):
+                sections.append((str(item['name']), int(item.get('size', 0))))
+            else:
+                sections.append((str(item), 0))
+    except (KeyError, TypeError, ValueError):
+        raise GenerationError('sections must be names or {"name", "size"} objects.')
+    if not sections:
+        raise GenerationError('At least one section is required.')
+
+    try:
+        days = [int(d) for d in params.get('days', DEFAULT_DAYS)]
+    except (TypeError, ValueError):
+        days = None
+    if not days or not all(0 <= day <= 6 for day in days):
+        raise GenerationError('days must be day numbers from 0 (Monday) to 6.')
+
+    try:
+        periods = build_periods(
+            params.get('day_start', '09:00'),
+            int(params.get('period_minutes', 60)),
+            int(params.get('periods_per_day', 7)),
+            params.get('breaks', ()),
+        )
+    except GenerationError:
+        raise
+    except (AttributeError, IndexError, TypeError, ValueError):
+        raise GenerationError('day_start and breaks must be HH:MM times, period_minutes and periods_per_day integers.')
+
+    max_seconds = getattr(settings, 'TIMETABLE_GENERATE_MAX_SECONDS', 120)
+    try:
+        time_limit = float(params.get('time_limit', 10))
+        seed = int(params.get('seed', 0))
+    except (TypeError, ValueError):
+        time_limit = seed = None
+    if time_limit is None or not 0 < time_limit <= max_seconds:
+        raise GenerationError(f'time_limit must be a number of seconds up to {max_seconds}, and seed an integer.')
+
+    subjects = Subject.objects.filter(department_id=department_id)
+    if params.get('subjects'):
+        try:
+            subjects = subjects.filter(id__in=[uuid.UUID(str(s)) for s in params['subjects']])
+        except (TypeError, ValueError):
+            raise GenerationError('subjects must be a list of subject ids.')
+    subjects = {str(s.id): s for s in subjects}
+    faculty_ids = [str(f) for f in Faculty.objects.filter(department_id=department_id).values_list('id', flat=True)]
+    rooms = [
+        {'id': str(r['id']), 'type': r['type'], 'capacity': r['capacity']}
+        for r in Room.objects.filter(department_id=department_id).values('id', 'type', 'capacity')
+    ]
+
+    # Subject -> how it is taught. Without explicit assignments every subject
+    # is a lecture any department faculty member can take.
+    plans = {}
+    for item in params.get('assignments') or []:
+        try:
+            subject_id = str(item['subject'])
+            candidates = [str(f) for f in item.get('faculty') or faculty_ids]
+            plan_sections = {str(s) for s in item['sections']} if item.get('sections') else None
+            room_type = str(item.get('room_type', 'Lecture'))
+        except (AttributeError, KeyError, TypeError):
+            raise GenerationError('assignments must be {"subject", "faculty", "room_type", "sections"} objects.')
+        if subject_id not in subjects:
+            raise GenerationError(f'Unknown subject {subject_id}.')
+        unknown = set(candidates) - set(faculty_ids) - set(extra_faculty)
+        if unknown:
+            raise GenerationError(f'Unknown faculty {sorted(unknown)[0]}.')
+        plans[subject_id] = {
+            'faculty': candidates,
+            'room_type': room_type,
+            'sections': plan_sections,
+        }
+
+    courses = []
+    for subject_id, subject in subjects.items():
+        plan = plans.get(subject_id, {'faculty': faculty_ids, 'room_type': 'Lecture', 'sections': None})
+        for name, size in sections:
+            if plan['sections'] is not None and name not in plan['sections']:
+                continue
+            courses.append({
+                'subject': subject_id,
+                'credits': subject.credits,
+                'room_type': plan['room_type'],
+                'faculty': plan['faculty'],
+                'section': section_label(semester, name),
+                'size': size,
+            })
+
+    # Everything else already booked this academic year is fixed.
+    section_names = [name for name, _ in sections]
+    existing = TimetableEntry.objects.filter(
+        department_id=department_id, academic_year=academic_year
+    ).exclude(
+        semester=semester, section__in=section_names
+    ).values('day_of_week', 'start_time', 'end_time', 'room_id', 'faculty_id', 'semester', 'section')
+
+    busy = {'room': {}, 'faculty': {}, 'section': {}}
+    day_index = {day: i for i, day in enumerate(days)}
+    for entry in existing.iterator():
+        if entry['day_of_week'] not in day_index:
+            continue
+        mask = _mask_for(
+            day_index[entry['day_of_week']], periods,
+            to_minutes(entry['start_time']), to_minutes(entry['end_time']),
+        )
+        for kind, key in (
+            ('room', str(entry['room_id'])),
+            ('faculty', str(entry['faculty_id'])),
+            ('section', section_label(entry['semester'], entry['section'])),
+        ):
+            busy[kind][key] = busy[kind].get(key, 0) | mask
+
+    return {
+        'academic_year': academic_year,
+        'semester': semester,
+        'days': days,
+        'periods': periods,
+        'rooms': rooms,
+        'courses': courses,
+        'busy': busy,
+        'time_limit': time_limit,
+        'seed': seed,
+    }
+
+
+def _minutes_to_time(minutes):
+    return dt_time(minutes // 60, minutes % 60)
+
+
+def present_solution(result):
+    """Render solver output with HH:MM times and semester/section split out."""
+    def split(label):
+        semester, _, section = label.partition(':')
+        return int(semester), section
+
+    entries = []
+    for item in result['assignments']:
+        semester, section = split(item['section'])
+        entries.append({
+            'day_of_week': item['day_of_week'],
+            'start_time': _minutes_to_time(item['start']).strftime('%H:%M'),
+            'end_time': _minutes_to_time(item['end']).strftime('%H:%M'),
+            'subject': item['subject'],
+            'faculty': item['faculty'],
+            'room': item['room'],
+            'semester': semester,
+            'section': section,
+        })
+    unplaced = []
+    for item in result['unplaced']:
+        semester, section = split(item['section'])
+        unplaced.append(dict(item, semester=semester, section=section))
+    return {'entries': entries, 'unplaced': unplaced, 'stats': result['stats']}
+
+
+def save_solution(department_id, problem, solution):
+    """Replace the generated sections' entries with the solved timetable."""
+    academic_year, semester = problem['academic_year'], problem['semester']
+    sections = {entry['section'] for entry in solution['entries']}
+    sections |= {course['section'].partition(':')[2] for course in problem['courses']}
+    entries = [
+        TimetableEntry(
+            department_id=department_id,
+            day_of_week=item['day_of_week'],
+            start_time=dt_time.fromisoformat(item['start_time']),
+            end_time=dt_time.fromisoformat(item['end_time']),
+            subject_id=item['subject'],
+            faculty_id=item['faculty'],
+            room_id=item['room'],
+            semester=item['semester'],
+            section=item['section'],
+            academic_year=academic_year,
+        )
+        for item in solution['entries']
+    ]
+    try:
+        with transaction.atomic():
+            TimetableEntry.objects.filter(
+                department_id=department_id, academic_year=academic_year,
+                semester=semester, section__in=sections,
+            ).delete()
+            TimetableEntry.objects.bulk_create(entries, batch_size=500)
+            entries_bulk_created.send(sender=TimetableEntry, department_id=department_id, entries=entries)
+    except SlotConflict:
+        raise GenerationError(
+            'A room or faculty member was booked elsewhere while generating; nothing was saved. Try again.'
+        )
+    return entries
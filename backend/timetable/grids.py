@@ -0,0 +1,185 @@
+"""
+Precomputed weekly grids for a section, a room or a faculty member.
+
+Each grid is built from one query and stored in the Django cache under a key
+for its scope, e.g. (department, academic_year, semester, section), together
+with the version of the rows it was built from: the count and latest
+updated_at of the scope's entries and of the department's faculty, rooms and
+subjects. Every read checks that version against the database, so writes
+from other workers, runjobs or the shell are seen on the next read even with
+a per-process cache; the signals only drop the grids an entry change touches
+early, to free the cache.
+
+Grid payload::
+
+    {
+        'kind': 'section', 'scope': {...}, 'version': '3:1767225600000000,...',
+        'periods': [['09:00', '10:00'], ...],
+        'subjects': [[id, code, name], ...],
+        'faculty': [[id, name], ...],
+        'rooms': [[id, name], ...],
+        'sections': [[semester, section], ...],
+        'cells': [                      # one row per day, Monday first
+            [null, [[entry_id, subject_i, faculty_i, room_i, section_i]], ...],
+            ...
+        ],
+        'minutes': [0, 120, ...],       # booked minutes per day
+    }
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+
+from .conflicts import to_minutes
+
+DAYS = 7
+GRID_TIMEOUT = 24 * 60 * 60
+
+
+def _cache():
+    return caches[getattr(settings, 'TIMETABLE_GRID_CACHE', 'default')]
+
+
+def section_scope(department_id, academic_year, semester, section):
+    return ('section', str(department_id), int(academic_year), int(semester), str(section))
+
+
+def room_scope(department_id, academic_year, room_id):
+    return ('room', str(department_id), int(academic_year), str(room_id))
+
+
+def faculty_scope(department_id, academic_year, faculty_id):
+    return ('faculty', str(department_id), int(academic_year), str(faculty_id))
+
+
+def _key(scope):
+    return 'grid:' + ':'.join(str(part) for part in scope)
+
+
+def _filters(scope):
+    kind, department_id, academic_year = scope[:3]
+    filters = {'department_id': department_id, 'academic_year': academic_year}
+    if kind == 'section':
+        filters.update(semester=scope[3], section=scope[4])
+    elif kind == 'room':
+        filters['room_id'] = scope[3]
+    else:
+        filters['faculty_id'] = scope[3]
+    return filters
+
+
+def _fmt(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def build_grid(scope):
+    """Build a grid payload from the database (one query)."""
+    from .models import TimetableEntry
+
+    entries = list(
+        TimetableEntry.objects.filter(**_filters(scope))
+        .select_related('subject', 'faculty', 'room')
+        .order_by('day_of_week', 'start_time')
+    )
+
+    periods = sorted({(to_minutes(e.start_time), to_minutes(e.end_time)) for e in entries})
+    period_index = {period: i for i, period in enumerate(periods)}
+    tables = {'subjects': {}, 'faculty': {}, 'rooms': {}, 'sections': {}}
+
+    def ref(table, key, row):
+        index = tables[table].get(key)
+        if index is None:
+            index = tables[table][key] = (len(tables[table]), row)
+        return index[0]
+
+    cells = [[None] * len(periods) for _ in range(DAYS)]
+    minutes = [0] * DAYS
+    for e in entries:
+        start, end = to_minutes(e.start_time), to_minutes(e.end_time)
+        cell = [
+            str(e.id),
+            ref('subjects', e.subject_id, [str(e.subject_id), e.subject.code, e.subject.name]),
+            ref('faculty', e.faculty_id, [str(e.faculty_id), e.faculty.name]),
+            ref('rooms', e.room_id, [str(e.room_id), e.room.name]),
+            ref('sections', (e.semester, e.section), [e.semester, e.section]),
+        ]
+        slot = cells[e.day_of_week]
+        column = period_index[(start, end)]
+        if slot[column] is None:
+            slot[column] = []
+        slot[column].append(cell)
+        minutes[e.day_of_week] += end - start
+
+    payload = {
+        'kind': scope[0],
+        'scope': dict(zip(('department', 'academic_year'), scope[1:3])),
+        'periods': [[_fmt(s), _fmt(e)] for s, e in periods],
+        'cells': cells,
+        'minutes': minutes,
+    }
+    if scope[0] == 'section':
+        payload['scope'].update(semester=scope[3], section=scope[4])
+    else:
+        payload['scope'][scope[0]] = scope[3]
+    for table, rows in tables.items():
+        payload[table] = [row for _, row in sorted(rows.values(), key=lambda item: item[0])]
+    return payload
+
+
+def _stamp(queryset):
+    version = queryset.aggregate(count=Count('pk'), latest=Max('updated_at'))
+    latest = int(version['latest'].timestamp() * 1_000_000) if version['latest'] else 0
+    return f"{version['count']}:{latest}"
+
+
+def data_version(scope):
+    """Version of the rows a scope's grid shows, read from the database."""
+    from .models import Faculty, Room, Subject, TimetableEntry
+
+    parts = [_stamp(TimetableEntry.objects.filter(**_filters(scope)))]
+    parts += [_stamp(model.objects.filter(department_id=scope[1])) for model in (Faculty, Room, Subject)]
+    return ','.join(parts)
+
+
+def get_grid(scope):
+    """Return the cached grid for a scope, building it on a miss or when stale."""
+    cache = _cache()
+    key = _key(scope)
+    # Read before building: a write that lands during the build leaves the
+    # stored grid with an older version, so it is rebuilt on the next read.
+    version = data_version(scope)
+    grid = cache.get(key)
+    if grid is not None and grid.get('version') == version:
+        return grid
+
+    grid = build_grid(scope)
+    grid['version'] = version
+    cache.set(key, grid, GRID_TIMEOUT)
+    return grid
+
+
+def invalidate(scopes):
+    """Drop the cached grids of scopes an entry change touched."""
+    _cache().delete_many([_key(scope) for scope in set(scopes)])
+
+
+def scopes_for(values):
+    """The grid scopes an entry with these field values appears in."""
+    department_id, academic_year = values['department_id'], values['academic_year']
+    return [
+        section_scope(department_id, academic_year, values['semester'], values['section']),
+        room_scope(department_id, academic_year, values['room_id']),
+        faculty_scope(department_id, academic_year, values['faculty_id']),
+    ]
+
+
+SCOPE_FIELDS = ('department_id', 'academic_year', 'semester', 'section', 'room_id', 'faculty_id')
+
+
+def entry_scopes(entry):
+    """Scopes for an entry's current values plus the values it was loaded with."""
+    scopes = scopes_for({field: getattr(entry, field) for field in SCOPE_FIELDS})
+    loaded = getattr(entry, '_loaded_values', None)
+    if loaded and all(field in loaded for field in SCOPE_FIELDS):
+        scopes += scopes_for(loaded)
+    return scopes
@@ -0,0 +1,271 @@
+"""
+Timetable generation for several departments in one run.
+
+Departments are solved in parallel in the solver process pool. Rooms and
+faculty listed as shared may be booked by any of them, so the run is
+coordinated in rounds:
+
+1. The free slots of every shared resource are split between the
+   departments that could use it, in proportion to their demand (credits of
+   lessons that fit the room, or that the faculty member may teach). Each
+   department sees only its own share, so all of them can be solved at once
+   without talking to each other.
+2. Departments left with unplaced lessons are solved again, sharing out the
+   slots that the settled departments did not use. This repeats for up to
+   `rounds` rounds or until a round stops helping.
+
+Shares never overlap, so the merged timetable has no clash on a shared
+resource; this is checked again before the result is returned.
+"""
+import time
+import uuid
+
+from django.db import transaction
+from django.db.models import Q
+
+from .generator import (
+    DEFAULT_DAYS, GenerationError, _mask_for, build_problem, present_solution, save_solution,
+)
+from .models import Faculty, Room, TimetableEntry
+from .solver import iter_bits, solve
+
+# Keys that must be the same for every department so slot masks line up.
+COMMON_KEYS = ('days', 'day_start', 'period_minutes', 'periods_per_day', 'breaks', 'time_limit', 'seed')
+
+
+def split_slots(free_mask, demands, n_periods):
+    """
+    Share the bits of free_mask between the keys of `demands` in proportion
+    to their weights (smooth weighted round robin). Slots are dealt
+    period-major, so every share is spread across the week.
+    """
+    weights = {key: weight for key, weight in demands.items() if weight > 0}
+    shares = {key: 0 for key in demands}
+    if not weights:
+        return shares
+    total = sum(weights.values())
+    credit = {key: 0 for key in weights}
+    for slot in sorted(iter_bits(free_mask), key=lambda slot: (slot % n_periods, slot)):
+        for key, weight in weights.items():
+            credit[key] += weight
+        chosen = max(credit, key=lambda key: (credit[key], key))
+        credit[chosen] -= total
+        shares[chosen] |= 1 << slot
+    return shares
+
+
+def _section_names(item):
+    names = []
+    for section in item.get('sections') or []:
+        names.append(str(section['name']) if isinstance(section, dict) else str(section))
+    return names
+
+
+def _demand(problem, kind, resource, shared_room_ids, n_slots):
+    """
+    Lessons a department may need a shared resource for. For rooms, the
+    department's own rooms of the same type are used up first.
+    """
+    total = 0
+    for course in problem['courses']:
+        if kind == 'room':
+            fits = (
+                course.get('room_type', 'Lecture') == resource['type']
+                and resource['capacity'] >= course.get('size', 0)
+            )
+        else:
+            fits = resource in course['faculty']
+        if fits:
+            total += course['credits']
+    if kind == 'room':
+        own = sum(
+            1 for room in problem['rooms']
+            if room['id'] not in shared_room_ids and room['type'] == resource['type']
+        )
+        total = max(0, total - own * n_slots)
+    return total
+
+
+class InstitutionRun:
+    def __init__(self, params):
+        try:
+            self.academic_year = int(params['academic_year'])
+        except (KeyError, TypeError, ValueError):
+            raise GenerationError('academic_year is required.')
+        items = params.get('departments') or []
+        if not items:
+            raise GenerationError('At least one department is required.')
+        try:
+            department_ids = [str(uuid.UUID(str(item['department']))) for item in items]
+            shared_room_ids = [str(uuid.UUID(str(r))) for r in params.get('shared_rooms') or []]
+            shared_faculty = [str(uuid.UUID(str(f))) for f in params.get('shared_faculty') or []]
+            self.rounds = max(1, int(params.get('rounds', 3)))
+        except (KeyError, TypeError, ValueError):
+            raise GenerationError(
+                'departments must be {"department": id, ...} objects, shared_rooms and '
+                'shared_faculty lists of ids, and rounds an integer.'
+            )
+        if len(set(department_ids)) != len(department_ids):
+            raise GenerationError('Each department may appear only once.')
+
+        self.shared_rooms = [
+            {'id': str(r['id']), 'type': r['type'], 'capacity': r['capacity']}
+            for r in Room.objects.filter(id__in=shared_room_ids).values('id', 'type', 'capacity')
+        ]
+        if len(self.shared_rooms) != len(set(shared_room_ids)):
+            raise GenerationError('Unknown shared room.')
+        self.shared_faculty = shared_faculty
+        if Faculty.objects.filter(id__in=self.shared_faculty).count() != len(set(self.shared_faculty)):
+            raise GenerationError('Unknown shared faculty member.')
+
+        common = {key: params[key] for key in COMMON_KEYS if key in params}
+        common.setdefault('days', DEFAULT_DAYS)
+        self.problems = {}
+        regenerated = set()
+        for department_id, item in zip(department_ids, items):
+            department_params = dict(item, academic_year=self.academic_year, **common)
+            try:
+                problem = build_problem(department_id, department_params, extra_faculty=self.shared_faculty)
+            except GenerationError as e:
+                raise GenerationError(f'Department {department_id}: {e}')
+            known = {room['id'] for room in problem['rooms']}
+            problem['rooms'] += [room for room in self.shared_rooms if room['id'] not in known]
+            self.problems[department_id] = problem
+            regenerated |= {(department_id, problem['semester'], name) for name in _section_names(item)}
+
+        first = next(iter(self.problems.values()))
+        self.days, self.periods = first['days'], first['periods']
+        self.n_periods = len(self.periods)
+        self.full = (1 << (len(self.days) * self.n_periods)) - 1
+        self.fixed = self._fixed_bookings(regenerated)
+
+    def _fixed_bookings(self, regenerated):
+        """Shared-resource bookings by entries this run does not replace."""
+        fixed = {'room': {}, 'faculty': {}}
+        rows = TimetableEntry.objects.filter(
+            Q(room_id__in=[room['id'] for room in self.shared_rooms]) | Q(faculty_id__in=self.shared_faculty),
+            academic_year=self.academic_year,
+        ).values_list('department_id', 'semester', 'section', 'day_of_week', 'start_time', 'end_time',
+                      'room_id', 'faculty_id')
+        day_index = {day: i for i, day in enumerate(self.days)}
+        for department_id, semester, section, day, start, end, room_id, faculty_id in rows.iterator():
+            if (str(department_id), semester, section) in regenerated or day not in day_index:
+                continue
+            mask = self._mask(day, start, end)
+            for kind, key in (('room', str(room_id)), ('faculty', str(faculty_id))):
+                fixed[kind][key] = fixed[kind].get(key, 0) | mask
+        return fixed
+
+    def _mask(self, day, start, end):
+        if not isinstance(start, int):
+            start, end = start.hour * 60 + start.minute, end.hour * 60 + end.minute
+        return _mask_for(self.days.index(day), self.periods, start, end)
+
+    def _shared(self):
+        for room in self.shared_rooms:
+            yield 'room', room['id'], room
+        for faculty_id in self.shared_faculty:
+            yield 'faculty', faculty_id, faculty_id
+
+    def usage(self, results, departments):
+        """Shared-resource slots booked by the given departments' results."""
+        used = {'room': {}, 'faculty': {}}
+        shared = {(kind, key) for kind, key, _ in self._shared()}
+        for department_id in departments:
+            for item in results[department_id]['assignments']:
+                mask = self._mask(item['day_of_week'], item['start'], item['end'])
+                for kind, key in (('room', item['room']), ('faculty', item['faculty'])):
+                    if (kind, key) in shared:
+                        if used[kind].get(key, 0) & mask:
+                            raise GenerationError(f'Shared {kind} {key} was double-booked across departments.')
+                        used[kind][key] = used[kind].get(key, 0) | mask
+        return used
+
+    def restricted(self, pending, settled_usage):
+        """Per-department problems that only see their share of each shared resource."""
+        shares = {department_id: {} for department_id in pending}
+        shared_ids = {room['id'] for room in self.shared_rooms}
+        n_slots = self.full.bit_length()
+        for kind, key, resource in self._shared():
+            free = self.full & ~self.fixed[kind].get(key, 0) & ~settled_usage[kind].get(key, 0)
+            demands = {
+                department_id: _demand(self.problems[department_id], kind, resource, shared_ids, n_slots)
+                for department_id in pending
+            }
+            for department_id, mask in split_slots(free, demands, self.n_periods).items():
+                shares[department_id][(kind, key)] = mask
+
+        restricted = {}
+        for department_id in pending:
+            problem = self.problems[department_id]
+            busy = {kind: dict(masks) for kind, masks in problem['busy'].items()}
+            for (kind, key), share in shares[department_id].items():
+                busy[kind][key] = busy[kind].get(key, 0) | (self.full & ~share)
+            restricted[department_id] = dict(problem, busy=busy)
+        return restricted
+
+
+def solve_many(problems, executor=None, timeout=None):
+    """Solve {key: problem} in the pool (or in this process without one)."""
+    if executor is None:
+        return {key: solve(problem) for key, problem in problems.items()}
+    futures = {key: executor.submit(solve, problem) for key, problem in problems.items()}
+    return {key: future.result(timeout=timeout) for key, future in futures.items()}
+
+
+def solve_institution(params, executor=None, progress=None):
+    """
+    Solve every department of a multi-department request.
+
+    params: academic_year, departments ([{department, semester, sections,
+    subjects, assignments}]), shared_rooms, shared_faculty, rounds, plus
+    the period settings shared by every department (days, day_start,
+    period_minutes, periods_per_day, breaks, time_limit, seed).
+    """
+    started = time.monotonic()
+    run = InstitutionRun(params)
+    rounds = run.rounds
+    timeout = max(problem['time_limit'] for problem in run.problems.values()) + 30
+
+    results = {}
+    pending = list(run.problems)
+    rounds_used = 0
+    for round_number in range(rounds):
+        if progress:
+            progress(round_number, len(pending))
+        settled = [department_id for department_id in results if department_id not in pending]
+        attempt = solve_many(run.restricted(pending, run.usage(results, settled)), executor, timeout)
+        rounds_used += 1
+        before = sum(len(results[d]['unplaced']) for d in pending) if results else None
+        after = sum(len(attempt[d]['unplaced']) for d in pending)
+        if before is not None and after >= before:
+            break  # Re-sharing stopped helping; keep the previous round.
+        results.update(attempt)
+        pending = [department_id for department_id in pending if results[department_id]['unplaced']]
+        if not pending:
+            break
+
+    run.usage(results, results)  # Raises if two departments share a slot.
+    departments = {department_id: present_solution(results[department_id]) for department_id in run.problems}
+    return run, {
+        'departments': departments,
+        'stats': {
+            'departments': len(departments),
+            'lessons': sum(s['stats']['lessons'] for s in departments.values()),
+            'placed': sum(s['stats']['placed'] for s in departments.values()),
+            'unplaced': sum(len(s['unplaced']) for s in departments.values()),
+            'rounds': rounds_used,
+            'shared_rooms': len(run.shared_rooms),
+            'shared_faculty': len(run.shared_faculty),
+            'seconds': round(time.monotonic() - started, 3),
+        },
+    }
+
+
+def save_institution(run, solution):
+    """Replace every department's generated sections in one transaction."""
+    created = 0
+    with transaction.atomic():
+        for department_id, department_solution in solution['departments'].items():
+            created += len(save_solution(department_id, run.problems[department_id], department_solution))
+    return created
@@ -0,0 +1,78 @@
+"""Background job handlers for heavy timetable operations (see jobs.queue)."""
+import multiprocessing
+
+from jobs.queue import flag, register
+
+from .bulk import import_entries
+from .exports import export_department
+from .generator import build_problem, present_solution, save_solution
+from .institution import save_institution, solve_institution
+from .solver import get_executor, solve
+
+
+@register('timetable.generate')
+def generate_timetable(job, params):
+    job.progress(5, 'Building problem')
+    problem = build_problem(job.department_id, params)
+    job.progress(20, f"Solving {len(problem['courses'])} courses")
+    # Already in a worker process, so solve here rather than in the pool,
+    # stopping early if the job is cancelled.
+    solution = present_solution(solve(problem, should_stop=job.cancelled.is_set))
+    job.progress(85, 'Solved')
+    if flag(params.get('commit')):
+        if solution['unplaced']:
+            solution['error'] = 'Not every lesson could be placed; nothing was saved.'
+        else:
+            job.progress(90, 'Saving timetable')
+            solution['created'] = len(save_solution(job.department_id, problem, solution))
+    return solution
+
+
+@register('timetable.bulk_import')
+def bulk_import(job, params):
+    rows = params.get('rows') or []
+    job.progress(10, f'Importing {len(rows)} rows')
+    return import_entries(
+        job.department_id,
+        rows,
+        dry_run=flag(params.get('dry_run')),
+        all_or_nothing=flag(params.get('all_or_nothing')),
+    )
+
+
+# Private: submitted by GenerateInstitutionView after its IsInstitutionAdmin check.
+@register('timetable.generate_institution', public=False)
+def generate_institution(job, params):
+    job.progress(5, 'Building problems')
+    # runjobs workers are plain processes, so they can fan out to the pool.
+    executor = None if multiprocessing.current_process().daemon else get_executor()
+
+    def progress(round_number, pending):
+        job.progress(10 + 20 * round_number, f'Round {round_number + 1}: solving {pending} department(s)')
+
+    run, solution = solve_institution(params, executor=executor, progress=progress)
+    if flag(params.get('commit')):
+        if solution['stats']['unplaced']:
+            solution['error'] = 'Not every lesson could be placed; nothing was saved.'
+        else:
+            job.progress(90, 'Saving timetables')
+            solution['created'] = save_institution(run, solution)
+    return solution
+
+
+@register('timetable.export')
+def export_timetables(job, params):
+    fmt = params.get('format', 'pdf')
+    academic_year = int(params['academic_year'])
+    executor = None if multiprocessing.current_process().daemon else get_executor()
+
+    def progress(done, total):
+        if done == total or done % 25 == 0:
+            job.progress(5 + 90 * done // total, f'Rendered {done} of {total} documents')
+
+    job.progress(5, 'Collecting timetables')
+    _, documents = export_department(job.department_id, academic_year, fmt, executor=executor, progress=progress)
+    return {
+        'documents': documents,
+        'download_url': f'/api/v1/exports/department/{fmt}/?academic_year={academic_year}',
+    }
@@ -0,0 +1,61 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from meta.models import Department
+from timetable.audit import Audit
+
+
+class Command(BaseCommand):
+    help = "Report room, faculty and section double bookings, whichever way the entries were written."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--department', help='Department id or code; every department if omitted.')
+        parser.add_argument('--academic-year', type=int)
+        parser.add_argument('--ndjson', action='store_true', help='One JSON object per line, for other tools.')
+        parser.add_argument(
+            '--fail-on-conflict', action='store_true',
+            help='Exit with an error if any double booking is found.',
+        )
+
+    def handle(self, *args, **options):
+        departments = Department.objects.order_by('code')
+        if options['department']:
+            value = options['department']
+            try:
+                departments = departments.filter(id=uuid.UUID(value))
+            except ValueError:
+                departments = departments.filter(code=value)
+            if not departments.exists():
+                raise CommandError(f"No department {value}.")
+
+        found = 0
+        for department in departments:
+            audit = Audit(department.id, options['academic_year'])
+            for finding in audit:
+                found += 1
+                if options['ndjson']:
+                    self.stdout.write(json.dumps(finding))
+                    continue
+                resource = finding['resource']
+                if finding['kind'] == 'section':
+                    resource = f"semester {resource['semester']} section {resource['section']}"
+                self.stdout.write(
+                    f"{department.code}: {finding['kind']} {resource} double-booked in {finding['academic_year']} "
+                    f"on day {finding['day_of_week']} {finding['start_time']}-{finding['end_time']}: "
+                    f"entries {', '.join(finding['entries'])}"
+                )
+            summary = audit.summary
+            if options['ndjson']:
+                self.stdout.write(json.dumps({'summary': summary}))
+            else:
+                groups = summary['groups']
+                self.stdout.write(
+                    f"{department.code}: {summary['entries']} entries audited in {summary['elapsed_ms']} ms; "
+                    f"{groups['room']} room, {groups['faculty']} faculty and {groups['section']} section "
+                    f"group(s), {summary['entries_in_conflict']} entries involved."
+                )
+
+        if found and options['fail_on_conflict']:
+            raise CommandError(f"{found} double booking(s) found.")
@@ -0,0 +1,113 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SLOT_MINUTES = 5
+
+
+def fill_slot_occupancy(apps, schema_editor):
+    """Derive slots and occupancy rows for existing entries.
+
+    Existing double bookings can't all be represented under the unique key;
+    their clashing rows are skipped (run rebuild_slot_occupancy to list them).
+    """
+    TimetableEntry = apps.get_model("timetable", "TimetableEntry")
+    SlotOccupancy = apps.get_model("timetable", "SlotOccupancy")
+    batch, rows = [], []
+
+    def flush():
+        TimetableEntry.objects.bulk_update(batch, ["start_slot", "end_slot"])
+        SlotOccupancy.objects.bulk_create(rows, ignore_conflicts=True)
+        batch.clear()
+        rows.clear()
+
+    for entry in TimetableEntry.objects.order_by("pk").iterator(chunk_size=1000):
+        start, end = entry.start_time, entry.end_time
+        entry.start_slot = (start.hour * 60 + start.minute) // SLOT_MINUTES
+        entry.end_slot = -(-(end.hour * 60 + end.minute) // SLOT_MINUTES)
+        batch.append(entry)
+        for resource_type, resource_id in (
+            ("room", entry.room_id),
+            ("faculty", entry.faculty_id),
+        ):
+            rows.extend(
+                SlotOccupancy(
+                    entry_id=entry.pk,
+                    academic_year=entry.academic_year,
+                    day_of_week=entry.day_of_week,
+                    slot=slot,
+                    resource_type=resource_type,
+                    resource_id=resource_id,
+                )
+                for slot in range(entry.start_slot, entry.end_slot)
+            )
+        if len(batch) >= 1000:
+            flush()
+    flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("timetable", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="timetableentry",
+            name="end_slot",
+            field=models.SmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="timetableentry",
+            name="start_slot",
+            field=models.SmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="SlotOccupancy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("academic_year", models.IntegerField()),
+                ("day_of_week", models.SmallIntegerField()),
+                ("slot", models.SmallIntegerField()),
+                (
+                    "resource_type",
+                    models.CharField(
+                        choices=[("room", "Room"), ("faculty", "Faculty")],
+                        max_length=10,
+                    ),
+                ),
+                ("resource_id", models.UUIDField()),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occupancy_rows",
+                        to="timetable.timetableentry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Slot Occupancy",
+                "unique_together": {
+                    (
+                        "academic_year",
+                        "day_of_week",
+                        "slot",
+                        "resource_type",
+                        "resource_id",
+                    )
+                },
+            },
+        ),
+        migrations.RunPython(fill_slot_occupancy, migrations.RunPython.noop),
+    ]
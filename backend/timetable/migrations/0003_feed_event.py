@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("timetable", "0002_slot_occupancy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEvent",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("department_id", models.UUIDField()),
+                ("payload", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["department_id", "id"],
+                        name="timetable_f_departm_73f58d_idx",
+                    )
+                ],
+            },
+        ),
+    ]
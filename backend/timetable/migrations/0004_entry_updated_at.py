@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meta", "0001_initial"),
+        ("timetable", "0003_feed_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="timetableentry",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="timetableentry",
+            index=models.Index(
+                fields=["department", "updated_at"],
+                name="timetable_t_departm_381367_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("timetable", "0004_entry_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faculty",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="subject",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
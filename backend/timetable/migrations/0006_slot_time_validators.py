@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:28
+
+import timetable.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("timetable", "0005_catalog_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="timetableentry",
+            name="end_time",
+            field=models.TimeField(validators=[timetable.models.validate_slot_time]),
+        ),
+        migrations.AlterField(
+            model_name="timetableentry",
+            name="start_time",
+            field=models.TimeField(validators=[timetable.models.validate_slot_time]),
+        ),
+    ]
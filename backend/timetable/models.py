@@ -1,6 +1,36 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Max, Q
 import uuid
 from meta.models import Department
+from .conflicts import to_minutes
+
+# Granularity of the slot columns and SlotOccupancy rows. Entry times must
+# fall on slot boundaries (validate_slot_time), so two entries share a slot
+# only if they really overlap. Rows from before that check round outwards:
+# start down, end up.
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def validate_slot_time(value):
+    if value.second or value.microsecond or value.minute % SLOT_MINUTES:
+        raise ValidationError(
+            f'Times must be on a {SLOT_MINUTES}-minute boundary, e.g. 09:00 or 09:55.',
+            code='slot_boundary',
+        )
+
+
+class SlotConflict(IntegrityError):
+    """
+    An entry's occupancy rows hit the unique constraint: its room or faculty
+    member is already booked. `conflicts` maps 'room'/'faculty' to the
+    clashing entry ids when they are known.
+    """
+
+    def __init__(self, conflicts=None):
+        super().__init__('Room or faculty member is already booked for this time slot.')
+        self.conflicts = conflicts or {}
 
 class Faculty(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -8,6 +38,7 @@ class Faculty(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     designation = models.CharField(max_length=50, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -23,6 +54,7 @@ class Room(models.Model):
     name = models.CharField(max_length=50)
     capacity = models.IntegerField()
     type = models.CharField(max_length=20, choices=ROOM_TYPES)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('department', 'name')
@@ -36,6 +68,7 @@ class Subject(models.Model):
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=20)
     credits = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('department', 'code')
@@ -43,6 +76,33 @@ class Subject(models.Model):
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+class TimetableEntryQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create skips save(), so write the occupancy rows here as well."""
+        objs = list(objs)
+        for entry in objs:
+            entry.assign_slots()
+        rows = [row for entry in objs for row in entry.occupancy()]
+        try:
+            with transaction.atomic(using=self.db):
+                created = super().bulk_create(objs, *args, **kwargs)
+                SlotOccupancy.objects.using(self.db).bulk_create(rows, batch_size=kwargs.get('batch_size'))
+        except IntegrityError as e:
+            if isinstance(e, SlotConflict) or not rows:
+                raise
+            raise SlotConflict() from e
+        return created
+
+    def data_version(self):
+        """
+        (row count, latest updated_at) of the queryset. Any write to one of
+        its rows, from any process, changes it: saves move updated_at on and
+        deletes lower the count.
+        """
+        version = self.aggregate(count=Count('id'), latest=Max('updated_at'))
+        return version['count'], version['latest']
+
+
 class TimetableEntry(models.Model):
     DAYS = [
         (0, 'Monday'),
@@ -56,8 +116,8 @@ class TimetableEntry(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     department = models.ForeignKey(Department, on_delete=models.CASCADE)
     day_of_week = models.IntegerField(choices=DAYS)
-    start_time = models.TimeField()
-    end_time = models.TimeField()
+    start_time = models.TimeField(validators=[validate_slot_time])
+    end_time = models.TimeField(validators=[validate_slot_time])
     
     faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
@@ -66,14 +126,151 @@ class TimetableEntry(models.Model):
     semester = models.IntegerField()
     section = models.CharField(max_length=10)
     academic_year = models.IntegerField()
+
+    # start_time/end_time as SLOT_MINUTES slots of the day, kept up to date
+    # by save() and bulk_create().
+    start_slot = models.SmallIntegerField(default=0, editable=False)
+    end_slot = models.SmallIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TimetableEntryQuerySet.as_manager()
     
     class Meta:
         indexes = [
             models.Index(fields=['department', 'day_of_week']),
             models.Index(fields=['department', 'room', 'day_of_week']),
             models.Index(fields=['department', 'faculty', 'day_of_week']),
+            models.Index(fields=['department', 'updated_at']),
         ]
         verbose_name_plural = "Timetable Entries"
 
+    OCCUPANCY_FIELDS = ('academic_year', 'day_of_week', 'start_slot', 'end_slot', 'room_id', 'faculty_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember what was loaded so change handlers can see the old
+        # room/faculty/section of an updated entry.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def assign_slots(self):
+        self.start_slot = to_minutes(self.start_time) // SLOT_MINUTES
+        self.end_slot = -(-to_minutes(self.end_time) // SLOT_MINUTES)
+
+    def occupancy(self):
+        """Unsaved SlotOccupancy rows for the entry's room and faculty member."""
+        return [
+            SlotOccupancy(
+                entry=self,
+                academic_year=self.academic_year,
+                day_of_week=self.day_of_week,
+                slot=slot,
+                resource_type=resource_type,
+                resource_id=resource_id,
+            )
+            for resource_type, resource_id in (
+                (SlotOccupancy.ROOM, self.room_id),
+                (SlotOccupancy.FACULTY, self.faculty_id),
+            )
+            for slot in range(self.start_slot, self.end_slot)
+        ]
+
+    def find_clashes(self):
+        """Ids of other entries occupying this entry's room or faculty slots."""
+        rows = SlotOccupancy.objects.filter(
+            Q(resource_type=SlotOccupancy.ROOM, resource_id=self.room_id)
+            | Q(resource_type=SlotOccupancy.FACULTY, resource_id=self.faculty_id),
+            academic_year=self.academic_year,
+            day_of_week=self.day_of_week,
+            slot__gte=self.start_slot,
+            slot__lt=self.end_slot,
+        ).exclude(entry_id=self.pk).values_list('resource_type', 'entry_id').distinct()
+        conflicts = {}
+        for resource_type, entry_id in rows:
+            conflicts.setdefault(resource_type, []).append(entry_id)
+        return conflicts
+
+    def _occupancy_changed(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or not loaded:
+            return True
+        return any(
+            field not in loaded or loaded[field] != getattr(self, field)
+            for field in self.OCCUPANCY_FIELDS
+        )
+
+    def save(self, *args, **kwargs):
+        """
+        Save the entry and rewrite its SlotOccupancy rows in one transaction.
+        Raises SlotConflict if the room or faculty member is already booked.
+        """
+        self.assign_slots()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'start_slot', 'end_slot', 'updated_at'}
+        adding = self._state.adding
+        changed = self._occupancy_changed()
+        writing_occupancy = False
+        try:
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+                if changed:
+                    SlotOccupancy.objects.filter(entry=self).delete()
+                    writing_occupancy = True
+                    SlotOccupancy.objects.bulk_create(self.occupancy())
+        except IntegrityError:
+            self._state.adding = adding
+            if not writing_occupancy:
+                raise
+            raise SlotConflict(self.find_clashes())
+
     def __str__(self):
         return f"{self.subject.code} - {self.day_of_week} {self.start_time}"
+
+
+class SlotOccupancy(models.Model):
+    """
+    One row per SLOT_MINUTES slot a room or faculty member is booked for.
+
+    The unique key makes the database itself reject double bookings, and
+    "who is busy on day D at slot S" is a prefix lookup on the same index.
+    Rows are written by TimetableEntry.save()/bulk_create() and removed with
+    their entry.
+    """
+    ROOM = 'room'
+    FACULTY = 'faculty'
+    RESOURCE_TYPES = [
+        (ROOM, 'Room'),
+        (FACULTY, 'Faculty'),
+    ]
+    entry = models.ForeignKey(TimetableEntry, on_delete=models.CASCADE, related_name='occupancy_rows')
+    academic_year = models.IntegerField()
+    day_of_week = models.SmallIntegerField()
+    slot = models.SmallIntegerField()
+    resource_type = models.CharField(max_length=10, choices=RESOURCE_TYPES)
+    resource_id = models.UUIDField()
+
+    class Meta:
+        unique_together = ('academic_year', 'day_of_week', 'slot', 'resource_type', 'resource_id')
+        verbose_name_plural = "Slot Occupancy"
+
+    def __str__(self):
+        return f"{self.resource_type} {self.resource_id} - {self.day_of_week}/{self.slot}"
+
+
+class FeedEvent(models.Model):
+    """
+    A published change-feed event (see timetable.feed.DatabaseBroker), kept
+    for TIMETABLE_FEED_RETENTION_SECONDS so a reconnecting client in any
+    process can replay what it missed. The id is the SSE event id.
+    """
+    id = models.BigAutoField(primary_key=True)
+    department_id = models.UUIDField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['department_id', 'id'])]
+
+    def __str__(self):
+        return f"{self.department_id} #{self.id}"
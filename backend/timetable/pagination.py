@@ -0,0 +1,105 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset (cursor) pagination.
+
+    Rows are ordered by the view's `cursor_ordering` (ascending fields,
+    the last one unique) and the cursor holds the last row's values for all of
+    those fields. The next page is a plain indexed range scan,
+    WHERE (a, b, id) > (x, y, z), no matter how deep the client pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    default_ordering = ('pk',)
+
+    def __init__(self):
+        from django.conf import settings
+        self.page_size = getattr(settings, 'TIMETABLE_PAGE_SIZE', 100)
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'cursor_ordering', self.default_ordering))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, values):
+        raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (ValueError, TypeError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        return values
+
+    def after(self, values):
+        """Q for rows strictly after `values` in (f1, f2, ...) order."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            step = Q(**{f'{field}__gt': values[i]})
+            for previous, value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size_for_request = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.page_size_for_request + 1])
+        self.has_next = len(rows) > self.page_size_for_request
+        self.page = rows[:self.page_size_for_request]
+        return self.page
+
+    def _cursor_value(self, obj, field):
+        value = getattr(obj, 'pk' if field == 'pk' else field)
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        if value is not None and not isinstance(value, (int, float, str, bool)):
+            return str(value)
+        return value
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        values = [self._cursor_value(last, field) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,9 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    Selected with ?format=compact. The view builds a de-duplicated payload
+    (lookup tables plus id references); rendering itself is plain JSON.
+    """
+    format = 'compact'
@@ -0,0 +1,392 @@
+"""
+Incremental repair of a department timetable after a room or faculty member
+becomes unavailable.
+
+Only the entries that use the resource inside the unavailable window are
+re-placed; everything else stays put unless moving one neighbouring entry
+is the only way to fit an affected one. Each affected entry takes the
+cheapest move available, in this order of preference:
+
+1. same time, another suitable room (same type, enough capacity),
+2. same time, a substitute faculty member,
+3. another time on the same day, then another day,
+4. any of the above after pushing one blocking entry to a free slot.
+
+Times are SLOT_MINUTES slots as in SlotOccupancy, and new times are taken
+from the start/end pairs the department already uses, so a repaired entry
+lines up with the rest of the timetable.
+"""
+import time
+from datetime import time as dt_time
+
+from django.db import transaction
+
+from .conflicts import to_minutes
+from .models import SLOT_MINUTES, Faculty, Room, SlotConflict, SlotOccupancy, TimetableEntry
+
+ROOM_CHANGE_COST = 1
+FACULTY_CHANGE_COST = 3
+TIME_CHANGE_COST = 4
+DAY_CHANGE_COST = 8
+EJECTION_COST = 20
+
+
+class RepairError(ValueError):
+    pass
+
+
+def _mask(start_slot, end_slot):
+    return ((1 << (end_slot - start_slot)) - 1) << start_slot
+
+
+def _fmt(value):
+    return value.strftime('%H:%M')
+
+
+class Placement:
+    __slots__ = ('day', 'start_slot', 'end_slot', 'room', 'faculty')
+
+    def __init__(self, day, start_slot, end_slot, room, faculty):
+        self.day = day
+        self.start_slot = start_slot
+        self.end_slot = end_slot
+        self.room = room
+        self.faculty = faculty
+
+    @property
+    def mask(self):
+        return _mask(self.start_slot, self.end_slot)
+
+
+class RepairPlanner:
+    """
+    Works on an in-memory copy of one department's academic year.
+
+    `occupants` maps (kind, key, day) to {entry_id: mask} for kind in room,
+    faculty and section, so both "is it free" and "who is in the way" are
+    dictionary lookups.
+    """
+
+    def __init__(self, entries, rooms, faculty, blocked_kind, blocked_id, blocked_days, blocked_mask,
+                 substitutes=None, time_limit=1.0):
+        self.entries = {e['id']: e for e in entries}
+        self.rooms = rooms
+        self.faculty = faculty
+        self.blocked = (blocked_kind, blocked_id)
+        self.blocked_days = blocked_days
+        self.blocked_mask = blocked_mask
+        self.substitutes = substitutes
+        self.deadline = time.monotonic() + time_limit
+
+        self.current = {}
+        self.occupants = {}
+        self.windows = {}
+        days = set()
+        for entry in entries:
+            placement = Placement(entry['day'], entry['start_slot'], entry['end_slot'], entry['room'], entry['faculty'])
+            self._add(entry['id'], placement)
+            self.windows[(entry['start_slot'], entry['end_slot'])] = (entry['start_time'], entry['end_time'])
+            days.add(entry['day'])
+        self.days = sorted(days | set(blocked_days))
+        self.changed = set()
+
+    # -- state -----------------------------------------------------------
+
+    def _keys(self, entry_id, placement):
+        entry = self.entries[entry_id]
+        return (
+            ('room', placement.room, placement.day),
+            ('faculty', placement.faculty, placement.day),
+            ('section', entry['section'], placement.day),
+        )
+
+    def _add(self, entry_id, placement):
+        self.current[entry_id] = placement
+        for key in self._keys(entry_id, placement):
+            self.occupants.setdefault(key, {})[entry_id] = placement.mask
+
+    def _remove(self, entry_id):
+        placement = self.current.pop(entry_id)
+        for key in self._keys(entry_id, placement):
+            self.occupants[key].pop(entry_id, None)
+        return placement
+
+    def _in_the_way(self, entry_id, placement):
+        """Entries (other than entry_id) that overlap a candidate placement."""
+        found = set()
+        mask = placement.mask
+        for key in self._keys(entry_id, placement):
+            for other, other_mask in self.occupants.get(key, {}).items():
+                if other != entry_id and other_mask & mask:
+                    found.add(other)
+        return found
+
+    def _is_blocked(self, placement):
+        kind, blocked_id = self.blocked
+        if placement.day not in self.blocked_days or not placement.mask & self.blocked_mask:
+            return False
+        return (placement.room if kind == 'room' else placement.faculty) == blocked_id
+
+    # -- candidates ------------------------------------------------------
+
+    def affected(self):
+        return [
+            entry_id for entry_id, placement in self.current.items()
+            if self._is_blocked(placement)
+        ]
+
+    def _room_options(self, original):
+        old = self.rooms.get(original.room)
+        if old is None:
+            return [original.room]
+        suitable = sorted(
+            (room for room in self.rooms.values() if room['type'] == old['type'] and room['capacity'] >= old['capacity']),
+            key=lambda room: (room['id'] != original.room, room['capacity'], room['name']),
+        )
+        return [room['id'] for room in suitable]
+
+    def _faculty_options(self, original):
+        options = [original.faculty]
+        if self.blocked[0] != 'faculty':
+            # A room closure doesn't change who teaches.
+            return options
+        candidates = self.substitutes if self.substitutes is not None else list(self.faculty)
+        options += [faculty_id for faculty_id in candidates if faculty_id != original.faculty and faculty_id in self.faculty]
+        return options
+
+    def _windows(self, original):
+        length = original.end_slot - original.start_slot
+        same_length = [window for window in self.windows if window[1] - window[0] == length]
+        same_length.sort(key=lambda window: (abs(window[0] - original.start_slot), window[0]))
+        days = sorted(self.days, key=lambda day: (day != original.day, abs(day - original.day), day))
+        for day in days:
+            for start_slot, end_slot in same_length:
+                yield day, start_slot, end_slot
+
+    def _time_cost(self, original, placement):
+        if placement.day != original.day:
+            return DAY_CHANGE_COST
+        if placement.start_slot != original.start_slot:
+            return TIME_CHANGE_COST
+        return 0
+
+    def _cost(self, original, placement):
+        cost = self._time_cost(original, placement)
+        if placement.room != original.room:
+            cost += ROOM_CHANGE_COST
+        if placement.faculty != original.faculty:
+            cost += FACULTY_CHANGE_COST
+        return cost
+
+    def _candidates(self, entry_id, original):
+        rooms = self._room_options(original)
+        faculty = self._faculty_options(original)
+        for day, start_slot, end_slot in self._windows(original):
+            for faculty_id in faculty:
+                for room_id in rooms:
+                    placement = Placement(day, start_slot, end_slot, room_id, faculty_id)
+                    if not self._is_blocked(placement):
+                        yield placement
+
+    def best_move(self, entry_id, original):
+        """Cheapest free placement for an entry that is currently unplaced."""
+        best = None
+        for placement in self._candidates(entry_id, original):
+            if best is not None and self._time_cost(original, placement) >= best[0]:
+                # Windows come cheapest first, so nothing later can win.
+                break
+            cost = self._cost(original, placement)
+            if best is not None and cost >= best[0]:
+                continue
+            if not self._in_the_way(entry_id, placement):
+                best = (cost, placement)
+                if cost == 0:
+                    break
+        return best
+
+    def move_with_ejection(self, entry_id, original, fixed):
+        """
+        Place an entry by pushing one unaffected neighbour elsewhere.
+        Returns (cost, placement, blocker_id, blocker_placement) or None.
+        """
+        best = None
+        for placement in self._candidates(entry_id, original):
+            if time.monotonic() > self.deadline:
+                break
+            if best is not None and self._time_cost(original, placement) + EJECTION_COST >= best[0]:
+                break
+            base = self._cost(original, placement) + EJECTION_COST
+            if best is not None and base >= best[0]:
+                continue
+            blockers = self._in_the_way(entry_id, placement)
+            if len(blockers) != 1:
+                continue
+            blocker = blockers.pop()
+            if blocker in fixed:
+                continue
+            blocker_original = self._remove(blocker)
+            self._add(entry_id, placement)
+            moved = self.best_move(blocker, blocker_original)
+            self._remove(entry_id)
+            self._add(blocker, blocker_original)
+            if moved is not None and base + moved[0] < (best[0] if best else float('inf')):
+                best = (base + moved[0], placement, blocker, moved[1])
+        return best
+
+    # -- driver ----------------------------------------------------------
+
+    def plan(self):
+        affected = self.affected()
+        originals = {entry_id: self._remove(entry_id) for entry_id in affected}
+        before = dict(originals)
+        unresolved = []
+        ejected = 0
+        # Longest entries first: they have the fewest places to go.
+        order = sorted(affected, key=lambda entry_id: -(originals[entry_id].end_slot - originals[entry_id].start_slot))
+        for entry_id in order:
+            original = originals[entry_id]
+            move = self.best_move(entry_id, original)
+            if move is not None:
+                self._add(entry_id, move[1])
+                continue
+            move = self.move_with_ejection(entry_id, original, fixed=set(affected) | self.changed)
+            if move is None:
+                unresolved.append(entry_id)
+                continue
+            _, placement, blocker, blocker_placement = move
+            before.setdefault(blocker, self._remove(blocker))
+            self._add(blocker, blocker_placement)
+            self._add(entry_id, placement)
+            self.changed.add(blocker)
+            ejected += 1
+
+        changes = []
+        for entry_id, original in before.items():
+            if entry_id in unresolved:
+                continue
+            changes.append((entry_id, original, self.current[entry_id]))
+        return changes, unresolved, ejected
+
+
+def _entry_rows(department_id, academic_year):
+    rows = TimetableEntry.objects.filter(
+        department_id=department_id, academic_year=academic_year
+    ).values_list(
+        'id', 'day_of_week', 'start_time', 'end_time', 'start_slot', 'end_slot',
+        'room_id', 'faculty_id', 'subject_id', 'semester', 'section',
+    )
+    return [
+        {
+            'id': str(entry_id), 'day': day, 'start_time': start, 'end_time': end,
+            'start_slot': start_slot, 'end_slot': end_slot,
+            'room': str(room_id), 'faculty': str(faculty_id), 'subject': str(subject_id),
+            'section': (semester, section),
+        }
+        for entry_id, day, start, end, start_slot, end_slot, room_id, faculty_id, subject_id, semester, section
+        in rows.iterator()
+    ]
+
+
+def propose_repair(department_id, params):
+    """
+    Build a minimal-change proposal for a resource becoming unavailable.
+
+    params: academic_year, room or faculty (id), optional days (default all),
+    start_time/end_time (default the whole day), substitutes (faculty ids
+    allowed to take over; default any department faculty), time_limit.
+    """
+    started = time.monotonic()
+    try:
+        academic_year = int(params['academic_year'])
+    except (KeyError, TypeError, ValueError):
+        raise RepairError('academic_year is required.')
+
+    if bool(params.get('room')) == bool(params.get('faculty')):
+        raise RepairError('Give exactly one of room or faculty.')
+    kind = 'room' if params.get('room') else 'faculty'
+    blocked_id = str(params[kind])
+
+    rooms = {
+        str(r['id']): {'id': str(r['id']), 'name': r['name'], 'type': r['type'], 'capacity': r['capacity']}
+        for r in Room.objects.filter(department_id=department_id).values('id', 'name', 'type', 'capacity')
+    }
+    faculty = {
+        str(pk): name
+        for pk, name in Faculty.objects.filter(department_id=department_id).values_list('id', 'name')
+    }
+    if blocked_id not in (rooms if kind == 'room' else faculty):
+        raise RepairError(f'Unknown {kind} {blocked_id}.')
+
+    try:
+        days = [int(day) for day in params.get('days') or range(7)]
+        start = to_minutes(params.get('start_time') or '00:00') // SLOT_MINUTES
+        end = -(-to_minutes(params.get('end_time') or '24:00') // SLOT_MINUTES)
+        time_limit = float(params.get('time_limit', 1.0))
+    except (TypeError, ValueError, IndexError):
+        raise RepairError('days must be day numbers and start_time/end_time HH:MM.')
+    if start >= end:
+        raise RepairError('start_time must be before end_time.')
+
+    substitutes = params.get('substitutes')
+    if substitutes is not None:
+        substitutes = [str(faculty_id) for faculty_id in substitutes]
+
+    entries = _entry_rows(department_id, academic_year)
+    planner = RepairPlanner(
+        entries, rooms, faculty, kind, blocked_id, days, _mask(start, end),
+        substitutes=substitutes, time_limit=time_limit,
+    )
+    changes, unresolved, ejected = planner.plan()
+
+    def describe(placement):
+        start_time, end_time = planner.windows[(placement.start_slot, placement.end_slot)]
+        return {
+            'day_of_week': placement.day,
+            'start_time': _fmt(start_time),
+            'end_time': _fmt(end_time),
+            'room': placement.room,
+            'faculty': placement.faculty,
+        }
+
+    return {
+        'changes': [
+            {'entry': entry_id, 'before': describe(before), 'after': describe(after)}
+            for entry_id, before, after in changes
+        ],
+        'unresolved': [
+            {'entry': entry_id, 'reason': 'No free slot with a suitable room and faculty member.'}
+            for entry_id in unresolved
+        ],
+        'stats': {
+            'affected': len(changes) + len(unresolved) - ejected,
+            'moved': len(changes),
+            'ejected': ejected,
+            'seconds': round(time.monotonic() - started, 3),
+        },
+    }
+
+
+def apply_repair(department_id, proposal):
+    """Write a proposal's changes; raises SlotConflict if the timetable moved on."""
+    changes = proposal['changes']
+    ids = [change['entry'] for change in changes]
+    entries = {
+        str(entry.pk): entry
+        for entry in TimetableEntry.objects.filter(department_id=department_id, pk__in=ids)
+    }
+    if len(entries) != len(ids):
+        raise SlotConflict()
+    with transaction.atomic():
+        # Drop the old bookings up front so moved entries can take each
+        # other's places regardless of the order they are saved in.
+        SlotOccupancy.objects.filter(entry_id__in=ids).delete()
+        for change in changes:
+            entry = entries[change['entry']]
+            after = change['after']
+            entry.day_of_week = after['day_of_week']
+            entry.start_time = dt_time.fromisoformat(after['start_time'])
+            entry.end_time = dt_time.fromisoformat(after['end_time'])
+            entry.room_id = after['room']
+            entry.faculty_id = after['faculty']
+            entry.save()
+    return len(changes)
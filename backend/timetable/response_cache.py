@@ -0,0 +1,99 @@
+"""
+Rendered-response cache for the department-scoped API.
+
+Responses are stored under a hash of (department, path, sorted query params,
+renderer, department version). The version is exports.data_version(), read
+from the database on every request, so a write to an entry, faculty member,
+room or subject of the department from any process (another worker, runjobs,
+the shell) moves it; every cached response for the old version is skipped
+from then on and simply ages out. ETags are the SHA-256 of the exact
+response bytes, so they are strong validators.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+
+from .exports import data_version
+
+
+def _cache():
+    return caches[getattr(settings, 'TIMETABLE_RESPONSE_CACHE', 'default')]
+
+
+def clear():
+    """Drop every cached response, e.g. to time the uncached path."""
+    _cache().clear()
+
+
+def etag_for(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match', '')
+    return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+
+
+def not_modified(etag):
+    resp = HttpResponseNotModified()
+    resp['ETag'] = etag
+    return resp
+
+
+class CachedResponseMixin:
+    """
+    Serve list/retrieve responses of a department-scoped viewset from the cache.
+
+    Only 200 responses are stored. A matching If-None-Match gets a 304 whether
+    or not the response was cached.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def response_cache_key(self, request, department_id):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        )
+        renderer = request.accepted_renderer.format
+        raw = repr((str(department_id), request.path, params, renderer, data_version(department_id)))
+        return 'resp:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        department_id = getattr(request.user, 'department_id', None)
+        if self.action not in self.cached_actions or not department_id:
+            return handler(request, *args, **kwargs)
+
+        cache = _cache()
+        key = self.response_cache_key(request, department_id)
+        hit = cache.get(key)
+        if hit is not None:
+            etag, content_type, content = hit
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            resp = HttpResponse(content, content_type=content_type)
+            resp['ETag'] = etag
+            return resp
+
+        resp = self.finalize_response(request, handler(request, *args, **kwargs), *args, **kwargs)
+        if resp.status_code != 200:
+            return resp
+        resp.render()
+        etag = etag_for(resp.content)
+        cache.set(
+            key,
+            (etag, resp['Content-Type'], resp.content),
+            getattr(settings, 'TIMETABLE_RESPONSE_CACHE_TIMEOUT', 300),
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        resp['ETag'] = etag
+        return resp
@@ -1,25 +1,42 @@
 from rest_framework import serializers
-from .models import Faculty, Room, Subject, TimetableEntry
 
-class FacultySerializer(serializers.ModelSerializer):
+from core.metrics import TimedSerializerMixin
+from .models import Faculty, Room, Subject, TimetableEntry, SlotConflict, validate_slot_time
+from .conflicts import conflict_index
+
+
+class ProjectableSerializerMixin(TimedSerializerMixin):
+    """
+    Accepts a `fields` kwarg naming the subset of fields to serialize
+    (the ?fields= sparse fieldset).
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class FacultySerializer(ProjectableSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Faculty
-        fields = '__all__'
+        exclude = ['updated_at']
         read_only_fields = ['department']
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(ProjectableSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Room
-        fields = '__all__'
+        exclude = ['updated_at']
         read_only_fields = ['department']
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(ProjectableSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Subject
-        fields = '__all__'
+        exclude = ['updated_at']
         read_only_fields = ['department']
 
-class TimetableEntrySerializer(serializers.ModelSerializer):
+class TimetableEntrySerializer(ProjectableSerializerMixin, serializers.ModelSerializer):
     faculty_details = FacultySerializer(source='faculty', read_only=True)
     subject_details = SubjectSerializer(source='subject', read_only=True)
     room_details = RoomSerializer(source='room', read_only=True)
@@ -38,27 +55,123 @@ class TimetableEntrySerializer(serializers.ModelSerializer):
         Check for overlaps:
         1. Room overlap
         2. Faculty overlap
+
+        Lookups go through the in-memory conflict index, scoped to the user's
+        department and the entry's academic year and revalidated against the
+        database first, so writes made by other processes are seen. Every
+        clashing entry is reported, not just the first one.
         """
-        department = self.context['request'].user.department_id if hasattr(self.context['request'].user, 'department_id') else None
-        # Note: In production, department should come from context/user. 
-        # For now, we assume it's passed or handled in view.
-        
-        # Room Overlap
-        if TimetableEntry.objects.filter(
-            day_of_week=data['day_of_week'],
-            room=data['room'],
-            start_time__lt=data['end_time'],
-            end_time__gt=data['start_time']
-        ).exists():
-            raise serializers.ValidationError({"room": "This room is already booked for this time slot."})
-
-        # Faculty Overlap
-        if TimetableEntry.objects.filter(
-            day_of_week=data['day_of_week'],
-            faculty=data['faculty'],
-            start_time__lt=data['end_time'],
-            end_time__gt=data['start_time']
-        ).exists():
-            raise serializers.ValidationError({"faculty": "This faculty member is already assigned to a class in this time slot."})
+        user = self.context['request'].user
+        department = getattr(user, 'department_id', None)
+
+        # Partial updates only carry the changed fields.
+        def value(field):
+            if field in data:
+                return data[field]
+            return getattr(self.instance, field, None)
+
+        # An empty time range would occupy no slots and so escape the
+        # SlotOccupancy constraint.
+        start_time, end_time = value('start_time'), value('end_time')
+        if start_time is not None and end_time is not None and start_time >= end_time:
+            raise serializers.ValidationError({'end_time': 'End time must be after start time.'})
+
+        room = value('room')
+        faculty = value('faculty')
+        conflicts = conflict_index.find_conflicts(
+            department,
+            value('academic_year'),
+            value('day_of_week'),
+            start_time,
+            end_time,
+            room_id=room.pk if room else None,
+            faculty_id=faculty.pk if faculty else None,
+            exclude=self.instance.pk if self.instance else None,
+        )
+
+        if conflicts.get('room') or conflicts.get('faculty'):
+            raise serializers.ValidationError(conflict_errors(conflicts))
+
+        return data
+
+    # The index check above is fast but can race with a concurrent write; the
+    # SlotOccupancy unique key is what finally rejects a double booking.
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except SlotConflict as e:
+            raise serializers.ValidationError(conflict_errors(e.conflicts))
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except SlotConflict as e:
+            raise serializers.ValidationError(conflict_errors(e.conflicts))
+
 
+def conflict_errors(conflicts):
+    errors = {}
+    if conflicts.get('room'):
+        errors['room'] = "This room is already booked for this time slot."
+    if conflicts.get('faculty'):
+        errors['faculty'] = "This faculty member is already assigned to a class in this time slot."
+    if not errors:
+        errors['non_field_errors'] = ["This room or faculty member is already booked for this time slot."]
+    errors['conflicts'] = {
+        resource: [str(entry_id) for entry_id in entry_ids]
+        for resource, entry_ids in conflicts.items() if entry_ids
+    }
+    return errors
+
+
+class TimetableEntryCompactSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Entries that reference faculty, subjects and rooms by id only."""
+    class Meta:
+        model = TimetableEntry
+        fields = [
+            'id', 'day_of_week', 'start_time', 'end_time',
+            'faculty', 'subject', 'room', 'semester', 'section', 'academic_year',
+        ]
+        read_only_fields = fields
+
+
+def compact_entries_payload(entries):
+    """
+    Build the ?format=compact body: lookup tables for the faculty, subjects
+    and rooms used by `entries`, each listed once, plus the entries themselves.
+    """
+    faculty, subjects, rooms = {}, {}, {}
+    for entry in entries:
+        faculty.setdefault(entry.faculty_id, entry.faculty)
+        subjects.setdefault(entry.subject_id, entry.subject)
+        rooms.setdefault(entry.room_id, entry.room)
+    return {
+        'faculty': FacultySerializer(faculty.values(), many=True).data,
+        'subjects': SubjectSerializer(subjects.values(), many=True).data,
+        'rooms': RoomSerializer(rooms.values(), many=True).data,
+        'entries': TimetableEntryCompactSerializer(entries, many=True).data,
+    }
+
+
+class TimetableEntryRowSerializer(serializers.Serializer):
+    """
+    Field-level validation for one row of a bulk import.
+
+    Foreign keys are plain UUIDs here; the importer checks them against the
+    department's faculty, subjects and rooms in one pass instead of one query
+    per row.
+    """
+    day_of_week = serializers.ChoiceField(choices=TimetableEntry.DAYS)
+    start_time = serializers.TimeField(validators=[validate_slot_time])
+    end_time = serializers.TimeField(validators=[validate_slot_time])
+    faculty = serializers.UUIDField()
+    subject = serializers.UUIDField()
+    room = serializers.UUIDField()
+    semester = serializers.IntegerField()
+    section = serializers.CharField(max_length=10)
+    academic_year = serializers.IntegerField()
+
+    def validate(self, data):
+        if data['start_time'] >= data['end_time']:
+            raise serializers.ValidationError({'end_time': 'End time must be after start time.'})
         return data
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from core.db_router import mark_written
+from .models import Faculty, Room, Subject, TimetableEntry
+from .conflicts import conflict_index
+from .availability import availability_index
+from . import feed, grids
+
+# bulk_create skips post_save, so bulk writers send this instead.
+# Receivers get department_id and entries (the created TimetableEntry objects).
+entries_bulk_created = Signal()
+
+
+@receiver(post_save, sender=TimetableEntry)
+def index_saved_entry(sender, instance, created=False, **kwargs):
+    scopes = grids.entry_scopes(instance)
+    departments = {scope[1] for scope in scopes}
+    change = feed.entry_fields(instance) if created else feed.entry_diff(instance)
+
+    def apply():
+        conflict_index.update(instance)
+        availability_index.update(instance)
+        grids.invalidate(scopes)
+        for department_id in departments:
+            mark_written(department_id)
+        if len(change) > 1:
+            feed.publish(instance.department_id, 'created' if created else 'updated', [change])
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=TimetableEntry)
+def unindex_deleted_entry(sender, instance, **kwargs):
+    scopes = grids.entry_scopes(instance)
+    entry_id = str(instance.pk)
+
+    def apply():
+        conflict_index.remove(instance)
+        availability_index.remove(instance)
+        grids.invalidate(scopes)
+        mark_written(instance.department_id)
+        feed.publish(instance.department_id, 'deleted', [{'id': entry_id}])
+    transaction.on_commit(apply)
+
+
+@receiver(entries_bulk_created)
+def index_bulk_created_entries(sender, department_id, entries, **kwargs):
+    def apply():
+        scopes = []
+        for entry in entries:
+            conflict_index.update(entry)
+            availability_index.update(entry)
+            scopes += grids.entry_scopes(entry)
+        grids.invalidate(scopes)
+        mark_written(department_id)
+        feed.publish(department_id, 'created', [feed.entry_fields(entry) for entry in entries])
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Faculty)
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Faculty)
+@receiver(post_delete, sender=Room)
+@receiver(post_delete, sender=Subject)
+def mark_catalog_written(sender, instance, **kwargs):
+    department_id = instance.department_id
+    transaction.on_commit(lambda: mark_written(department_id))
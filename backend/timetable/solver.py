@@ -0,0 +1,388 @@
+"""
+Constraint-based weekly timetable solver.
+
+The engine works on plain data (dicts, lists, ints) so a problem can be
+shipped to a worker process. The week is a grid of slots (day x period);
+every set of slots is an int bitmask with bit ``day_index * periods + period``.
+
+Solving runs in three phases:
+
+1. Greedy construction, most-constrained lesson first (MRV), with forward
+   checking: placing a lesson narrows the slot domains of every lesson that
+   shares its section or faculty.
+2. Repair of lessons left unplaced by ejecting at most a couple of blocking
+   lessons to other free slots.
+3. Local search on soft constraints: spread a course's lessons over
+   different days and keep the day compact.
+
+Problem format::
+
+    {
+        'days': [0, 1, 2, 3, 4],
+        'periods': [[540, 600], [600, 660], ...],   # minutes since midnight
+        'rooms': [{'id': ..., 'type': 'Lecture', 'capacity': 60}, ...],
+        'courses': [{
+            'subject': ..., 'credits': 3, 'room_type': 'Lecture',
+            'faculty': [candidate faculty ids],
+            'section': [semester, 'A'], 'size': 60,
+        }, ...],
+        'busy': {'room': {id: mask}, 'faculty': {id: mask}, 'section': {key: mask}},
+        'time_limit': 10,
+        'seed': 0,
+    }
+"""
+import heapq
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SAME_DAY_PENALTY = 10
+LATE_PERIOD_PENALTY = 1
+
+
+class SolverError(Exception):
+    pass
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Lesson:
+    """One weekly occurrence of a course."""
+    __slots__ = ('index', 'course', 'section', 'faculty', 'rooms', 'slot', 'room')
+
+    def __init__(self, index, course, section, faculty, rooms):
+        self.index = index
+        self.course = course
+        self.section = section
+        self.faculty = faculty
+        self.rooms = rooms
+        self.slot = None
+        self.room = None
+
+
+class Solver:
+    def __init__(self, problem, should_stop=None):
+        self.days = list(problem['days'])
+        self.periods = [tuple(p) for p in problem['periods']]
+        if not self.days or not self.periods:
+            raise SolverError('At least one day and one period are required.')
+        self.n_periods = len(self.periods)
+        self.n_slots = len(self.days) * self.n_periods
+        self.full = (1 << self.n_slots) - 1
+        self.deadline = time.monotonic() + problem.get('time_limit', 10)
+        self.should_stop = should_stop
+        self.random = random.Random(problem.get('seed', 0))
+
+        busy = problem.get('busy', {})
+        self.room_busy = {r['id']: busy.get('room', {}).get(r['id'], 0) for r in problem['rooms']}
+        self.faculty_busy = dict(busy.get('faculty', {}))
+        self.section_busy = {}
+        for key, mask in busy.get('section', {}).items():
+            self.section_busy[self._section_key(key)] = mask
+
+        rooms = sorted(problem['rooms'], key=lambda r: (r['capacity'], str(r['id'])))
+        self.courses = problem['courses']
+        self.faculty_load = {}
+        self.lessons = []
+        self.course_lessons = []
+        for course_index, course in enumerate(self.courses):
+            section = self._section_key(course['section'])
+            self.section_busy.setdefault(section, 0)
+            suitable = [
+                r['id'] for r in rooms
+                if r['type'] == course.get('room_type', 'Lecture') and r['capacity'] >= course.get('size', 0)
+            ]
+            faculty = self._pick_faculty(course)
+            lessons = []
+            for _ in range(course['credits']):
+                lesson = Lesson(len(self.lessons), course_index, section, faculty, suitable)
+                self.lessons.append(lesson)
+                lessons.append(lesson)
+            self.course_lessons.append(lessons)
+
+        self.by_section = {}
+        self.by_faculty = {}
+        # Placed lessons per slot, so repair never rescans every lesson.
+        self.occupants = [[] for _ in range(self.n_slots)]
+        for lesson in self.lessons:
+            self.by_section.setdefault(lesson.section, []).append(lesson)
+            self.by_faculty.setdefault(lesson.faculty, []).append(lesson)
+
+    @staticmethod
+    def _section_key(value):
+        return tuple(value) if isinstance(value, (list, tuple)) else value
+
+    def _pick_faculty(self, course):
+        """Balance load: give the course to the least-loaded candidate."""
+        candidates = course.get('faculty') or []
+        if not candidates:
+            raise SolverError(f"Subject {course['subject']} has no candidate faculty.")
+        faculty = min(candidates, key=lambda f: (self.faculty_load.get(f, 0), str(f)))
+        self.faculty_load[faculty] = self.faculty_load.get(faculty, 0) + course['credits']
+        self.faculty_busy.setdefault(faculty, 0)
+        return faculty
+
+    # -- masks -----------------------------------------------------------
+
+    def free_rooms_mask(self, lesson):
+        busy_everywhere = self.full
+        for room in lesson.rooms:
+            busy_everywhere &= self.room_busy[room]
+            if not busy_everywhere:
+                break
+        return self.full & ~busy_everywhere if lesson.rooms else 0
+
+    def domain(self, lesson):
+        return (
+            self.full
+            & ~self.section_busy[lesson.section]
+            & ~self.faculty_busy[lesson.faculty]
+            & self.free_rooms_mask(lesson)
+        )
+
+    def room_at(self, lesson, slot):
+        bit = 1 << slot
+        for room in lesson.rooms:
+            if not self.room_busy[room] & bit:
+                return room
+        return None
+
+    def place(self, lesson, slot, room):
+        bit = 1 << slot
+        lesson.slot, lesson.room = slot, room
+        self.occupants[slot].append(lesson)
+        self.section_busy[lesson.section] |= bit
+        self.faculty_busy[lesson.faculty] |= bit
+        self.room_busy[room] |= bit
+
+    def unplace(self, lesson):
+        bit = ~(1 << lesson.slot)
+        self.occupants[lesson.slot].remove(lesson)
+        self.section_busy[lesson.section] &= bit
+        self.faculty_busy[lesson.faculty] &= bit
+        self.room_busy[lesson.room] &= bit
+        lesson.slot = lesson.room = None
+
+    # -- scoring ---------------------------------------------------------
+
+    def slot_cost(self, lesson, slot):
+        day, period = divmod(slot, self.n_periods)
+        cost = period * LATE_PERIOD_PENALTY
+        for other in self.course_lessons[lesson.course]:
+            if other is not lesson and other.slot is not None and other.slot // self.n_periods == day:
+                cost += SAME_DAY_PENALTY
+        return cost
+
+    def best_slot(self, lesson, mask):
+        best = None
+        for slot in iter_bits(mask):
+            room = self.room_at(lesson, slot)
+            if room is None:
+                continue
+            cost = self.slot_cost(lesson, slot)
+            if best is None or cost < best[0]:
+                best = (cost, slot, room)
+                if cost == 0:
+                    break
+        return best
+
+    def out_of_time(self):
+        return time.monotonic() > self.deadline or (self.should_stop is not None and self.should_stop())
+
+    # -- phases ----------------------------------------------------------
+
+    def construct(self):
+        """Greedy MRV construction with forward checking on section/faculty peers."""
+        domains = {}
+        heap = []
+        for lesson in self.lessons:
+            mask = self.domain(lesson)
+            domains[lesson.index] = mask
+            heapq.heappush(heap, (mask.bit_count(), lesson.index))
+
+        unplaced = []
+        while heap:
+            size, index = heapq.heappop(heap)
+            lesson = self.lessons[index]
+            if lesson.slot is not None or size != domains[index].bit_count():
+                continue
+            choice = self.best_slot(lesson, domains[index])
+            if choice is None:
+                unplaced.append(lesson)
+                domains[index] = 0
+                continue
+            _, slot, room = choice
+            self.place(lesson, slot, room)
+
+            # Forward checking: the slot is gone for every peer.
+            bit = ~(1 << slot)
+            peers = self.by_section[lesson.section] + self.by_faculty[lesson.faculty]
+            for peer in peers:
+                if peer.slot is None and domains[peer.index] & ~bit:
+                    domains[peer.index] &= bit
+                    heapq.heappush(heap, (domains[peer.index].bit_count(), peer.index))
+        return unplaced
+
+    def relocate(self, lesson, forbidden):
+        """Move a placed lesson to any other feasible slot outside `forbidden`."""
+        old_slot, old_room = lesson.slot, lesson.room
+        self.unplace(lesson)
+        choice = self.best_slot(lesson, self.domain(lesson) & ~forbidden & ~(1 << old_slot))
+        if choice is None:
+            self.place(lesson, old_slot, old_room)
+            return False
+        self.place(lesson, choice[1], choice[2])
+        return True
+
+    def blockers(self, lesson, slot):
+        bit = 1 << slot
+        occupants = self.occupants[slot]
+        found = [
+            other for other in occupants
+            if other.section == lesson.section or other.faculty == lesson.faculty
+        ]
+        if self.room_at(lesson, slot) is None:
+            # Every suitable room is taken; evicting one occupant would do.
+            occupant = next((other for other in occupants if other.room in lesson.rooms), None)
+            if occupant is None:
+                return None
+            found.append(occupant)
+        if self.section_busy[lesson.section] & bit and not any(o.section == lesson.section for o in found):
+            return None  # Blocked by a fixed, pre-existing entry.
+        if self.faculty_busy[lesson.faculty] & bit and not any(o.faculty == lesson.faculty for o in found):
+            return None
+        return list({id(o): o for o in found}.values())
+
+    def repair(self, unplaced, max_ejections=2):
+        """Place leftovers by pushing at most `max_ejections` blockers elsewhere."""
+        remaining = []
+        for position, lesson in enumerate(unplaced):
+            if self.out_of_time():
+                remaining.extend(unplaced[position:])
+                break
+            placed = False
+            candidates = []
+            for slot in range(self.n_slots):
+                if self.out_of_time():
+                    break
+                found = self.blockers(lesson, slot)
+                if found is not None and len(found) <= max_ejections:
+                    candidates.append((len(found), self.slot_cost(lesson, slot), slot, found))
+            candidates.sort(key=lambda c: c[:3])
+            for _, _, slot, found in candidates:
+                if self.out_of_time():
+                    break
+                moved = []
+                ok = True
+                for other in found:
+                    if other.slot != slot:
+                        continue
+                    if self.relocate(other, forbidden=1 << slot):
+                        moved.append(other)
+                    else:
+                        ok = False
+                        break
+                room = self.room_at(lesson, slot) if ok else None
+                if ok and room is not None and self.domain(lesson) & (1 << slot):
+                    self.place(lesson, slot, room)
+                    placed = True
+                    break
+                # Roll back is not needed for correctness: moved lessons stay
+                # at valid slots, they just don't free this one.
+            if not placed:
+                remaining.append(lesson)
+        return remaining
+
+    def improve(self):
+        """Hill-climb on soft penalties with single-lesson moves."""
+        improved = True
+        while improved and not self.out_of_time():
+            improved = False
+            order = [lesson for lesson in self.lessons if lesson.slot is not None]
+            self.random.shuffle(order)
+            for lesson in order:
+                current = self.slot_cost(lesson, lesson.slot)
+                if current == 0:
+                    continue
+                old_slot, old_room = lesson.slot, lesson.room
+                self.unplace(lesson)
+                choice = self.best_slot(lesson, self.domain(lesson))
+                if choice is not None and choice[0] < current:
+                    self.place(lesson, choice[1], choice[2])
+                    improved = True
+                else:
+                    self.place(lesson, old_slot, old_room)
+                if self.out_of_time():
+                    break
+
+    def penalty(self):
+        return sum(self.slot_cost(lesson, lesson.slot) for lesson in self.lessons if lesson.slot is not None)
+
+    def solve(self):
+        started = time.monotonic()
+        unplaced = self.construct()
+        if unplaced:
+            unplaced = self.repair(unplaced)
+        self.improve()
+
+        assignments = []
+        for lesson in self.lessons:
+            if lesson.slot is None:
+                continue
+            course = self.courses[lesson.course]
+            day_index, period = divmod(lesson.slot, self.n_periods)
+            start, end = self.periods[period]
+            assignments.append({
+                'subject': course['subject'],
+                'faculty': lesson.faculty,
+                'room': lesson.room,
+                'section': list(lesson.section) if isinstance(lesson.section, tuple) else lesson.section,
+                'day_of_week': self.days[day_index],
+                'start': start,
+                'end': end,
+            })
+        return {
+            'assignments': assignments,
+            'unplaced': [
+                {
+                    'subject': self.courses[lesson.course]['subject'],
+                    'faculty': lesson.faculty,
+                    'section': list(lesson.section) if isinstance(lesson.section, tuple) else lesson.section,
+                    'reason': 'no suitable room' if not lesson.rooms else 'no free slot',
+                }
+                for lesson in unplaced
+            ],
+            'stats': {
+                'lessons': len(self.lessons),
+                'placed': len(assignments),
+                'penalty': self.penalty(),
+                'seconds': round(time.monotonic() - started, 3),
+            },
+        }
+
+
+def solve(problem, should_stop=None):
+    """
+    Solve a problem dict in the current process. `should_stop`, a callable,
+    ends the repair and search phases early once it returns true.
+    """
+    return Solver(problem, should_stop).solve()
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        from django.conf import settings
+
+        workers = getattr(settings, 'TIMETABLE_SOLVER_WORKERS', None) or os.cpu_count() or 1
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
@@ -1,3 +1,791 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from datetime import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from jobs.models import Job
+from jobs.queue import JobCancelled, JobContext, cancel, claim_next
+from meta.models import Department
+
+from . import bulk, grids, solver
+from .availability import slot_range_mask
+from .conflicts import conflict_index
+from .exports import ExportCache, data_version, document_for, export_document
+from .feed import DatabaseBroker
+from .jobs import export_timetables, generate_timetable
+from .models import Faculty, FeedEvent, Room, SlotConflict, SlotOccupancy, Subject, TimetableEntry
+from .repair import apply_repair, propose_repair
+from .views import TimetableEntryViewSet
+
+
+class DepartmentFixture:
+    """A department with two lecture rooms, two faculty members and a subject."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Computer Science', code='CS')
+        cls.faculty = Faculty.objects.create(department=cls.department, name='Ada', email='ada@example.com')
+        cls.faculty2 = Faculty.objects.create(department=cls.department, name='Alan', email='alan@example.com')
+        cls.room = Room.objects.create(department=cls.department, name='R1', capacity=60, type='Lecture')
+        cls.room2 = Room.objects.create(department=cls.department, name='R2', capacity=60, type='Lecture')
+        cls.subject = Subject.objects.create(department=cls.department, name='Algorithms', code='CS101', credits=3)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def client_for(self, department):
+        user = User.objects.create(username=f'user-{department.code}')
+        user.department_id = department.id
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def entry(self, **fields):
+        values = dict(
+            department=self.department, day_of_week=0, start_time=time(9), end_time=time(10),
+            faculty=self.faculty, subject=self.subject, room=self.room,
+            semester=1, section='A', academic_year=2026,
+        )
+        values.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return TimetableEntry.objects.create(**values)
+
+
+class ConflictIndexTests(DepartmentFixture, TestCase):
+    def find(self, **slot):
+        values = dict(
+            academic_year=2026, day_of_week=0, start_time=time(9, 30), end_time=time(10, 30),
+            room_id=self.room.id, faculty_id=self.faculty2.id,
+        )
+        values.update(slot)
+        return conflict_index.find_conflicts(self.department.id, **values)
+
+    def test_sees_writes_made_without_its_signals(self):
+        self.assertEqual(self.find(), {'room': [], 'faculty': []})
+        # on_commit callbacks don't run here, as for a write made by another process.
+        entry = TimetableEntry.objects.create(
+            department=self.department, day_of_week=0, start_time=time(9), end_time=time(10),
+            faculty=self.faculty, subject=self.subject, room=self.room,
+            semester=1, section='A', academic_year=2026,
+        )
+        self.assertEqual(self.find(), {'room': [entry.id], 'faculty': []})
+
+        moved = TimetableEntry.objects.get(pk=entry.pk)
+        moved.room = self.room2
+        moved.save()
+        self.assertEqual(self.find(), {'room': [], 'faculty': []})
+        self.assertEqual(self.find(room_id=self.room2.id), {'room': [entry.id], 'faculty': []})
+
+        TimetableEntry.objects.filter(pk=entry.pk).delete()
+        self.assertEqual(self.find(room_id=self.room2.id), {'room': [], 'faculty': []})
+
+    def test_api_rejects_a_double_booking_the_index_was_not_told_about(self):
+        client = self.client_for(self.department)
+        body = {
+            'day_of_week': 0, 'start_time': '09:00', 'end_time': '10:00', 'faculty': str(self.faculty.id),
+            'subject': str(self.subject.id), 'room': str(self.room.id), 'semester': 1, 'section': 'A',
+            'academic_year': 2026,
+        }
+        self.assertEqual(client.post('/api/v1/entries/', body, format='json').status_code, 201)
+        body.update(faculty=str(self.faculty2.id), section='B')
+        resp = client.post('/api/v1/entries/', body, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('room', resp.json())
+
+
+class AvailabilityTests(DepartmentFixture, TestCase):
+    def test_rejects_times_outside_the_day(self):
+        client = self.client_for(self.department)
+        for start, end in [('24:30', '25:00'), ('-5:00', '10:00'), ('09:00', '09:00'), ('9am', '10:00'), ('09:60', '10:00')]:
+            resp = client.get('/api/v1/availability/rooms/', {
+                'academic_year': 2026, 'day': 0, 'start_time': start, 'end_time': end,
+            })
+            self.assertEqual(resp.status_code, 400, (start, end))
+        self.assertEqual(slot_range_mask('24:30', '25:00'), 0)
+        self.assertEqual(slot_range_mask('-5:00', '00:10'), 0b11)
+
+    def test_free_rooms_sees_bookings_and_rooms_added_elsewhere(self):
+        client = self.client_for(self.department)
+        self.entry()
+        query = {'academic_year': 2026, 'day': 0, 'start_time': '09:30', 'end_time': '24:00'}
+        resp = client.get('/api/v1/availability/rooms/', query)
+        self.assertEqual([room['name'] for room in resp.json()['results']], ['R2'])
+
+        # No signals run for these, as for writes from another process.
+        Room.objects.filter(pk=self.room2.pk).update(capacity=10)
+        Room.objects.create(department=self.department, name='R3', capacity=30, type='Lecture')
+        resp = client.get('/api/v1/availability/rooms/', query)
+        self.assertEqual([room['name'] for room in resp.json()['results']], ['R2', 'R3'])
+
+
+class GenerateViewTests(DepartmentFixture, TestCase):
+    def test_malformed_bodies_are_rejected(self):
+        client = self.client_for(self.department)
+        base = {'academic_year': 2026, 'semester': 1, 'sections': ['A']}
+        for body in [
+            dict(base, sections=[{'size': 3}]),
+            dict(base, days=['x']),
+            dict(base, days=[9]),
+            dict(base, subjects=['nope']),
+            dict(base, breaks=['noon']),
+            dict(base, assignments=['x']),
+            dict(base, time_limit=10 ** 6),
+            dict(base, time_limit='nan'),
+        ]:
+            resp = client.post('/api/v1/generate/', body, format='json')
+            self.assertEqual(resp.status_code, 400, body)
+            self.assertIn('error', resp.json())
+        self.assertFalse(Job.objects.exists())
+
+    def test_queues_a_job(self):
+        client = self.client_for(self.department)
+        body = {'academic_year': 2026, 'semester': 1, 'sections': ['A'], 'commit': 'false'}
+        resp = client.post('/api/v1/generate/', body, format='json')
+        self.assertEqual(resp.status_code, 202)
+        job = Job.objects.get(id=resp.json()['id'])
+        self.assertEqual((job.kind, job.department_id), ('timetable.generate', self.department.id))
+        self.assertIs(job.params['commit'], False)
+
+    def test_cancelling_stops_the_solve(self):
+        client = self.client_for(self.department)
+        body = {'academic_year': 2026, 'semester': 1, 'sections': ['A'], 'commit': True}
+        self.assertEqual(client.post('/api/v1/generate/', body, format='json').status_code, 202)
+        job = claim_next()
+        context = JobContext(job)
+
+        def solve(problem, should_stop):
+            # A cancel arrives mid-solve and the job's watcher passes it on.
+            cancel(job)
+            context.cancelled.set()
+            self.assertTrue(should_stop())
+            return solver.solve(problem, should_stop)
+
+        with mock.patch('timetable.jobs.solve', solve), self.assertRaises(JobCancelled):
+            generate_timetable(context, job.params)
+        self.assertFalse(TimetableEntry.objects.exists())
+
+
+class SolverTests(SimpleTestCase):
+    def problem(self, **fields):
+        problem = {
+            'days': [0, 1, 2],
+            'periods': [[540, 600], [600, 660], [660, 720]],
+            'rooms': [{'id': 'r1', 'type': 'Lecture', 'capacity': 60}, {'id': 'lab', 'type': 'Lab', 'capacity': 30}],
+            'courses': [
+                {'subject': f's{n}', 'credits': 3, 'faculty': ['f1', 'f2'], 'section': [1, 'A'], 'size': 50}
+                for n in range(2)
+            ] + [{'subject': 's2', 'credits': 2, 'faculty': ['f1'], 'section': [1, 'B'], 'size': 50}],
+            'time_limit': 5,
+        }
+        problem.update(fields)
+        return problem
+
+    def assert_no_clashes(self, assignments):
+        for kind in ('room', 'faculty', 'section'):
+            taken = [(str(a[kind]), a['day_of_week'], a['start']) for a in assignments]
+            self.assertEqual(len(taken), len(set(taken)), kind)
+
+    def test_places_every_lesson_without_clashes(self):
+        result = solver.solve(self.problem())
+        self.assertEqual((len(result['assignments']), result['unplaced']), (8, []))
+        self.assert_no_clashes(result['assignments'])
+        # A course's lessons are spread over different days.
+        days = [a['day_of_week'] for a in result['assignments'] if a['subject'] == 's0']
+        self.assertEqual(len(set(days)), 3)
+
+    def test_respects_busy_slots(self):
+        # r1 is booked for the whole of day 0 elsewhere.
+        result = solver.solve(self.problem(busy={'room': {'r1': 0b111}}))
+        self.assertEqual(len(result['unplaced']), 2)
+        self.assertFalse([a for a in result['assignments'] if a['day_of_week'] == 0])
+        self.assert_no_clashes(result['assignments'])
+
+    def test_reports_lessons_without_a_suitable_room(self):
+        course = {'subject': 'big', 'credits': 1, 'faculty': ['f3'], 'section': [1, 'C'], 'size': 100}
+        result = solver.solve(self.problem(courses=[course]))
+        self.assertEqual(result['unplaced'], [
+            {'subject': 'big', 'faculty': 'f3', 'section': [1, 'C'], 'reason': 'no suitable room'},
+        ])
+
+    def test_same_seed_same_timetable(self):
+        self.assertEqual(
+            solver.solve(self.problem(seed=7))['assignments'], solver.solve(self.problem(seed=7))['assignments'],
+        )
+
+    def test_should_stop_ends_the_search(self):
+        calls = []
+
+        def should_stop():
+            calls.append(1)
+            return True
+
+        result = solver.solve(self.problem(time_limit=60), should_stop=should_stop)
+        self.assertTrue(calls)
+        self.assertLess(result['stats']['seconds'], 5)
+        self.assert_no_clashes(result['assignments'])
+
+    def test_repair_stops_scanning_slots_once_out_of_time(self):
+        engine = solver.Solver(self.problem(busy={'room': {'r1': 0b111}}))
+        unplaced = engine.construct()
+        self.assertTrue(unplaced)
+        for slot, occupants in enumerate(engine.occupants):
+            self.assertEqual(occupants, [lesson for lesson in engine.lessons if lesson.slot == slot])
+
+        stops = iter([False, False, True])
+        engine.should_stop = lambda: next(stops, True)
+        with mock.patch.object(engine, 'blockers', wraps=engine.blockers) as blockers:
+            self.assertEqual(engine.repair(unplaced), unplaced)
+        # One slot checked before the flag flipped, instead of every slot per lesson.
+        self.assertEqual(blockers.call_count, 1)
+
+    def test_rejects_courses_nobody_can_teach(self):
+        with self.assertRaises(solver.SolverError):
+            solver.solve(self.problem(courses=[{'subject': 'x', 'credits': 1, 'faculty': [], 'section': 'A'}]))
+
+
+class GenerateInstitutionViewTests(DepartmentFixture, TestCase):
+    def post(self, body, username='user', **attrs):
+        user = User.objects.create(username=username, is_staff=attrs.pop('is_staff', False))
+        user.department_id = self.department.id
+        for name, value in attrs.items():
+            setattr(user, name, value)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/api/v1/generate/institution/', body, format='json')
+
+    def body(self, **fields):
+        body = {
+            'academic_year': 2026, 'commit': 'false',
+            'departments': [{'department': str(self.department.id), 'semester': 1, 'sections': ['A']}],
+        }
+        body.update(fields)
+        return body
+
+    def test_needs_staff_or_an_institution_role(self):
+        self.assertEqual(self.post(self.body(), 'clerk').status_code, 403)
+        self.assertEqual(self.post(self.body(), 'teacher', clerk_role='faculty').status_code, 403)
+        self.assertEqual(self.post(self.body(), 'admin', clerk_role='admin').status_code, 202)
+        self.assertEqual(self.post(self.body(), 'staff', is_staff=True).status_code, 202)
+
+    def test_queues_a_job_owned_by_its_submitter(self):
+        resp = self.post(self.body(), 'admin', clerk_role='admin')
+        job = Job.objects.get(id=resp.json()['id'])
+        self.assertEqual((job.kind, job.department_id, job.submitted_by), ('timetable.generate_institution', None, 'admin'))
+        self.assertIs(job.params['commit'], False)
+
+    def test_malformed_bodies_are_rejected(self):
+        for n, body in enumerate([
+            self.body(departments=['x']),
+            self.body(departments=[{'department': 'nope'}]),
+            self.body(shared_rooms=['nope']),
+            self.body(rounds='many'),
+        ]):
+            resp = self.post(body, f'staff-{n}', is_staff=True)
+            self.assertEqual(resp.status_code, 400, body)
+        self.assertFalse(Job.objects.exists())
+
+
+class ExportCacheTests(DepartmentFixture, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        settings = override_settings(EXPORT_CACHE_DIR=self.root, EXPORT_CACHE_ENABLED=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def export(self):
+        document = document_for(self.department.id, 'section', 2026, semester=1, section='A')
+        return export_document(document, 'csv', self.department.id)
+
+    def test_writes_from_anywhere_start_a_new_version(self):
+        entry = self.entry()
+        first = self.export()
+        self.assertEqual(self.export(), first)
+
+        # Neither write goes through this process's signals.
+        room = Room.objects.get(pk=self.room.pk)
+        room.name = 'R9'
+        room.save()
+        second = self.export()
+        self.assertNotEqual(second, first)
+        with open(second, encoding='utf-8-sig') as f:
+            self.assertIn('R9', f.read())
+
+        TimetableEntry.objects.filter(pk=entry.pk).delete()
+        self.assertNotEqual(self.export(), second)
+
+    def test_department_zip_is_rendered_by_a_job_then_served(self):
+        self.entry()
+        client = self.client_for(self.department)
+        url = '/api/v1/exports/department/csv/?academic_year=2026'
+        resp = client.get(url)
+        self.assertEqual(resp.status_code, 202)
+        job = claim_next()
+        self.assertEqual((job.kind, job.params), ('timetable.export', {'format': 'csv', 'academic_year': 2026}))
+
+        # Rendered in the job process; nothing is forked from the web worker.
+        with mock.patch('timetable.jobs.get_executor', return_value=None):
+            result = export_timetables(JobContext(job), job.params)
+        self.assertEqual(result['download_url'], '/api/v1/exports/department/csv/?academic_year=2026')
+
+        resp = client.get(url)
+        self.assertEqual((resp.status_code, resp['Content-Type']), (200, 'application/zip'))
+        with zipfile.ZipFile(io.BytesIO(b''.join(resp.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), result['documents'])
+        self.assertFalse(Job.objects.filter(status=Job.QUEUED).exists())
+
+    def test_prune_keeps_newer_versions(self):
+        cache = ExportCache(self.root)
+        old = data_version(self.department.id)
+        self.entry()
+        new = data_version(self.department.id)
+        cache.put(self.department.id, new, 'a.csv', lambda out: out.write(b'new'))
+        # A process that read the version before the write finishes later.
+        cache.put(self.department.id, old, 'a.csv', lambda out: out.write(b'old'))
+        self.assertTrue(os.path.exists(cache.path(self.department.id, new, 'a.csv')))
+
+        cache.put(self.department.id, new, 'b.csv', lambda out: out.write(b'new'))
+        self.assertEqual(os.listdir(os.path.join(self.root, str(self.department.id))), [new])
+
+
+class SlotBoundaryTests(DepartmentFixture, TestCase):
+    def body(self, **fields):
+        body = {
+            'day_of_week': 0, 'start_time': '09:00', 'end_time': '10:00', 'faculty': str(self.faculty.id),
+            'subject': str(self.subject.id), 'room': str(self.room.id), 'semester': 1, 'section': 'A',
+            'academic_year': 2026,
+        }
+        body.update(fields)
+        return body
+
+    def test_entries_off_the_slot_grid_are_rejected(self):
+        client = self.client_for(self.department)
+        resp = client.post('/api/v1/entries/', self.body(end_time='09:52'), format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('end_time', resp.json())
+
+        resp = client.post('/api/v1/entries/bulk/', [
+            self.body(end_time='09:55'),
+            self.body(start_time='09:55:30', end_time='10:30', section='B', faculty=str(self.faculty2.id)),
+        ], format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertIn('start_time', resp.json()['rows'][1]['errors'])
+        self.assertEqual(TimetableEntry.objects.count(), 1)
+
+    def test_entries_must_end_after_they_start(self):
+        client = self.client_for(self.department)
+        for end_time in ('09:00', '08:00'):
+            resp = client.post('/api/v1/entries/', self.body(end_time=end_time), format='json')
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('end_time', resp.json())
+
+        entry = self.entry()
+        resp = client.patch(f'/api/v1/entries/{entry.id}/', {'start_time': '10:00'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(TimetableEntry.objects.get(id=entry.id).start_time, time(9))
+
+    def test_adjacent_entries_do_not_share_a_slot(self):
+        client = self.client_for(self.department)
+        first = client.post('/api/v1/entries/', self.body(end_time='09:55'), format='json')
+        second = client.post('/api/v1/entries/', self.body(start_time='09:55', section='B'), format='json')
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+
+
+class BulkImportTests(DepartmentFixture, TestCase):
+    def row(self, **fields):
+        row = {
+            'day_of_week': 0, 'start_time': '09:00', 'end_time': '10:00', 'faculty': str(self.faculty.id),
+            'subject': str(self.subject.id), 'room': str(self.room.id), 'semester': 1, 'section': 'A',
+            'academic_year': 2026,
+        }
+        row.update(fields)
+        return row
+
+    def post(self, rows, query=''):
+        return self.client_for(self.department).post(f'/api/v1/entries/bulk/{query}', rows, format='json')
+
+    def test_clean_rows_are_checked_in_one_sweep_and_created(self):
+        rows = [self.row(), self.row(day_of_week=1), self.row(start_time='10:00', end_time='11:00')]
+        with mock.patch.object(bulk, 'sweep_overlaps', wraps=bulk.sweep_overlaps) as sweep:
+            resp = self.post(rows)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()['created'], 3)
+        self.assertEqual([row['status'] for row in resp.json()['rows']], ['created'] * 3)
+        sweep.assert_called_once()
+        self.assertEqual(TimetableEntry.objects.count(), 3)
+
+    def test_rows_clashing_with_each_other_are_rejected(self):
+        resp = self.post([self.row(), self.row(section='B', faculty=str(self.faculty2.id), start_time='09:30')])
+        self.assertEqual(resp.status_code, 400)
+        first, second = resp.json()['rows']
+        self.assertEqual(first['errors']['conflicts'], {'room': ['row 1']})
+        self.assertEqual(second['errors']['conflicts'], {'room': ['row 0']})
+        self.assertEqual(TimetableEntry.objects.count(), 0)
+
+    def test_rows_clashing_with_existing_entries_are_rejected(self):
+        entry = self.entry()
+        resp = self.post([self.row(room=str(self.room2.id), section='B'), self.row(day_of_week=1)])
+        self.assertEqual(resp.status_code, 201)
+        rows = resp.json()['rows']
+        self.assertEqual(rows[0]['errors']['conflicts'], {'faculty': [str(entry.id)]})
+        self.assertEqual(rows[1]['status'], 'created')
+        self.assertEqual(TimetableEntry.objects.count(), 2)
+
+    def test_all_or_nothing_writes_nothing_when_a_row_fails(self):
+        resp = self.post([self.row(), self.row(day_of_week=1, room='not-a-uuid')], query='?all_or_nothing=1')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()['created'], 0)
+        self.assertEqual([row['status'] for row in resp.json()['rows']], ['skipped', 'error'])
+        self.assertEqual(TimetableEntry.objects.count(), 0)
+
+    def test_csv_saved_with_a_byte_order_mark(self):
+        row = self.row()
+        body = '\ufeff' + ','.join(row) + '\r\n' + ','.join(str(value) for value in row.values()) + '\r\n'
+        resp = self.client_for(self.department).post(
+            '/api/v1/entries/bulk/', body.encode('utf-8'), content_type='text/csv',
+        )
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(TimetableEntry.objects.count(), 1)
+
+
+class EntryListTests(DepartmentFixture, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Five entries at the same day and time: only the id orders them.
+        self.entries = []
+        for n in range(5):
+            room = Room.objects.create(department=self.department, name=f'S{n}', capacity=60, type='Lecture')
+            faculty = Faculty.objects.create(department=self.department, name=f'F{n}', email=f'f{n}@example.com')
+            self.entries.append(self.entry(room=room, faculty=faculty, section=str(n)))
+        self.client = self.client_for(self.department)
+
+    def test_cursor_pages_through_equal_keys_once(self):
+        seen, url = [], '/api/v1/entries/?page_size=2'
+        while url:
+            body = self.client.get(url).json()
+            seen += [row['id'] for row in body['results']]
+            url = body['next']
+        self.assertEqual(seen, sorted(str(entry.id) for entry in self.entries))
+
+    def test_fields_narrow_the_rows(self):
+        body = self.client.get('/api/v1/entries/?fields=id,section').json()
+        self.assertEqual({tuple(sorted(row)) for row in body['results']}, {('id', 'section')})
+
+    def test_unknown_fields_are_rejected(self):
+        resp = self.client.get('/api/v1/entries/?fields=id,password')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {'fields': ['Unknown field: password']})
+        self.assertEqual(self.client.get('/api/v1/entries/export/?fields=nope').status_code, 400)
+
+    def test_export_is_one_json_array(self):
+        with mock.patch.object(TimetableEntryViewSet, 'export_chunk_size', 2):
+            resp = self.client.get('/api/v1/entries/export/?fields=id')
+            rows = json.loads(b''.join(resp.streaming_content))
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(str(entry.id) for entry in self.entries))
+
+        empty = self.client_for(Department.objects.create(name='Maths', code='MA')).get('/api/v1/entries/export/')
+        self.assertEqual(json.loads(b''.join(empty.streaming_content)), [])
+
+
+class CompactListTests(DepartmentFixture, TestCase):
+    def test_compact_list_lists_each_related_row_once(self):
+        first = self.entry()
+        second = self.entry(day_of_week=1)
+        third = self.entry(day_of_week=2, room=self.room2, faculty=self.faculty2)
+
+        client = self.client_for(self.department)
+        # Four data_version() aggregates for the cache key, then one joined query.
+        with self.assertNumQueries(5):
+            body = client.get('/api/v1/entries/?format=compact').json()
+        results = body['results']
+        self.assertEqual(set(results), {'faculty', 'subjects', 'rooms', 'entries'})
+        self.assertEqual([row['id'] for row in results['faculty']], [str(self.faculty.id), str(self.faculty2.id)])
+        self.assertEqual([row['id'] for row in results['subjects']], [str(self.subject.id)])
+        self.assertEqual([row['id'] for row in results['rooms']], [str(self.room.id), str(self.room2.id)])
+        self.assertEqual([row['id'] for row in results['entries']], [str(e.id) for e in (first, second, third)])
+        self.assertEqual(results['entries'][2]['room'], str(self.room2.id))
+        self.assertNotIn('room_details', results['entries'][0])
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        client = self.client_for(self.department)
+        for day in range(6):
+            self.entry(day_of_week=day)
+        with self.assertNumQueries(5):
+            client.get('/api/v1/entries/')
+        with self.assertNumQueries(5):
+            client.get('/api/v1/entries/?format=compact&page_size=3')
+
+
+class SlotOccupancyTests(DepartmentFixture, TestCase):
+    def test_a_double_booking_is_rejected_with_the_clashing_entry(self):
+        first = self.entry(end_time=time(11))
+        with self.assertRaises(SlotConflict) as caught:
+            self.entry(start_time=time(10), end_time=time(12), section='B', faculty=self.faculty2)
+        self.assertEqual(caught.exception.conflicts, {'room': [first.id]})
+        self.assertEqual(TimetableEntry.objects.count(), 1)
+        self.assertEqual(SlotOccupancy.objects.exclude(entry=first).count(), 0)
+
+        with self.assertRaises(SlotConflict) as caught:
+            self.entry(room=self.room2, section='B')
+        self.assertEqual(caught.exception.conflicts, {'faculty': [first.id]})
+
+    def test_moving_an_entry_frees_its_old_slots(self):
+        moved = self.entry()
+        moved.start_time, moved.end_time = time(11), time(12)
+        moved.save()
+        slots = set(moved.occupancy_rows.values_list('slot', flat=True))
+        self.assertEqual(slots, set(range(moved.start_slot, moved.end_slot)))
+        self.entry(section='B')
+        self.assertEqual(TimetableEntry.objects.count(), 2)
+
+    def test_a_clashing_bulk_create_writes_nothing(self):
+        entries = [
+            TimetableEntry(
+                department=self.department, day_of_week=0, start_time=time(9), end_time=time(10),
+                faculty=faculty, subject=self.subject, room=self.room, semester=1, section=section,
+                academic_year=2026,
+            )
+            for faculty, section in ((self.faculty, 'A'), (self.faculty2, 'B'))
+        ]
+        with self.assertRaises(SlotConflict):
+            TimetableEntry.objects.bulk_create(entries)
+        self.assertEqual((TimetableEntry.objects.count(), SlotOccupancy.objects.count()), (0, 0))
+
+    def test_deleting_an_entry_frees_its_slots(self):
+        self.entry().delete()
+        self.assertEqual(SlotOccupancy.objects.count(), 0)
+        self.entry(section='B')
+
+    def test_academic_years_do_not_clash(self):
+        self.entry()
+        self.entry(academic_year=2027)
+        self.assertEqual(TimetableEntry.objects.count(), 2)
+
+
+class GridTests(DepartmentFixture, TestCase):
+    # .update() and bulk_create() send no signals, like a write made by
+    # another process would look to this one.
+
+    def test_grid_sees_entries_written_elsewhere(self):
+        entry = self.entry()
+        room_grid = grids.room_scope(self.department.id, 2026, self.room.id)
+        self.assertEqual(len(grids.get_grid(room_grid)['cells'][0][0]), 1)
+
+        TimetableEntry.objects.filter(id=entry.id).update(room=self.room2, updated_at=timezone.now())
+        self.assertEqual(grids.get_grid(room_grid)['cells'][0], [])
+
+        TimetableEntry.objects.bulk_create([TimetableEntry(
+            department=self.department, day_of_week=1, start_time=time(9), end_time=time(10),
+            faculty=self.faculty, subject=self.subject, room=self.room, semester=1, section='A',
+            academic_year=2026,
+        )])
+        self.assertEqual(len(grids.get_grid(room_grid)['cells'][1][0]), 1)
+
+    def test_grid_sees_catalog_renames_made_elsewhere(self):
+        self.entry()
+        scope = grids.section_scope(self.department.id, 2026, 1, 'A')
+        self.assertEqual(grids.get_grid(scope)['subjects'][0][2], 'Algorithms')
+        Subject.objects.filter(id=self.subject.id).update(name='Data Structures', updated_at=timezone.now())
+        self.assertEqual(grids.get_grid(scope)['subjects'][0][2], 'Data Structures')
+
+    def test_unchanged_grid_is_served_from_the_cache(self):
+        self.entry()
+        scope = grids.section_scope(self.department.id, 2026, 1, 'A')
+        grids.get_grid(scope)
+        with mock.patch.object(grids, 'build_grid') as build:
+            grids.get_grid(scope)
+        build.assert_not_called()
+
+
+class ResponseCacheTests(DepartmentFixture, TestCase):
+    def test_unchanged_list_is_not_modified(self):
+        self.entry()
+        client = self.client_for(self.department)
+        first = client.get('/api/v1/entries/')
+        self.assertEqual(first.status_code, 200)
+        again = client.get('/api/v1/entries/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((again.status_code, again['ETag']), (304, first['ETag']))
+
+    def test_writes_made_elsewhere_are_served_at_once(self):
+        entry = self.entry()
+        client = self.client_for(self.department)
+        first = client.get('/api/v1/entries/')
+        # No signal fires, as for a write made by another process.
+        TimetableEntry.objects.filter(id=entry.id).update(section='B', updated_at=timezone.now())
+
+        resp = client.get('/api/v1/entries/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], first['ETag'])
+        self.assertEqual(resp.json()['results'][0]['section'], 'B')
+
+        Faculty.objects.filter(id=self.faculty.id).update(name='Grace', updated_at=timezone.now())
+        self.assertNotEqual(client.get('/api/v1/entries/')['ETag'], resp['ETag'])
+
+
+class ConflictAuditTests(DepartmentFixture, TestCase):
+    def setUp(self):
+        super().setUp()
+        faculty3 = Faculty.objects.create(department=self.department, name='Grace', email='grace@example.com')
+        self.a = self.entry()
+        self.b = self.entry(day_of_week=1, faculty=faculty3, section='B')
+        self.c = self.entry(day_of_week=2, room=self.room2, faculty=self.faculty2)
+        self.entry(academic_year=2027)
+        # .update() skips SlotOccupancy, like rows written by older code.
+        TimetableEntry.objects.filter(id=self.b.id).update(day_of_week=0, start_time=time(9, 30), end_time=time(10, 30))
+        TimetableEntry.objects.filter(id=self.c.id).update(day_of_week=0)
+
+    def expected(self):
+        return {
+            ('room', str(self.room.id), '09:00', '10:30', tuple(sorted([str(self.a.id), str(self.b.id)]))),
+            ('section', (1, 'A'), '09:00', '10:00', tuple(sorted([str(self.a.id), str(self.c.id)]))),
+        }
+
+    def groups(self, findings):
+        return {
+            (
+                g['kind'],
+                (g['resource']['semester'], g['resource']['section']) if g['kind'] == 'section' else g['resource'],
+                g['start_time'], g['end_time'], tuple(sorted(g['entries'])),
+            )
+            for g in findings
+        }
+
+    def test_report_lists_each_overlap_group(self):
+        body = self.client_for(self.department).get('/api/v1/audit/conflicts/?academic_year=2026').json()
+        self.assertEqual(self.groups(body['groups']), self.expected())
+        summary = body['summary']
+        self.assertEqual(summary['groups'], {'room': 1, 'faculty': 0, 'section': 1})
+        self.assertEqual((summary['entries'], summary['entries_in_conflict']), (3, 3))
+
+    def test_streamed_report_is_ndjson_ending_in_the_summary(self):
+        resp = self.client_for(self.department).get('/api/v1/audit/conflicts/?academic_year=2026&stream=1')
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        body = b''.join(resp.streaming_content).decode()
+        self.assertTrue(body.endswith('\n'))
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(self.groups(lines[:-1]), self.expected())
+        self.assertEqual(lines[-1]['summary']['entries_in_conflict'], 3)
+
+    def test_command_reports_and_fails_on_conflicts(self):
+        out = io.StringIO()
+        call_command('audit_conflicts', '--department', 'CS', '--academic-year', '2026', '--ndjson', stdout=out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(self.groups(lines[:-1]), self.expected())
+        self.assertEqual(lines[-1]['summary']['groups']['room'], 1)
+
+        with self.assertRaises(CommandError):
+            call_command('audit_conflicts', '--fail-on-conflict', stdout=io.StringIO())
+
+
+class RepairTests(DepartmentFixture, TestCase):
+    def test_moved_entry_leaves_the_old_room_grid(self):
+        entry = self.entry()
+        old_room = grids.room_scope(self.department.id, 2026, self.room.id)
+        self.assertEqual(grids.get_grid(old_room)['cells'][0], [[[str(entry.id), 0, 0, 0, 0]]])
+
+        proposal = propose_repair(self.department.id, {'academic_year': 2026, 'room': str(self.room.id)})
+        self.assertEqual(proposal['changes'][0]['after']['room'], str(self.room2.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(apply_repair(self.department.id, proposal), 1)
+
+        self.assertEqual(grids.get_grid(old_room)['cells'][0], [])
+        new_room = grids.room_scope(self.department.id, 2026, self.room2.id)
+        self.assertEqual(grids.get_grid(new_room)['cells'][0], [[[str(entry.id), 0, 0, 0, 0]]])
+
+
+class DatabaseBrokerTests(DepartmentFixture, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = DatabaseBroker()
+        self.broker.poll()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, department_id):
+        async def subscribe():
+            return self.broker.subscribe(department_id)
+        # Poll by hand instead of from the background thread.
+        with mock.patch.object(DatabaseBroker, '_run'):
+            return self.loop.run_until_complete(subscribe())
+
+    def test_polled_events_reach_the_department_subscribers(self):
+        sub = self.subscribe(self.department.id)
+        other = self.subscribe(Department.objects.create(name='Maths', code='MA').id)
+        event = self.broker.publish(self.department.id, {'op': 'deleted', 'entries': [{'id': 'x'}]})
+
+        self.assertEqual(self.broker.poll(), 1)
+        self.assertEqual(self.loop.run_until_complete(sub.get(1)), event)
+        self.assertIsNone(self.loop.run_until_complete(other.get(0.01)))
+        self.assertEqual(self.broker.poll(), 0)
+
+    def test_replay_reads_the_table(self):
+        first = self.broker.publish(self.department.id, {'op': 'deleted', 'entries': [{'id': 'x'}]})
+        second = self.broker.publish(self.department.id, {'op': 'deleted', 'entries': [{'id': 'y'}]})
+
+        self.assertEqual(self.broker.replay(self.department.id, first['id'] - 1), [first, second])
+        self.assertEqual(self.broker.replay(self.department.id, first['id']), [second])
+        # Older events were pruned (or never existed): the client must resync.
+        self.assertIsNone(self.broker.replay(self.department.id, first['id'] - 2))
+
+    def test_rows_committed_out_of_id_order_are_delivered(self):
+        sub = self.subscribe(self.department.id)
+        first, late, last = (
+            self.broker.publish(self.department.id, {'op': 'deleted', 'entries': [{'id': name}]})
+            for name in 'xyz'
+        )
+        # `late` got its id before `last` but commits after it.
+        row = FeedEvent.objects.get(id=late['id'])
+        FeedEvent.objects.filter(id=row.id).delete()
+        self.assertEqual(self.broker.poll(), 2)
+        row.save(force_insert=True)
+        self.assertEqual(self.broker.poll(), 1)
+        self.assertEqual(self.broker.poll(), 0)
+        delivered = [self.loop.run_until_complete(sub.get(1)) for _ in range(3)]
+        self.assertEqual(delivered, [first, last, late])
+
+    def test_gaps_that_never_fill_are_forgotten(self):
+        self.broker.gap_timeout = -1
+        events = [self.broker.publish(self.department.id, {'op': 'deleted', 'entries': []}) for _ in range(2)]
+        FeedEvent.objects.filter(id=events[0]['id']).delete()
+        self.assertEqual(self.broker.poll(), 1)
+        self.broker.poll()
+        self.assertEqual(self.broker._gaps, {})
+
+    def test_a_subscriber_arriving_during_the_idle_check_wakes_the_poller(self):
+        broker, polled = DatabaseBroker(), threading.Event()
+        lock = broker._lock
+
+        class SubscribeAfterCheck:
+            # Registers a subscriber right after the poller found none.
+            def __enter__(self):
+                lock.acquire()
+
+            def __exit__(self, *exc):
+                lock.release()
+                if not broker._subscribers:
+                    broker._subscribers['x'] = {object()}
+                    broker._wake.set()
+
+        def poll():
+            polled.set()
+            raise SystemExit
+
+        broker._lock = SubscribeAfterCheck()
+        with mock.patch.object(broker, 'poll', poll), mock.patch('timetable.feed.close_old_connections'):
+            threading.Thread(target=broker._run, daemon=True).start()
+            self.assertTrue(polled.wait(2))
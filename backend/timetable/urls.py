@@ -1,6 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FacultyViewSet, RoomViewSet, SubjectViewSet, TimetableEntryViewSet
+from .views import (
+    FacultyViewSet, RoomViewSet, SubjectViewSet, TimetableEntryViewSet,
+    BulkTimetableEntryImportView, GenerateTimetableView, GridView, ChangeFeedView,
+    AvailabilityView, RepairTimetableView, GenerateInstitutionView, ExportView,
+    ConflictAuditView,
+)
 
 router = DefaultRouter()
 router.register(r'faculty', FacultyViewSet)
@@ -9,5 +14,20 @@ router.register(r'subjects', SubjectViewSet)
 router.register(r'entries', TimetableEntryViewSet)
 
 urlpatterns = [
+    path('entries/bulk/', BulkTimetableEntryImportView.as_view(), name='entries-bulk'),
+    path('generate/institution/', GenerateInstitutionView.as_view(), name='generate-institution'),
+    path('repair/', RepairTimetableView.as_view(), name='repair-timetable'),
+    path('generate/', GenerateTimetableView.as_view(), name='generate-timetable'),
+    path('grids/section/', GridView.as_view(kind='section'), name='grid-section'),
+    path('grids/room/<uuid:resource_id>/', GridView.as_view(kind='room'), name='grid-room'),
+    path('grids/faculty/<uuid:resource_id>/', GridView.as_view(kind='faculty'), name='grid-faculty'),
+    path('exports/section/<str:fmt>/', ExportView.as_view(kind='section'), name='export-section'),
+    path('exports/room/<uuid:resource_id>/<str:fmt>/', ExportView.as_view(kind='room'), name='export-room'),
+    path('exports/faculty/<uuid:resource_id>/<str:fmt>/', ExportView.as_view(kind='faculty'), name='export-faculty'),
+    path('exports/department/<str:fmt>/', ExportView.as_view(kind='department'), name='export-department'),
+    path('availability/rooms/', AvailabilityView.as_view(kind='rooms'), name='availability-rooms'),
+    path('availability/faculty/', AvailabilityView.as_view(kind='faculty'), name='availability-faculty'),
+    path('feed/', ChangeFeedView.as_view(), name='change-feed'),
+    path('audit/conflicts/', ConflictAuditView.as_view(), name='conflict-audit'),
     path('', include(router.urls)),
 ]
@@ -1,13 +1,74 @@
-from rest_framework import viewsets, permissions
-from .models import Faculty, Room, Subject, TimetableEntry
-from .serializers import FacultySerializer, RoomSerializer, SubjectSerializer, TimetableEntrySerializer
+import hashlib
+import json
+import os
 
-class DepartmentScopedViewSet(viewsets.ModelViewSet):
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import viewsets, permissions, views, status, response, serializers, exceptions
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from .models import Faculty, Room, Subject, TimetableEntry, SlotConflict
+from .serializers import (
+    FacultySerializer, RoomSerializer, SubjectSerializer, TimetableEntrySerializer,
+    compact_entries_payload,
+)
+from .renderers import CompactJSONRenderer
+from .pagination import KeysetPagination
+from .response_cache import CachedResponseMixin, etag_matches, not_modified
+from . import feed, grids
+from .audit import Audit
+from .availability import availability_index, clock_minutes
+from .exports import (
+    FORMATS, ExportError, cached_department_export, document_for, export_document, get_export_cache, iter_csv,
+)
+from .repair import RepairError, apply_repair, propose_repair
+from .institution import InstitutionRun
+from .bulk import CSVParser, extract_rows, import_entries
+from .generator import GenerationError, build_problem
+from jobs.queue import flag, submit
+from jobs.views import job_status_response
+from core import db_router
+from core.authentication import ClerkAuthentication
+from core.streaming import for_server
+
+class DepartmentScopedViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """
     Base ViewSet that filters querysets by the user's department
     and assigns the department on create.
+
+    list/retrieve responses are cached per department and carry strong ETags
+    (see response_cache).
+
+    Lists are keyset-paginated on `cursor_ordering`. ?fields=a,b narrows both
+    the serialized fields and the SQL SELECT, and export/ streams every row
+    as a single JSON array without holding the queryset in memory.
+
+    `replica_actions` read from a replica when one is configured, unless the
+    department wrote recently (see core.db_router); everything else,
+    including the conflict checks on create/update, uses the primary.
     """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('pk',)
+    export_chunk_size = 1000
+    replica_actions = ('list', 'retrieve', 'export')
+
+    def dispatch(self, request, *args, **kwargs):
+        # The action is known from the route before DRF wraps the request.
+        if self.action_map.get(request.method.lower()) in self.replica_actions:
+            with db_router.replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Only now is the user, and so the department, known.
+        if db_router.recently_written(getattr(request.user, 'department_id', None)):
+            db_router.primary_reads()
 
     def get_queryset(self):
         user = self.request.user
@@ -19,7 +80,7 @@ class DepartmentScopedViewSet(viewsets.ModelViewSet):
         department_id = getattr(user, 'department_id', None)
         
         if department_id:
-            return self.queryset.filter(department_id=department_id)
+            return self.project(self.queryset.filter(department_id=department_id))
         return self.queryset.none()
 
     def perform_create(self, serializer):
@@ -32,18 +93,567 @@ class DepartmentScopedViewSet(viewsets.ModelViewSet):
             # For development without auth/middleware working yet, we might need a workaround
             pass
 
+    def get_requested_fields(self):
+        """Field names from ?fields= on read actions, or None for all fields."""
+        if self.action not in ('list', 'retrieve', 'export'):
+            return None
+        raw = self.request.query_params.get('fields')
+        if not raw:
+            return None
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.get_serializer_class()().fields]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def project(self, queryset):
+        """Restrict the SELECT (and joins) to what the requested fields need."""
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset
+
+        model = queryset.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        pk_name = model._meta.pk.name
+        columns = {pk_name} | {pk_name if f == 'pk' else f for f in self.cursor_ordering}
+        related = set()
+        serializer_fields = self.get_serializer_class()().fields
+        for name in fields:
+            field = serializer_fields.get(name)
+            if field is None or field.source == '*':
+                continue
+            source = field.source.split('.')[0]
+            if isinstance(field, serializers.BaseSerializer):
+                related.add(source)
+            elif source in concrete:
+                columns.add(source)
+
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*(columns | related))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*self.cursor_ordering)
+        # Rows are read after dispatch() returns; keep the database picked now.
+        queryset = queryset.using(queryset.db)
+        resp = StreamingHttpResponse(self._stream_json(queryset), content_type='application/json')
+        resp['Content-Disposition'] = f'attachment; filename="{self.basename}.json"'
+        return for_server(request, resp)
+
+    def _stream_json(self, queryset):
+        encoder = JSONEncoder()
+        batch = []
+        first = True
+        yield '['
+        for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+            batch.append(obj)
+            if len(batch) == self.export_chunk_size:
+                yield self._encode_batch(encoder, batch, first)
+                batch, first = [], False
+        if batch:
+            yield self._encode_batch(encoder, batch, first)
+        yield ']'
+
+    def _encode_batch(self, encoder, batch, first):
+        rows = ','.join(encoder.encode(item) for item in self.get_serializer(batch, many=True).data)
+        return rows if first else ',' + rows
+
 class FacultyViewSet(DepartmentScopedViewSet):
     queryset = Faculty.objects.all()
     serializer_class = FacultySerializer
+    cursor_ordering = ('name', 'id')
 
 class RoomViewSet(DepartmentScopedViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    cursor_ordering = ('name', 'id')
 
 class SubjectViewSet(DepartmentScopedViewSet):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    cursor_ordering = ('code', 'id')
 
 class TimetableEntryViewSet(DepartmentScopedViewSet):
-    queryset = TimetableEntry.objects.all()
+    """
+    Timetable entries with their faculty, subject and room joined in.
+
+    ?format=compact returns each faculty/subject/room once in lookup tables
+    and has entries reference them by id.
+    """
+    queryset = TimetableEntry.objects.select_related('faculty', 'subject', 'room')
     serializer_class = TimetableEntrySerializer
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [CompactJSONRenderer]
+    # Matches the (department, day_of_week) index.
+    cursor_ordering = ('day_of_week', 'start_time', 'id')
+
+    def get_requested_fields(self):
+        # The compact payload always needs the joined rows.
+        if getattr(self.request, 'accepted_renderer', None) and \
+                self.request.accepted_renderer.format == CompactJSONRenderer.format:
+            return None
+        return super().get_requested_fields()
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != CompactJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.compact_list, request, *args, **kwargs)
+
+    def compact_list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = compact_entries_payload(page if page is not None else list(queryset))
+        if page is not None:
+            return self.get_paginated_response(data)
+        return response.Response(data)
+
+
+class BulkTimetableEntryImportView(views.APIView):
+    """
+    Import many timetable entries in one request.
+
+    Accepts a JSON list (or {"entries": [...]}), a text/csv body, or a CSV
+    file upload in the 'file' field. Query params:
+      dry_run=1         validate and report without writing
+      all_or_nothing=1  write nothing if any row fails
+      async=1           queue a background job and return 202
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser, CSVParser, MultiPartParser, FormParser]
+
+    def post(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            rows = extract_rows(request)
+            if _flag(request, 'async'):
+                job = submit('timetable.bulk_import', {
+                    'rows': rows,
+                    'dry_run': _flag(request, 'dry_run'),
+                    'all_or_nothing': _flag(request, 'all_or_nothing'),
+                }, department_id=department_id, user=request.user)
+                return job_status_response(request, job)
+            report = import_entries(
+                department_id,
+                rows,
+                dry_run=_flag(request, 'dry_run'),
+                all_or_nothing=_flag(request, 'all_or_nothing'),
+            )
+        except ValueError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['failed'] and not report['created']:
+            code = status.HTTP_400_BAD_REQUEST
+        elif report['created']:
+            code = status.HTTP_201_CREATED
+        else:
+            code = status.HTTP_200_OK
+        return response.Response(report, status=code)
+
+
+class GenerateTimetableView(views.APIView):
+    """
+    Generate a conflict-free weekly timetable for some sections.
+
+    The body is checked here (400 if malformed) and the solve is queued as a
+    background job: the response is the job's 202 status, and its result is
+    the solution. Rooms, faculty and sections already booked elsewhere in
+    the academic year are treated as fixed. With "commit": true a fully
+    placed solution replaces the sections' existing entries.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            build_problem(department_id, request.data)
+        except GenerationError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = dict(request.data, commit=_flag(request, 'commit'))
+        job = submit('timetable.generate', params, department_id=department_id, user=request.user)
+        return job_status_response(request, job)
+
+
+class IsInstitutionAdmin(permissions.BasePermission):
+    """
+    Operations spanning departments: Django staff users, or Clerk users whose
+    public_metadata.role is one of TIMETABLE_INSTITUTION_ROLES. Clerk users
+    are never staff unless flagged so in the Django admin.
+    """
+    message = 'Institution administrators only.'
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        roles = getattr(settings, 'TIMETABLE_INSTITUTION_ROLES', ['admin'])
+        return user.is_staff or getattr(user, 'clerk_role', '') in roles
+
+
+class GenerateInstitutionView(views.APIView):
+    """
+    Generate timetables for several departments at once (IsInstitutionAdmin).
+
+    Departments are solved in parallel; rooms and faculty listed in
+    shared_rooms/shared_faculty are split between them and reconciled
+    (see timetable.institution). The body is checked here (400 if
+    malformed) and the solve is queued as a background job, answered with
+    its 202 status. "commit": true saves every department together, and
+    only if every lesson was placed.
+    """
+    permission_classes = [IsInstitutionAdmin]
+
+    def post(self, request):
+        try:
+            InstitutionRun(request.data)
+        except GenerationError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Spans departments, so it belongs to its submitter rather than to one of them.
+        job = submit(
+            'timetable.generate_institution', dict(request.data, commit=_flag(request, 'commit')),
+            user=request.user,
+        )
+        return job_status_response(request, job)
+
+
+class RepairTimetableView(views.APIView):
+    """
+    Re-place only the entries hit by a room or faculty member becoming unavailable.
+
+    Body: {"academic_year": 2026, "room": id} or {"faculty": id, "substitutes": [ids]},
+    optionally narrowed with "days" and "start_time"/"end_time". Returns the
+    proposed moves; with "commit": true a fully resolved proposal is saved.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            proposal = propose_repair(department_id, request.data)
+        except RepairError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not _flag(request, 'commit'):
+            return response.Response(proposal)
+
+        if proposal['unresolved']:
+            proposal['error'] = 'Some entries could not be re-placed; nothing was saved.'
+            return response.Response(proposal, status=status.HTTP_409_CONFLICT)
+
+        try:
+            proposal['updated'] = apply_repair(department_id, proposal)
+        except SlotConflict:
+            proposal['error'] = 'The timetable changed while repairing; nothing was saved. Try again.'
+            return response.Response(proposal, status=status.HTTP_409_CONFLICT)
+        return response.Response(proposal)
+
+
+class GridView(views.APIView):
+    """
+    Weekly timetable grid (day x period) served from the precomputed grid store.
+
+    GET grids/section/?academic_year=&semester=&section=
+    GET grids/room/<room_id>/?academic_year=
+    GET grids/faculty/<faculty_id>/?academic_year=
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    kind = None
+
+    def get(self, request, resource_id=None):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        params = request.query_params
+        try:
+            academic_year = int(params['academic_year'])
+            if self.kind == 'section':
+                scope = grids.section_scope(department_id, academic_year, int(params['semester']), params['section'])
+            elif self.kind == 'room':
+                scope = grids.room_scope(department_id, academic_year, resource_id)
+            else:
+                scope = grids.faculty_scope(department_id, academic_year, resource_id)
+        except (KeyError, ValueError):
+            required = 'academic_year, semester and section' if self.kind == 'section' else 'academic_year'
+            return response.Response(
+                {'error': f'{required} query parameters are required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return response.Response(grids.get_grid(scope))
+
+
+class ConflictAuditView(views.APIView):
+    """
+    Every room, faculty and section double booking in the department.
+
+    GET audit/conflicts/?academic_year=&stream=1
+
+    With stream=1 the report is NDJSON: one line per overlap group as it is
+    found, then a {"summary": ...} line.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            academic_year = request.query_params.get('academic_year')
+            academic_year = int(academic_year) if academic_year else None
+        except ValueError:
+            return response.Response(
+                {'error': 'academic_year must be a number.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        audit = Audit(department_id, academic_year)
+        if _flag(request, 'stream'):
+            resp = StreamingHttpResponse(self._ndjson(audit), content_type='application/x-ndjson')
+            return for_server(request, resp)
+        groups = list(audit)
+        return response.Response({'summary': audit.summary, 'groups': groups})
+
+    def _ndjson(self, audit):
+        for finding in audit:
+            yield json.dumps(finding) + '\n'
+        yield json.dumps({'summary': audit.summary}) + '\n'
+
+
+class ExportView(views.APIView):
+    """
+    Download a timetable as CSV, XLSX or PDF (see timetable.exports).
+
+    GET exports/section/<fmt>/?academic_year=&semester=&section=
+    GET exports/room/<room_id>/<fmt>/?academic_year=
+    GET exports/faculty/<faculty_id>/<fmt>/?academic_year=
+    GET exports/department/<fmt>/?academic_year=
+        every section, room and faculty timetable of the year in one zip,
+        served if already rendered for the current data; otherwise it is
+        rendered in a job (202) whose result links back here.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    kind = None
+
+    def get(self, request, fmt, resource_id=None):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if fmt not in FORMATS:
+            return response.Response(
+                {'error': f"Unknown format; use one of {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        params = request.query_params
+        try:
+            academic_year = int(params['academic_year'])
+            if self.kind == 'section':
+                semester, section = int(params['semester']), params['section']
+        except (KeyError, ValueError):
+            required = 'academic_year, semester and section' if self.kind == 'section' else 'academic_year'
+            return response.Response(
+                {'error': f'{required} query parameters are required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            if self.kind == 'department':
+                path = cached_department_export(department_id, academic_year, fmt)
+                if path:
+                    return self._file(request, path, f'timetables-{academic_year}-{fmt}.zip', 'application/zip')
+                job = submit(
+                    'timetable.export', {'format': fmt, 'academic_year': academic_year},
+                    department_id=department_id, user=request.user,
+                )
+                return job_status_response(request, job)
+
+            if self.kind == 'section':
+                document = document_for(department_id, 'section', academic_year, semester=semester, section=section)
+            else:
+                document = document_for(department_id, self.kind, academic_year, resource_id=resource_id)
+            content_type, extension = FORMATS[fmt]
+            filename = f'{document.name}.{extension}'
+            if fmt == 'csv' and get_export_cache() is None:
+                resp = StreamingHttpResponse(iter_csv(document.rows), content_type='text/csv; charset=utf-8')
+                resp['Content-Disposition'] = f'attachment; filename="{filename}"'
+                return for_server(request, resp)
+            return self._file(request, export_document(document, fmt, department_id), filename, content_type)
+        except ExportError as e:
+            return response.Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def _file(self, request, path, filename, content_type):
+        if get_export_cache() is None:
+            # A one-off render: unlink it now, the open handle keeps it readable.
+            resp = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+            os.remove(path)
+            return for_server(request, resp)
+        # Cached paths embed the department version, so they make a strong ETag.
+        etag = '"%s"' % hashlib.sha1(path.encode('utf-8')).hexdigest()
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        resp = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+        resp['ETag'] = etag
+        return for_server(request, resp)
+
+
+class AvailabilityView(views.APIView):
+    """
+    Free rooms or faculty for a time window, from the in-memory availability index.
+
+    GET availability/rooms/?academic_year=&day=2&start_time=10:00&end_time=12:00
+        [&type=Lab][&min_capacity=60][&limit=]
+    GET availability/faculty/?academic_year=&days=0,2&start_time=&end_time=
+        [&designation=][&limit=]
+
+    Rooms come best fit first (smallest sufficient capacity); faculty come
+    least booked on those days first.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    kind = None
+
+    def get(self, request):
+        department_id = getattr(request.user, 'department_id', None)
+        if not department_id:
+            return response.Response(
+                {'error': 'User has no department assigned.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        params = request.query_params
+        try:
+            academic_year = int(params['academic_year'])
+            days = [int(day) for day in (params.get('days') or params['day']).split(',')]
+            start_time, end_time = params['start_time'], params['end_time']
+            if not all(0 <= day <= 6 for day in days) or clock_minutes(start_time) >= clock_minutes(end_time):
+                raise ValueError
+            limit = int(params['limit']) if params.get('limit') else None
+            min_capacity = int(params['min_capacity']) if params.get('min_capacity') else None
+        except (KeyError, IndexError, ValueError, TypeError):
+            return response.Response(
+                {'error': 'academic_year, day (or days), start_time and end_time (HH:MM from 00:00 to 24:00, start before end) are required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if self.kind == 'rooms':
+            results = availability_index.free_rooms(
+                department_id, academic_year, days, start_time, end_time,
+                room_type=params.get('type'), min_capacity=min_capacity, limit=limit,
+            )
+        else:
+            results = availability_index.free_faculty(
+                department_id, academic_year, days, start_time, end_time,
+                designation=params.get('designation'), limit=limit,
+            )
+        return response.Response({'count': len(results), 'results': results})
+
+
+class ChangeFeedView(View):
+    """
+    Server-Sent Events stream of entry changes in the user's department
+    (see timetable.feed for the event format).
+
+    Browsers' EventSource can't set headers, so the session token may also be
+    passed as ?token=. Reconnecting clients send Last-Event-ID and get the
+    events they missed, or a resync event if those are gone. This is an async
+    view, served by the ASGI `events` process (see the Procfile).
+    """
+    heartbeat_seconds = 15
+
+    async def get(self, request):
+        header = request.headers.get('Authorization', '')
+        token = header.split(' ', 1)[1] if header.startswith('Bearer ') else request.GET.get('token')
+        if not token:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+        try:
+            user, _ = await sync_to_async(ClerkAuthentication().authenticate_credentials)(request, token)
+        except exceptions.AuthenticationFailed as e:
+            return JsonResponse({'error': str(e.detail)}, status=401)
+
+        department_id = getattr(user, 'department_id', None)
+        if not department_id:
+            return JsonResponse({'error': 'User has no department assigned.'}, status=403)
+
+        last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        resp = StreamingHttpResponse(self.stream(department_id, last_id), content_type='text/event-stream')
+        resp['Cache-Control'] = 'no-cache'
+        resp['X-Accel-Buffering'] = 'no'
+        return resp
+
+    async def stream(self, department_id, last_id):
+        broker = feed.get_broker()
+        # Subscribe before replaying so nothing published in between is lost.
+        sub = broker.subscribe(department_id)
+        try:
+            yield 'retry: 3000\n\n'
+            seen = 0
+            if last_id:
+                try:
+                    missed = await sync_to_async(broker.replay)(department_id, int(last_id))
+                except ValueError:
+                    missed = None
+                if missed is None:
+                    yield _sse({'op': 'resync'})
+                else:
+                    for event in missed:
+                        yield _sse(event)
+                        seen = event['id']
+            while True:
+                event = await sub.get(self.heartbeat_seconds)
+                if event is None:
+                    yield ': keepalive\n\n'
+                elif event.get('id', seen + 1) > seen:
+                    yield _sse(event)
+        finally:
+            broker.unsubscribe(sub)
+
+
+def _sse(event):
+    event = dict(event)
+    event_id = event.pop('id', None)
+    data = json.dumps(event, separators=(',', ':'))
+    if event_id is None:
+        return f'data: {data}\n\n'
+    return f'id: {event_id}\ndata: {data}\n\n'
+
+
+def _flag(request, name):
+    """A yes/no option from the query string, or failing that the request body."""
+    value = request.query_params.get(name)
+    if value is None and hasattr(request.data, 'get'):
+        value = request.data.get(name)
+    return flag(value)